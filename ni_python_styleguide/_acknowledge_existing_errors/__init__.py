@@ -1,10 +1,13 @@
+import contextlib
+import functools
 import logging
+import multiprocessing
 import pathlib
 import re
 import typing
 from collections import defaultdict
 
-from ni_python_styleguide import _format, _utils
+from ni_python_styleguide import _format, _lint, _utils
 
 _module_logger = logging.getLogger(__name__)
 
@@ -41,6 +44,10 @@ def _filter_suppresion_from_line(line: str):
         return line
 
 
+# some cases are expected to take up to 4 passes, making this 2x rounded
+_PER_FILE_FORMAT_ITERATION_LIMIT = 10
+
+
 def acknowledge_lint_errors(
     exclude,
     app_import_names,
@@ -48,94 +55,216 @@ def acknowledge_lint_errors(
     file_or_dir,
     *_,
     aggressive=False,
-):
+    session: typing.Optional[_lint.LintSession] = None,
+    jobs: typing.Union[int, str] = "auto",
+    respect_gitignore: bool = False,
+) -> typing.Dict[pathlib.Path, int]:
     """Adds a "noqa" comment for each of existing errors (unless excluded).
 
     Excluded error (reason):
     BLK100 - run black
+
+    Each file is acknowledged in memory (with `aggressive`, formatting and re-acknowledging until
+    that stops changing it) and written once. Returns the number of passes each file took.
+
+    `session` is the lint session to reuse, if the caller already has one.
+    `jobs` is the number of worker processes to lint and acknowledge files with (or "auto").
+    `respect_gitignore` skips files git ignores, if creating a session.
     """
-    lint_errors_to_process = _utils.lint.get_errors_to_process(
+    session = session or _lint.LintSession(
         exclude,
         app_import_names,
         extend_ignore,
+        jobs=jobs,
+        respect_gitignore=respect_gitignore,
+    )
+    lint_errors_to_process = session.get_errors_to_process(
         [pathlib.Path(file_or_dir_) for file_or_dir_ in file_or_dir or "."],
         excluded_errors=EXCLUDED_ERRORS,
     )
+    lint_errors_by_file = _errors_by_file(lint_errors_to_process)
+    bad_files = list(lint_errors_by_file)
+
+    passes_by_file = {}
+    errors_by_file = {}
+    with contextlib.ExitStack() as stack:
+        job_count = _utils.jobs.job_count(jobs, len(bad_files))
+        if job_count == 1:
+            results = [_acknowledge_files(session, lint_errors_by_file, aggressive=aggressive)]
+        else:
+            # suppressing errors in one file never affects another, so each worker acknowledges a
+            #  batch of files with its own session
+            pool = stack.enter_context(
+                multiprocessing.Pool(
+                    job_count, initializer=_initialize_worker, initargs=(session.session_args,)
+                )
+            )
+            batch_size = max(1, len(bad_files) // (job_count * 2))
+            batches = [
+                {
+                    bad_file: list(lint_errors_by_file[bad_file])  # not the whole collection
+                    for bad_file in bad_files[i : i + batch_size]
+                }
+                for i in range(0, len(bad_files), batch_size)
+            ]
+            results = pool.imap_unordered(
+                functools.partial(_acknowledge_files_in_worker, aggressive=aggressive), batches
+            )
+        for batch_passes_by_file, batch_errors_by_file in results:
+            passes_by_file.update(batch_passes_by_file)
+            errors_by_file.update(batch_errors_by_file)
+
+    for bad_file in bad_files:
+        _module_logger.debug("Acknowledged %s in %d pass(es)", bad_file, passes_by_file[bad_file])
+    if errors_by_file:
+        failed_files = [errors_by_file[file] for file in bad_files if file in errors_by_file]
+        raise RuntimeError("Could not handle some files:\n" + "\n\n".join(failed_files) + "\n\n\n")
+    return {bad_file: passes_by_file[bad_file] for bad_file in bad_files}
 
-    lint_errors_by_file = defaultdict(list)
-    for error in lint_errors_to_process:
-        lint_errors_by_file[pathlib.Path(error.file)].append(error)
-
-    failed_files = []
-    for bad_file, errors_in_file in lint_errors_by_file.items():
-        _suppress_errors_in_file(bad_file, errors_in_file, encoding=_utils.DEFAULT_ENCODING)
 
-        _handle_emergent_violations(exclude, app_import_names, extend_ignore, file_or_dir, bad_file)
+def _acknowledge_files(
+    session: _lint.LintSession,
+    lint_errors_by_file: typing.Mapping[pathlib.Path, typing.Sequence[_utils.lint.LintError]],
+    *_,
+    aggressive: bool,
+) -> typing.Tuple[typing.Dict[pathlib.Path, int], typing.Dict[pathlib.Path, str]]:
+    """Acknowledges the errors in each file, writing each file (once) if it changed.
 
+    Returns the number of passes each file took, and why each file which couldn't be handled failed.
+    """
+    with _utils.trace.span("acknowledge", files=len(lint_errors_by_file)):
+        sources = {bad_file: _format.read_source(bad_file) for bad_file in lint_errors_by_file}
+
+        # each phase handles every file, so each re-lint checks all of the files that need it at
+        #  once
+        texts = {
+            bad_file: _suppress_errors_in_source(sources[bad_file].text, errors_in_file)
+            for bad_file, errors_in_file in lint_errors_by_file.items()
+        }
+        texts, _ = _handle_emergent_violations(session, texts)
+        passes_by_file = dict.fromkeys(texts, 1)
+        errors_by_file = {}
         if aggressive:
-            # some cases are expected to take up to 4 passes, making this 2x rounded
-            per_file_format_iteration_limit = 10
-            for _ in range(per_file_format_iteration_limit):
-                # format the files - this may move the suppression off the correct lines
-                #  Note: due to Github pycodestyle#868, we have to format, change, format
-                #   (check if that time made changes)
-                # -  else we wind up with lambda's going un-suppressed
-                # and/or not re-formatted (to fail later)
-                _format.format(bad_file)
-
-                # re-apply suppressions on correct lines
-                remove_auto_suppressions_from_file(bad_file)
-                current_lint_errors = _utils.lint.get_errors_to_process(
-                    exclude=exclude,
-                    app_import_names=app_import_names,
-                    extend_ignore=extend_ignore,
-                    file_or_dir=[bad_file],
-                    excluded_errors=EXCLUDED_ERRORS,
-                )
+            errors_by_file = _acknowledge_until_formatted(session, texts, passes_by_file)
 
-                _suppress_errors_in_file(
-                    bad_file, current_lint_errors, encoding=_utils.DEFAULT_ENCODING
-                )
+    for bad_file, text in texts.items():
+        if text != sources[bad_file].text:
+            _format.write_source(bad_file, text, sources[bad_file])
+    return passes_by_file, errors_by_file
 
-                remaining_errors = _handle_emergent_violations(
-                    exclude=exclude,
-                    app_import_names=app_import_names,
-                    extend_ignore=extend_ignore,
-                    file_or_dir=file_or_dir,
-                    bad_file=bad_file,
-                )
 
-                changed = _format.format_check(bad_file)
-                if not changed and not remaining_errors:  # are we done?
-                    break
-            else:
-                failed_files.append(
-                    f"Could not handle suppressions/formatting of file {bad_file} after maximum number of tries ({per_file_format_iteration_limit})"
-                )
-                _module_logger.warning("Max tries reached on %s", bad_file)
-    if failed_files:
-        raise RuntimeError("Could not handle some files:\n" + "\n\n".join(failed_files) + "\n\n\n")
+_worker_session: typing.Optional[_lint.LintSession] = None
+
+
+def _initialize_worker(session_args):
+    global _worker_session
+    _worker_session = _lint.LintSession(*session_args)
 
 
-def _handle_emergent_violations(exclude, app_import_names, extend_ignore, file_or_dir, bad_file):
+def _acknowledge_files_in_worker(lint_errors_by_file, aggressive: bool):
+    return _acknowledge_files(_worker_session, lint_errors_by_file, aggressive=aggressive)
+
+
+def _errors_by_file(
+    lint_errors: _utils.lint.LintErrors,
+) -> typing.Dict[pathlib.Path, typing.Sequence[_utils.lint.LintError]]:
+    return {pathlib.Path(file): errors_in_file for file, errors_in_file in lint_errors.by_file()}
+
+
+def _acknowledge_until_formatted(
+    session: _lint.LintSession,
+    texts: typing.Dict[pathlib.Path, str],
+    passes_by_file: typing.Dict[pathlib.Path, int],
+) -> typing.Dict[pathlib.Path, str]:
+    """Formats and re-acknowledges `texts` (updating them in place) until they stop changing.
+
+    Each pass only re-lints the files which haven't settled yet, all at once.
+    Returns why each file which couldn't be handled failed.
+    """
+    # format the source - this may move the suppression off the correct lines
+    #  Note: due to Github pycodestyle#868, we have to format, change, format
+    #   (check if that time made changes)
+    # -  else we wind up with lambda's going un-suppressed
+    # and/or not re-formatted (to fail later)
+    results = {bad_file: _black(bad_file, text) for bad_file, text in texts.items()}
+    errors_by_file = {}
+    for passes in range(1, _PER_FILE_FORMAT_ITERATION_LIMIT + 1):
+        with _utils.trace.span("aggressive pass", number=passes, files=len(results)):
+            for bad_file, result in list(results.items()):
+                if result.error is not None:
+                    errors_by_file[bad_file] = f"Could not format file {bad_file}: {result.error}"
+                    del results[bad_file]
+            if not results:
+                return errors_by_file
+
+            # re-apply suppressions on correct lines
+            stripped = {
+                bad_file: remove_auto_suppressions(result.source)
+                for bad_file, result in results.items()
+            }
+            current_lint_errors = _errors_by_file(
+                session.get_source_errors_to_process(stripped, excluded_errors=EXCLUDED_ERRORS)
+            )
+            suppressed = {
+                bad_file: _suppress_errors_in_source(text, current_lint_errors.get(bad_file, ()))
+                for bad_file, text in stripped.items()
+            }
+            suppressed, remaining_errors = _handle_emergent_violations(session, suppressed)
+            texts.update(suppressed)
+
+            results = {}
+            for bad_file, text in suppressed.items():
+                passes_by_file[bad_file] = passes
+                result = _black(bad_file, text)
+                if result.changed or remaining_errors[bad_file]:  # not done yet
+                    results[bad_file] = result
+
+    for bad_file, result in results.items():
+        _module_logger.warning("Max tries reached on %s", bad_file)
+        texts[bad_file] = result.source
+        errors_by_file[bad_file] = (
+            f"Could not handle suppressions/formatting of file {bad_file} after maximum number of tries ({_PER_FILE_FORMAT_ITERATION_LIMIT})"
+        )
+    return errors_by_file
+
+
+def _black(bad_file: pathlib.Path, text: str) -> _format.BlackResult:
+    with _utils.trace.span("format", file=bad_file):
+        return _format.black_source(text, is_pyi=bad_file.suffix == ".pyi")
+
+
+def _handle_emergent_violations(
+    session: _lint.LintSession, texts: typing.Dict[pathlib.Path, str]
+) -> typing.Tuple[
+    typing.Dict[pathlib.Path, str],
+    typing.Dict[pathlib.Path, typing.Set[_utils.lint.LintError]],
+]:
     """Some errors can be created by adding the acknowledge comments handle those now.
 
+    All of `texts` (source keyed by file) are re-linted at once. Returns them with those errors
+    acknowledged, and the errors which remain in each file.
+
     Example emergent violations:
       W505 -> due to adding comment to docstring
     """
-    current_lint_errors = set(
-        _utils.lint.get_errors_to_process(
-            exclude=exclude,
-            app_import_names=app_import_names,
-            extend_ignore=extend_ignore,
-            file_or_dir=[bad_file],
-            excluded_errors=EXCLUDED_ERRORS,
+    with _utils.trace.span("handle emergent violations", files=len(texts)):
+        current_lint_errors = _errors_by_file(
+            session.get_source_errors_to_process(texts, excluded_errors=EXCLUDED_ERRORS)
         )
-    )
-    errors_to_process_now = set(filter(lambda o: o.code in {"W505"}, current_lint_errors))
-    _suppress_errors_in_file(bad_file, errors_to_process_now, encoding=_utils.DEFAULT_ENCODING)
-    remaining_errors = current_lint_errors - errors_to_process_now
-    return remaining_errors
+        handled_texts = {}
+        remaining_errors = {}
+        for bad_file, text in texts.items():
+            errors_in_file = set(current_lint_errors.get(bad_file, ()))
+            errors_to_process_now = set(filter(lambda o: o.code in {"W505"}, errors_in_file))
+            handled_texts[bad_file] = _suppress_errors_in_source(text, errors_to_process_now)
+            remaining_errors[bad_file] = errors_in_file - errors_to_process_now
+        return handled_texts, remaining_errors
+
+
+def remove_auto_suppressions(text: str) -> str:
+    """Removes auto-suppressions from the source `text`."""
+    stripped_lines = [_filter_suppresion_from_line(line) for line in text.splitlines()]
+    return "\n".join(stripped_lines) + "\n"
 
 
 def remove_auto_suppressions_from_file(file: pathlib.Path):
@@ -149,14 +278,20 @@ def remove_auto_suppressions_from_file(file: pathlib.Path):
     file.write_text("\n".join(stripped_lines) + "\n", encoding=_utils.DEFAULT_ENCODING)
 
 
-def _suppress_errors_in_file(bad_file, errors_in_file, encoding):
-    path = pathlib.Path(bad_file)
-    lines = path.read_text(encoding=encoding).splitlines(keepends=True)
+def _suppress_errors_in_source(text: str, errors_in_file) -> str:
+    with _utils.trace.span("suppress errors", errors=len(errors_in_file)):
+        return _suppress_errors_in_source_untraced(text, errors_in_file)
+
+
+def _suppress_errors_in_source_untraced(text: str, errors_in_file) -> str:
+    lines = text.splitlines(keepends=True)
     # sometimes errors are reported on line 1 for empty files.
     # to make suppressions work for those cases, add an empty line.
     if len(lines) == 0:
         lines = ["\n"]
-    multiline_checker = _utils.string_helpers.InMultiLineStringChecker(error_file=bad_file)
+    multiline_checker = _utils.string_helpers.InMultiLineStringChecker(
+        lines=[line.rstrip("\r\n") for line in lines]
+    )
 
     # to avoid double marking a line with the same code, keep track of lines and codes
     handled_lines = defaultdict(list)
@@ -188,4 +323,4 @@ def _suppress_errors_in_file(bad_file, errors_in_file, encoding):
             explanation=error.explanation,
         )
 
-    path.write_text("".join(lines), encoding=encoding)
+    return "".join(lines)
@@ -0,0 +1,21 @@
+"""black's settings, as the builtin config sets them."""
+
+import dataclasses
+import functools
+
+import black
+import flake8_black
+
+from ni_python_styleguide import _config_constants
+
+
+@functools.lru_cache(maxsize=None)
+def mode(is_pyi: bool = False) -> black.Mode:
+    """Returns black's mode for the builtin config (read once, rather than for each file).
+
+    The config is read by flake8-black, the same as for BLK100, so formatting (with the black API)
+    and checking always agree.
+    """
+    return dataclasses.replace(
+        flake8_black.load_black_mode(_config_constants.BLACK_CONFIG_FILE), is_pyi=is_pyi
+    )
@@ -1,11 +1,17 @@
+import contextlib
+import functools
 import pathlib
 import sys
+import time
 import typing
 
 import click
 import toml
 
-from ni_python_styleguide import _acknowledge_existing_errors, _fix, _Flake8Error, _lint
+from ni_python_styleguide import _daemon, _Flake8Error, _utils
+
+# Each command imports the engine it runs (flake8, black, isort, ...) when it runs, rather than
+# here, so that the other commands (and forwarding to the daemon) don't pay to import them.
 
 
 def _qs_or_vs(verbosity):
@@ -15,6 +21,16 @@ def _qs_or_vs(verbosity):
 
 
 def _read_pyproject_toml(ctx, param, value):
+    start, wall, cpu = time.perf_counter_ns(), time.perf_counter(), time.process_time()
+    try:
+        return _load_pyproject_toml(ctx, value)
+    finally:
+        ctx.ensure_object(dict)  # kept for `lint --profile` and `--trace-file`
+        ctx.obj["CONFIG_LOAD_TIMES"] = (time.perf_counter() - wall, time.process_time() - cpu)
+        ctx.obj["CONFIG_LOAD_SPAN"] = (start, time.perf_counter_ns())
+
+
+def _load_pyproject_toml(ctx, value):
     value = value or "pyproject.toml"  # Only accept local pyproject.toml if not specified
 
     try:
@@ -62,6 +78,103 @@ def _get_application_import_names(pyproject):
     return f"{app_name},tests"
 
 
+class _JobsParamType(click.ParamType):
+    """Number of worker processes, or "auto" to choose based on the CPU and file counts."""
+
+    name = "N|auto"
+
+    def convert(self, value, param, ctx):
+        """Converts `value` to a positive number of jobs, or "auto"."""
+        if value == "auto" or isinstance(value, int):
+            return value
+        try:
+            jobs = int(value)
+        except ValueError:
+            jobs = 0
+        if jobs < 1:
+            self.fail(f"{value!r} is not a positive number or 'auto'", param, ctx)
+        return jobs
+
+
+class _LineRangeParamType(click.ParamType):
+    """A (1-based, inclusive) range of lines, given as START-END."""
+
+    name = "START-END"
+
+    def convert(self, value, param, ctx):
+        """Converts `value` to a (start, end) tuple."""
+        if isinstance(value, tuple):
+            return value
+        start, _, end = value.partition("-")
+        try:
+            line_range = int(start), int(end)
+        except ValueError:
+            self.fail(f"{value!r} is not a range of lines like 10-20", param, ctx)
+        if not 1 <= line_range[0] <= line_range[1]:
+            self.fail(
+                f"{value!r} must start at line 1 or later and not end before it starts", param, ctx
+            )
+        return line_range
+
+
+def _jobs_option(function):
+    return click.option(
+        "-j",
+        "--jobs",
+        type=_JobsParamType(),
+        default="auto",
+        show_default=True,
+        help="Number of worker processes to lint or format files with, or 'auto' to choose from the CPU "
+        "count and number of files (small runs stay in one process).",
+    )(function)
+
+
+def _cache_dir_option(function):
+    return click.option(
+        "--cache-dir",
+        type=click.Path(file_okay=False, path_type=pathlib.Path),
+        envvar="NI_PYTHON_STYLEGUIDE_CACHE_DIR",
+        help="Directory for the lint and format caches and the daemon's socket "
+        "[default: a per-user cache directory]",
+    )(function)
+
+
+def _no_daemon_option(function):
+    return click.option(
+        "--no-daemon",
+        is_flag=True,
+        help="Run in this process, even if a daemon (see 'daemon start') is running.",
+    )(function)
+
+
+def _stdin_display_name_option(function):
+    return click.option(
+        "--stdin-display-name",
+        default="stdin",
+        show_default=True,
+        help="Filename to treat source read from stdin (given as '-') as, e.g. for per-file-ignores.",
+    )(function)
+
+
+def _finish_trace(trace: _utils.trace.Trace, trace_file: pathlib.Path) -> None:
+    try:
+        trace.finish()
+    except OSError as e:
+        raise click.ClickException(f"Could not write trace file {trace_file}: {e.strerror}")
+
+
+def _forward_to_daemon(cache_dir, command, options):
+    """Runs the command in the daemon, if one is running, and exits with its exit code."""
+    if _utils.trace.is_enabled():
+        return  # the daemon's spans wouldn't be in this run's trace
+    reply = _daemon.forward(_daemon.socket_path(cache_dir), command, options)
+    if reply is None:
+        return
+    click.echo(reply.stdout, nl=False)
+    click.echo(reply.stderr, nl=False, err=True)
+    sys.exit(reply.exit_code)
+
+
 class ConfigGroup(click.Group):
     """click.Group subclass which allows for a config option to load options from."""
 
@@ -113,13 +226,33 @@ class ConfigGroup(click.Group):
     default="",
     help="Comma-separated list of files or directories to exclude (in addition to --exclude).",
 )
+@click.option(
+    "--respect-gitignore",
+    is_flag=True,
+    help="In git repositories, find files with 'git ls-files', skipping files git ignores "
+    "(much faster when ignored directories hold many files).",
+)
+@click.option(
+    "--trace-file",
+    type=click.Path(dir_okay=False, writable=True, path_type=pathlib.Path),
+    help="Record where the run spends its time (including in worker processes) to this file, "
+    "in Chrome's Trace Event format (for chrome://tracing, Perfetto or speedscope).",
+)
 @click.version_option()  # @TODO: override the message to include dependency version(s)
 @click.pass_context
-def main(ctx, verbose, quiet, config, exclude, extend_exclude):
+def main(ctx, verbose, quiet, config, exclude, extend_exclude, respect_gitignore, trace_file):
     """NI's internal and external Python linter rules and plugins."""  # noqa: D4
     ctx.ensure_object(dict)
+    if trace_file:
+        try:
+            trace = _utils.trace.Trace(trace_file, f"nps {ctx.invoked_subcommand}")
+        except OSError as e:
+            raise click.ClickException(f"Could not write trace file {trace_file}: {e.strerror}")
+        ctx.call_on_close(functools.partial(_finish_trace, trace, trace_file))
+        _utils.trace.add_span("config loading", *ctx.obj["CONFIG_LOAD_SPAN"])
     ctx.obj["VERBOSITY"] = verbose - quiet
     ctx.obj["EXCLUDE"] = ",".join(filter(bool, [exclude.strip(","), extend_exclude.strip(",")]))
+    ctx.obj["RESPECT_GITIGNORE"] = respect_gitignore
     ctx.obj["APP_IMPORT_NAMES"] = _get_application_import_names(ctx.obj.get("PYPROJECT", {}))
 
 
@@ -131,21 +264,105 @@ def main(ctx, verbose, quiet, config, exclude, extend_exclude):
     type=str,
     help="Comma-separated list of errors and warnings to ignore (or skip)",
 )
+@_cache_dir_option
+@click.option(
+    "--no-cache", is_flag=True, help="Lint every file, without reading or updating the cache."
+)
+@click.option(
+    "--changed-since",
+    metavar="REF",
+    help="Only lint the Python files changed (or untracked) since the given git ref.",
+)
+@click.option(
+    "--staged",
+    is_flag=True,
+    help="Only lint the Python files staged in git, checking their staged contents.",
+)
+@_jobs_option
+@_no_daemon_option
+@_stdin_display_name_option
+@click.option(
+    "--profile",
+    is_flag=True,
+    help="Report (to stderr) the time spent in each stage and plugin, and the slowest files. "
+    "Runs in this process; add --no-cache to time every file.",
+)
+@click.option(
+    "--profile-format",
+    type=click.Choice(["table", "json"]),
+    default="table",
+    show_default=True,
+    help="How --profile reports the times.",
+)
 @click.argument("file_or_dir", nargs=-1)
 @click.pass_obj
-def lint(obj, format, extend_ignore, file_or_dir):
-    """Lint the file(s)/directory(s) given."""  # noqa: D4
+def lint(
+    obj,
+    format,
+    extend_ignore,
+    cache_dir,
+    no_cache,
+    changed_since,
+    staged,
+    jobs,
+    no_daemon,
+    stdin_display_name,
+    profile,
+    profile_format,
+    file_or_dir,
+):
+    """Lint the file(s)/directory(s) given ('-' to lint stdin)."""  # noqa: D4
+    if changed_since and staged:
+        raise click.UsageError("--changed-since and --staged cannot be used together")
+    sources = None
+    if "-" in file_or_dir:
+        if len(file_or_dir) > 1 or changed_since or staged:
+            raise click.UsageError(
+                "'-' (stdin) cannot be combined with other files, --changed-since or --staged"
+            )
+        stdin = click.get_binary_stream("stdin").read()
+        sources = {stdin_display_name: _utils.string_helpers.decode_source(stdin)}
+    options = dict(
+        qs_or_vs=_qs_or_vs(obj["VERBOSITY"]),
+        exclude=obj["EXCLUDE"],
+        app_import_names=obj["APP_IMPORT_NAMES"],
+        format=format,
+        extend_ignore=extend_ignore,
+        file_or_dir=file_or_dir,
+        changed_since=changed_since,
+        staged=staged,
+        jobs=jobs,
+        sources=sources,
+        respect_gitignore=obj["RESPECT_GITIGNORE"],
+    )
+    if not (no_daemon or profile):
+        _forward_to_daemon(
+            cache_dir,
+            "lint",
+            dict(
+                options,
+                file_or_dir=list(file_or_dir),
+                cache_dir=None if no_cache else str(_lint_cache_dir(cache_dir)),
+            ),
+        )
+    if profile:
+        profile = _utils.profile.Profile()
+        _utils.profile.add(profile.stages, "config loading", *obj["CONFIG_LOAD_TIMES"])
+    from ni_python_styleguide import _lint
+
     try:
         _lint.lint(
-            qs_or_vs=_qs_or_vs(obj["VERBOSITY"]),
-            exclude=obj["EXCLUDE"],
-            app_import_names=obj["APP_IMPORT_NAMES"],
-            format=format,
-            extend_ignore=extend_ignore,
-            file_or_dir=file_or_dir,
+            **options,
+            cache=None if no_cache else _utils.cache.Cache(_lint_cache_dir(cache_dir)),
+            profile=profile or None,
         )
+    except _utils.git.GitError as e:
+        raise click.ClickException(str(e))
     except _Flake8Error:
         sys.exit(-1)  # exit without additional output
+    finally:
+        if profile:
+            _echo_profile(profile, profile_format)
 
 
 @main.command()
@@ -160,19 +377,27 @@ def lint(obj, format, extend_ignore, file_or_dir):
     is_flag=True,
     help="Attempt to handle long acknowledgement lines by formatting and repeating the acknowledgement.",
 )
+@_jobs_option
 @click.pass_obj
-def acknowledge_existing_violations(obj, extend_ignore, file_or_dir, aggressive):
+def acknowledge_existing_violations(obj, extend_ignore, file_or_dir, aggressive, jobs):
     """Lint existing violations and acknowledge.
 
     Use this command to acknowledge violations in existing code to allow for enforcing new code.
     """
-    _acknowledge_existing_errors.acknowledge_lint_errors(
+    from ni_python_styleguide import _acknowledge_existing_errors
+
+    passes_by_file = _acknowledge_existing_errors.acknowledge_lint_errors(
         exclude=obj["EXCLUDE"],
         app_import_names=obj["APP_IMPORT_NAMES"],
         extend_ignore=extend_ignore,
         file_or_dir=file_or_dir,
         aggressive=aggressive,
+        jobs=jobs,
+        respect_gitignore=obj["RESPECT_GITIGNORE"],
     )
+    if obj["VERBOSITY"] > 0:
+        for file, passes in passes_by_file.items():
+            click.echo(f"{file}: acknowledged in {passes} pass(es)")
 
 
 @main.command()
@@ -187,31 +412,267 @@ def acknowledge_existing_violations(obj, extend_ignore, file_or_dir, aggressive)
     is_flag=True,
     help="Remove any existing acknowledgments, fix what can be fixed, and re-acknowledge remaining.",
 )
+@_jobs_option
 @click.pass_obj
-def fix(obj, extend_ignore: typing.Optional[str], file_or_dir, aggressive):
+def fix(obj, extend_ignore: typing.Optional[str], file_or_dir, aggressive, jobs):
     """Fix basic linter/formatting errors in file(s)/directory(s) given."""
+    from ni_python_styleguide import _fix
+
     _fix.fix(
         exclude=obj["EXCLUDE"],
         app_import_names=obj["APP_IMPORT_NAMES"],
         extend_ignore=extend_ignore,
         file_or_dir=file_or_dir or [pathlib.Path.cwd()],
         aggressive=aggressive,
+        jobs=jobs,
+        respect_gitignore=obj["RESPECT_GITIGNORE"],
     )
 
 
 @main.command()
 @click.option("--diff", is_flag=True, help="Show a diff of the changes that would be made")
 @click.option("--check", is_flag=True, help="Error if files would be changed")
+@click.option(
+    "--stream",
+    is_flag=True,
+    help="With --diff or --check, report each file as soon as it is formatted, "
+    "instead of in file order.",
+)
+@click.option(
+    "--lines",
+    type=_LineRangeParamType(),
+    multiple=True,
+    help="Only format this range of lines (can be repeated), in a single file or stdin.",
+)
+@click.option(
+    "--changed-since",
+    metavar="REF",
+    help="Only format the lines changed since the given git ref (and all of untracked files).",
+)
 @click.argument("file_or_dir", nargs=-1)
+@_jobs_option
+@_cache_dir_option
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    help="Format every file, without reading or updating the cache of formatted files.",
+)
+@_no_daemon_option
+@_stdin_display_name_option
 @click.pass_obj
-def format(obj, file_or_dir, check: bool, diff: bool):
-    """Format the file(s)/directory(s) given."""
-    _fix.fix(
-        exclude=obj["EXCLUDE"],
-        app_import_names=obj["APP_IMPORT_NAMES"],
-        extend_ignore=None,
-        file_or_dir=file_or_dir or [pathlib.Path.cwd()],
-        aggressive=False,
-        check=check,
-        diff=diff,
-    )
+def format(
+    obj,
+    file_or_dir,
+    check: bool,
+    diff: bool,
+    stream: bool,
+    lines,
+    changed_since,
+    jobs,
+    cache_dir,
+    no_cache,
+    no_daemon,
+    stdin_display_name,
+):
+    """Format the file(s)/directory(s) given ('-' to format stdin to stdout)."""
+    stdin = "-" in file_or_dir
+    if stdin and (len(file_or_dir) > 1 or changed_since):
+        raise click.UsageError("'-' (stdin) cannot be combined with other files or --changed-since")
+    if lines and changed_since:
+        raise click.UsageError("--lines and --changed-since cannot be used together")
+    if lines and len(file_or_dir) != 1:
+        raise click.UsageError("--lines needs a single file (or '-') to format")
+    lines = list(lines) or None
+    file_or_dir = file_or_dir or [pathlib.Path.cwd()]
+    if not (stdin or no_daemon):
+        _forward_to_daemon(
+            cache_dir,
+            "format",
+            dict(
+                exclude=obj["EXCLUDE"],
+                app_import_names=obj["APP_IMPORT_NAMES"],
+                file_or_dir=[str(file_or_dir_) for file_or_dir_ in file_or_dir],
+                check=check,
+                diff=diff,
+                stream=stream,
+                lines=lines,
+                changed_since=changed_since,
+                jobs=jobs,
+                respect_gitignore=obj["RESPECT_GITIGNORE"],
+                cache_dir=None if no_cache else str(_format_cache_dir(cache_dir)),
+            ),
+        )
+    from ni_python_styleguide import _format
+
+    if stdin:
+        _format.format_stdin(
+            obj["APP_IMPORT_NAMES"],
+            display_name=stdin_display_name,
+            diff=diff,
+            check=check,
+            lines=lines,
+        )
+        return
+    try:
+        _format.format_files(
+            exclude=obj["EXCLUDE"],
+            app_import_names=obj["APP_IMPORT_NAMES"],
+            file_or_dir=file_or_dir,
+            check=check,
+            diff=diff,
+            stream=stream,
+            lines=lines,
+            changed_since=changed_since,
+            jobs=jobs,
+            respect_gitignore=obj["RESPECT_GITIGNORE"],
+            cache=None if no_cache else _utils.cache.Cache(_format_cache_dir(cache_dir)),
+        )
+    except _utils.git.GitError as e:
+        raise click.ClickException(str(e))
+
+
+@main.command()
+@click.option(
+    "--extend-ignore",
+    type=str,
+    help="Comma-separated list of errors and warnings to ignore (or skip)",
+)
+@click.option(
+    "--debounce",
+    type=click.FloatRange(min=0),
+    default=0.3,
+    show_default=True,
+    help="Seconds to wait after an edit before linting the document.",
+)
+@click.pass_obj
+def lsp(obj, extend_ignore, debounce):
+    """Run a Language Server Protocol server over stdin/stdout, for editors."""
+    from ni_python_styleguide import _lsp
+
+    writer = sys.stdout.buffer
+    with contextlib.redirect_stdout(sys.stderr):  # keep stray output out of the protocol stream
+        exit_code = _lsp.serve(
+            sys.stdin.buffer,
+            writer,
+            exclude=obj["EXCLUDE"],
+            app_import_names=obj["APP_IMPORT_NAMES"],
+            extend_ignore=extend_ignore,
+            debounce=debounce,
+        )
+    sys.exit(exit_code)
+
+
+# how many of the slowest files `lint --profile` lists
+PROFILE_SLOWEST_FILES = 10
+
+
+def _echo_profile(profile: _utils.profile.Profile, profile_format: str) -> None:
+    if profile_format == "json":
+        click.echo(profile.to_json(PROFILE_SLOWEST_FILES), err=True)
+    else:
+        click.echo(profile.to_table(PROFILE_SLOWEST_FILES), err=True)
+
+
+def _lint_cache_dir(cache_dir: typing.Optional[pathlib.Path]) -> pathlib.Path:
+    return (cache_dir or _utils.cache.default_cache_dir()) / "lint"
+
+
+def _format_cache_dir(cache_dir: typing.Optional[pathlib.Path]) -> pathlib.Path:
+    return (cache_dir or _utils.cache.default_cache_dir()) / "format"
+
+
+@main.group()
+def cache():
+    """Inspect or clear the cache of lint results and formatted files."""
+
+
+@cache.command()
+@_cache_dir_option
+def stats(cache_dir):
+    """Show the location, number of entries and size of the cache."""
+    cache_stats = _utils.cache.Cache(cache_dir or _utils.cache.default_cache_dir()).stats()
+    click.echo(f"Directory: {cache_stats.directory}")
+    click.echo(f"Entries: {cache_stats.entries}")
+    click.echo(f"Size: {cache_stats.size / (1024 * 1024):.1f} MiB")
+
+
+@cache.command()
+@_cache_dir_option
+def clear(cache_dir):
+    """Remove all entries from the cache."""
+    _utils.cache.Cache(cache_dir or _utils.cache.default_cache_dir()).clear()
+
+
+@main.group()
+def daemon():
+    """Keep linting warm in a background process, for editors and git hooks.
+
+    While the daemon is running, 'lint' and 'format' hand their work to it instead of setting up
+    flake8 and its plugins on every run. The daemon is not available on Windows.
+    """
+    if not _daemon.is_supported():
+        raise click.ClickException("The daemon needs Unix domain sockets, which are unavailable")
+
+
+def _idle_timeout_option(function):
+    return click.option(
+        "--idle-timeout",
+        type=click.IntRange(min=0),
+        default=3600,
+        show_default=True,
+        help="Seconds without requests after which the daemon exits (0 to never exit).",
+    )(function)
+
+
+@daemon.command()
+@_cache_dir_option
+@_idle_timeout_option
+def start(cache_dir, idle_timeout):
+    """Start the daemon in the background, unless it is already running."""
+    path = _daemon.socket_path(cache_dir)
+    daemon_status = _daemon.status(path)
+    if daemon_status is not None:
+        click.echo(f"Daemon already running (pid {daemon_status['pid']})")
+        return
+    try:
+        daemon_status = _daemon.start(path, idle_timeout)
+    except _daemon.DaemonError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Daemon started (pid {daemon_status['pid']})")
+
+
+@daemon.command()
+@_cache_dir_option
+@_idle_timeout_option
+def run(cache_dir, idle_timeout):
+    """Run the daemon in the foreground."""
+    try:
+        _daemon.serve(_daemon.socket_path(cache_dir), idle_timeout)
+    except _daemon.DaemonError as e:
+        raise click.ClickException(str(e))
+
+
+@daemon.command()
+@_cache_dir_option
+def stop(cache_dir):
+    """Stop the daemon."""
+    if _daemon.stop(_daemon.socket_path(cache_dir)):
+        click.echo("Daemon stopped")
+    else:
+        click.echo("Daemon not running")
+
+
+@daemon.command()
+@_cache_dir_option
+def status(cache_dir):
+    """Show whether the daemon is running, and what it has done."""
+    path = _daemon.socket_path(cache_dir)
+    daemon_status = _daemon.status(path)
+    if daemon_status is None:
+        click.echo("Daemon not running")
+        return
+    click.echo(f"Socket: {path}")
+    click.echo(f"PID: {daemon_status['pid']}")
+    click.echo(f"Uptime: {daemon_status['uptime']:.0f} s")
+    click.echo(f"Requests: {daemon_status['requests']}")
+    click.echo(f"Sessions: {daemon_status['sessions']}")
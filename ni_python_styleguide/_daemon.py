@@ -0,0 +1,305 @@
+"""Background process which keeps lint sessions warm between runs.
+
+The daemon listens on a Unix domain socket. Each connection carries one request: a line of JSON
+with the command ("lint", "format", "status" or "stop"), the client's working directory and the
+command's (already resolved) options. The daemon answers with a line of JSON and closes the
+connection. Requests are handled one at a time.
+"""
+
+import contextlib
+import importlib.metadata
+import io
+import json
+import os
+import pathlib
+import socket
+import subprocess
+import sys
+import time
+import traceback
+import typing
+
+from ni_python_styleguide import _config_constants, _Flake8Error, _utils
+
+_SOCKET_NAME = "daemon.sock"
+_LOG_NAME = "daemon.log"
+_START_TIMEOUT = 30  # seconds
+
+
+class DaemonError(Exception):
+    """Raised when the daemon can't be started or reached."""
+
+
+class Reply(typing.NamedTuple):
+    """The outcome of a command run by the daemon."""
+
+    exit_code: int
+    stdout: str
+    stderr: str
+
+
+def is_supported() -> bool:
+    """Returns True if the platform has Unix domain sockets."""
+    return hasattr(socket, "AF_UNIX")
+
+
+def socket_path(cache_dir: typing.Optional[pathlib.Path] = None) -> pathlib.Path:
+    """Returns the path of the daemon's socket for the given cache directory."""
+    return pathlib.Path(cache_dir or _utils.cache.default_cache_dir()) / _SOCKET_NAME
+
+
+def forward(
+    path: pathlib.Path, command: str, options: typing.Dict[str, typing.Any]
+) -> typing.Optional[Reply]:
+    """Runs `command` in the daemon listening on `path`.
+
+    Returns None if no daemon is running there (or it stopped because its environment changed),
+    in which case the caller should run the command itself.
+    """
+    response = _request(path, {"command": command, "cwd": os.getcwd(), "options": options})
+    if response is None or response.get("stale"):
+        return None
+    return Reply(**response)
+
+
+def status(path: pathlib.Path) -> typing.Optional[typing.Dict[str, typing.Any]]:
+    """Returns the status of the daemon listening on `path`, or None if it isn't running."""
+    return _request(path, {"command": "status"})
+
+
+def stop(path: pathlib.Path) -> bool:
+    """Stops the daemon listening on `path`, returning False if it wasn't running."""
+    return _request(path, {"command": "stop"}) is not None
+
+
+def start(path: pathlib.Path, idle_timeout: int) -> typing.Dict[str, typing.Any]:
+    """Starts a daemon listening on `path` in the background and returns its status."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path.parent / _LOG_NAME, "ab") as log:
+        process = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "ni_python_styleguide",
+                "daemon",
+                "run",
+                f"--cache-dir={path.parent}",
+                f"--idle-timeout={idle_timeout}",
+            ],
+            stdin=subprocess.DEVNULL,
+            stdout=log,
+            stderr=log,
+            env=_utils.trace.untraced_environment(),  # it outlives the run which started it
+            start_new_session=True,
+        )
+    deadline = time.monotonic() + _START_TIMEOUT
+    while time.monotonic() < deadline:
+        daemon_status = status(path)
+        if daemon_status is not None:
+            return daemon_status
+        if process.poll() is not None:
+            raise DaemonError(f"The daemon exited early, see {path.parent / _LOG_NAME}")
+        time.sleep(0.05)
+    process.kill()
+    raise DaemonError(f"The daemon didn't start in {_START_TIMEOUT} seconds")
+
+
+def serve(path: pathlib.Path, idle_timeout: typing.Optional[int] = None) -> None:
+    """Serves requests on `path` until stopped, or idle for `idle_timeout` seconds."""
+    # Clients import only this module, so the engines are imported here, before the first request.
+    from ni_python_styleguide import _format, _lint  # noqa: F401
+
+    _Server(path).serve(idle_timeout or None)
+
+
+def _request(
+    path: pathlib.Path, message: typing.Dict[str, typing.Any]
+) -> typing.Optional[typing.Dict[str, typing.Any]]:
+    if not is_supported():
+        return None
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        try:
+            connection.connect(str(path))
+        except OSError:  # not running, a stale socket or a path too long for a socket
+            return None
+        _send(connection, message)
+        return _receive(connection)
+
+
+def _send(connection: socket.socket, message: typing.Dict[str, typing.Any]) -> None:
+    connection.sendall(json.dumps(message).encode(_utils.DEFAULT_ENCODING) + b"\n")
+
+
+def _receive(connection: socket.socket) -> typing.Optional[typing.Dict[str, typing.Any]]:
+    data = bytearray()
+    while not data.endswith(b"\n"):
+        chunk = connection.recv(65536)
+        if not chunk:
+            break
+        data += chunk
+    if not data:
+        return None
+    return json.loads(data.decode(_utils.DEFAULT_ENCODING))
+
+
+# the entry point groups of flake8's plugins
+_PLUGIN_GROUPS = {"flake8.extension", "flake8.report"}
+# the tools (besides flake8's plugins) whose versions decide the results
+_TOOL_DISTRIBUTIONS = (
+    "ni-python-styleguide",
+    "black",
+    "isort",
+    "pycodestyle",
+    "pyflakes",
+    "pydocstyle",
+)
+
+
+def _environment_fingerprint() -> str:
+    """Fingerprints the bundled config and the versions of the installed tools and flake8 plugins.
+
+    Directories (e.g. on `sys.path`) aren't fingerprinted, as one of them may be the directory the
+    daemon was started in, which changes whenever a file is created there.
+    """
+    parts = [
+        _config_constants.FLAKE8_CONFIG_FILE.read_bytes(),
+        _config_constants.BLACK_CONFIG_FILE.read_bytes(),
+    ]
+    versions = {
+        (distribution.metadata["Name"], distribution.version)
+        for distribution in importlib.metadata.distributions()
+        if any(entry_point.group in _PLUGIN_GROUPS for entry_point in distribution.entry_points)
+    }
+    for name in _TOOL_DISTRIBUTIONS:
+        with contextlib.suppress(importlib.metadata.PackageNotFoundError):
+            versions.add((name, importlib.metadata.version(name)))
+    parts.extend(f"{name}=={version}" for name, version in sorted(versions))
+    return _utils.cache.fingerprint(*parts)
+
+
+class _Server:
+    def __init__(self, path: pathlib.Path):
+        self._path = path
+        self._fingerprint = _environment_fingerprint()
+        self._sessions: typing.Dict[typing.Tuple, typing.Any] = {}
+        self._started = time.time()
+        self._requests = 0
+        self._running = False
+
+    def serve(self, idle_timeout: typing.Optional[int]) -> None:
+        if not is_supported():
+            raise DaemonError("The daemon needs Unix domain sockets, which this platform lacks")
+        if status(self._path) is not None:
+            raise DaemonError(f"A daemon is already listening on {self._path}")
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        with contextlib.suppress(FileNotFoundError):
+            self._path.unlink()  # stale socket from a daemon which didn't exit cleanly
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as listener:
+            listener.bind(str(self._path))
+            try:
+                listener.listen()
+                listener.settimeout(idle_timeout)
+                self._running = True
+                while self._running:
+                    try:
+                        connection, _ = listener.accept()
+                    except socket.timeout:
+                        break
+                    with connection:
+                        connection.settimeout(None)
+                        try:
+                            self._handle(connection)
+                        except Exception:
+                            traceback.print_exc()  # keep serving other clients
+            finally:
+                with contextlib.suppress(FileNotFoundError):
+                    self._path.unlink()
+
+    def _handle(self, connection: socket.socket) -> None:
+        message = _receive(connection)
+        if message is None:
+            return
+        command = message.get("command")
+        if command == "status":
+            response = {
+                "pid": os.getpid(),
+                "uptime": time.time() - self._started,
+                "requests": self._requests,
+                "sessions": len(self._sessions),
+            }
+        elif command == "stop":
+            self._running = False
+            response = {"stopped": True}
+        elif _environment_fingerprint() != self._fingerprint:
+            # Plugins may have been upgraded under us; imported modules can't be trusted anymore.
+            self._running = False
+            response = {"stale": True}
+        elif command in ("lint", "format"):
+            self._requests += 1
+            response = self._run(command, message["cwd"], message["options"])._asdict()
+        else:
+            response = Reply(1, "", f"Error: Unknown daemon command {command!r}\n")._asdict()
+        _send(connection, response)
+
+    def _run(self, command: str, cwd: str, options: typing.Dict[str, typing.Any]) -> Reply:
+        stdout = io.TextIOWrapper(
+            io.BytesIO(), encoding=_utils.DEFAULT_ENCODING, write_through=True
+        )
+        stderr = io.StringIO()
+        exit_code = 0
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            try:
+                os.chdir(cwd)
+                if command == "lint":
+                    self._lint(cwd, **options)
+                else:
+                    self._format(cwd, **options)
+            except _Flake8Error:
+                exit_code = -1
+            except _utils.git.GitError as e:
+                print(f"Error: {e}", file=sys.stderr)
+                exit_code = 1
+            except Exception:
+                traceback.print_exc()
+                exit_code = 1
+        return Reply(
+            exit_code,
+            stdout.buffer.getvalue().decode(_utils.DEFAULT_ENCODING, errors="replace"),
+            stderr.getvalue(),
+        )
+
+    def _lint(
+        self, cwd, *, cache_dir, file_or_dir, changed_since, staged, sources, **session_options
+    ):
+        from ni_python_styleguide import _lint
+
+        key = ("lint", cwd, cache_dir, *sorted(session_options.items()))
+        if key not in self._sessions:
+            cache = _utils.cache.Cache(pathlib.Path(cache_dir)) if cache_dir else None
+            session = _lint.LintSession(
+                session_options["exclude"],
+                session_options["app_import_names"],
+                session_options["extend_ignore"],
+                qs_or_vs=session_options["qs_or_vs"],
+                format=session_options["format"],
+                cache=cache,
+                jobs=session_options["jobs"],
+                respect_gitignore=session_options["respect_gitignore"],
+            )
+            self._sessions[key] = (session, cache)
+        session, cache = self._sessions[key]
+        _lint.lint(
+            **session_options,
+            file_or_dir=file_or_dir,
+            cache=cache,
+            changed_since=changed_since,
+            staged=staged,
+            session=session,
+            sources=sources,
+        )
+
+    def _format(self, cwd, *, cache_dir, **options):
+        from ni_python_styleguide import _format
+
+        cache = _utils.cache.Cache(pathlib.Path(cache_dir)) if cache_dir else None
+        _format.format_files(**options, cache=cache)
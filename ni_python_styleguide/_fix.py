@@ -1,52 +1,22 @@
+import contextlib
+import functools
 import logging
+import multiprocessing
+import os
 import pathlib
-import shutil
 import typing
-from collections import defaultdict
-from typing import Iterable
-
-import better_diff.unified_plus
-import isort
-import pathspec
 
 from ni_python_styleguide import (
     _acknowledge_existing_errors,
-    _config_constants,
     _format,
+    _lint,
     _utils,
 )
-from ni_python_styleguide._utils import temp_file
 
 _module_logger = logging.getLogger(__name__)
 _module_logger.addHandler(logging.NullHandler())
 
 
-def _sort_imports(file: pathlib.Path, app_import_names):
-    raw = file.read_text(encoding=_utils.DEFAULT_ENCODING)
-    isort_config = isort.Config(
-        settings_file=str(_config_constants.ISORT_CONFIG_FILE),
-        known_first_party=filter(None, app_import_names.split(",")),
-    )
-    output = isort.code(
-        raw,
-        config=isort_config,
-    )
-    file.write_text(output, encoding=_utils.DEFAULT_ENCODING)
-
-
-def _format_imports(file: pathlib.Path, app_import_names: Iterable[str]) -> None:
-    _sort_imports(file, app_import_names=app_import_names)
-    _format.format(file, "-q")
-
-
-def _posix_relative_if_under(file: pathlib.Path, base: pathlib.Path) -> str:
-    file_resolved = file.resolve()
-    base_resolved = base.resolve()
-    if file_resolved.as_posix().startswith(base_resolved.as_posix()):
-        return file_resolved.relative_to(base_resolved).as_posix()
-    return file_resolved.as_posix()
-
-
 def fix(
     exclude: str,
     app_import_names: str,
@@ -56,88 +26,133 @@ def fix(
     aggressive=False,
     diff=False,
     check=False,
+    jobs: typing.Union[int, str] = "auto",
+    session: typing.Optional[_lint.LintSession] = None,
+    respect_gitignore: bool = False,
 ):
-    """Fix basic linter errors and format."""
+    """Fix basic linter errors and format.
+
+    `jobs` is the number of worker processes to lint and fix files with (or "auto").
+    `session` is an already set up lint session for these options (one is created if not given).
+    `respect_gitignore` skips files git ignores, if creating a session.
+    """
     file_or_dir = file_or_dir or ["."]
     if diff or check:
         if aggressive:
             raise Exception("Cannot use --aggressive with --diff or --check")
-    if aggressive:
-        glob_spec = pathspec.PathSpec.from_lines(
-            "gitwildmatch",
-            ["*.py"]
-            + [f"!{exclude_}" for exclude_ in exclude.split(",") if exclude_]
-            + [f"!{ignore_}" for ignore_ in (extend_ignore or "").split(",") if ignore_],
+    if session is None:
+        session = _lint.LintSession(
+            exclude,
+            app_import_names,
+            extend_ignore,
+            jobs=jobs,
+            respect_gitignore=respect_gitignore,
         )
-        all_files = []
-        for file_or_dir_ in file_or_dir:
-            file_path = pathlib.Path(file_or_dir_)
-            if file_path.is_dir():
-                all_files.extend(
-                    [pathlib.Path(o) for o in glob_spec.match_tree(str(file_path), negate=False)]
-                )
-            else:
-                all_files.append(file_path)
-        for file in all_files:
-            if not file.is_file():  # doesn't really exist...
+    if aggressive:
+        for file in session.files(file_or_dir):
+            if not os.path.isfile(file):  # doesn't really exist...
                 continue
-            _acknowledge_existing_errors.remove_auto_suppressions_from_file(file)
-    lint_errors_to_process = _acknowledge_existing_errors._utils.lint.get_errors_to_process(
-        exclude,
-        app_import_names,
-        extend_ignore,
+            _acknowledge_existing_errors.remove_auto_suppressions_from_file(pathlib.Path(file))
+    lint_errors_to_process = session.get_errors_to_process(
         [pathlib.Path(file_or_dir_) for file_or_dir_ in file_or_dir],
         excluded_errors=[],  # we fix black errors, so we don't need to filter it.
     )
 
-    lint_errors_by_file = defaultdict(list)
-    for error in lint_errors_to_process:
-        lint_errors_by_file[pathlib.Path(error.file)].append(error)
+    bad_files = [pathlib.Path(file) for file in lint_errors_to_process.files]
 
     failed_files = []
     make_changes = not (diff or check)
-    for bad_file, errors_in_file in lint_errors_by_file.items():
-        try:
-            if make_changes:
-                _format.format(bad_file, "-q")
-                _format_imports(file=bad_file, app_import_names=app_import_names)
-                remaining_lint_errors_in_file = _utils.lint.get_errors_to_process(
-                    exclude,
-                    app_import_names,
-                    extend_ignore,
-                    [bad_file],
-                    excluded_errors=[],
+    options = _FixOptions(app_import_names, make_changes, aggressive, diff, check)
+    with contextlib.ExitStack() as stack:
+        job_count = _utils.jobs.job_count(jobs, len(bad_files))
+        if job_count == 1:
+            results = (_fix_file(bad_file, options, session) for bad_file in bad_files)
+        else:
+            pool = stack.enter_context(
+                multiprocessing.Pool(
+                    job_count,
+                    initializer=_initialize_worker,
+                    initargs=(session.session_args, aggressive),
                 )
-                if remaining_lint_errors_in_file and aggressive:
-                    _acknowledge_existing_errors.acknowledge_lint_errors(
-                        exclude=exclude,
-                        app_import_names=app_import_names,
-                        extend_ignore=extend_ignore,
-                        aggressive=aggressive,
-                        file_or_dir=[bad_file],
-                    )
-            else:
-                with temp_file.multi_access_tempfile(suffix="__" + bad_file.name) as working_file:
-                    shutil.copyfile(bad_file, working_file)
-                    _format.format(working_file, "-q")
-                    _format_imports(file=working_file, app_import_names=app_import_names)
-
-                    diff_lines = better_diff.unified_plus.format_diff(
-                        bad_file.read_text(encoding=_utils.DEFAULT_ENCODING),
-                        working_file.read_text(encoding=_utils.DEFAULT_ENCODING),
-                        fromfile=f"{_posix_relative_if_under(bad_file, pathlib.Path.cwd())}",
-                        tofile=f"{_posix_relative_if_under(bad_file, pathlib.Path.cwd())}_formatted",
-                    )
-                    if diff:
-                        print(diff_lines)
-                    if check and diff_lines:
-                        print("Error: file would be changed:", str(bad_file))
-                        failed_files.append((bad_file, "File would be changed."))
-
-        except Exception as e:
-            failed_files.append((bad_file, e))
+            )
+            # results come back in the order the files were sent, so output matches a serial run
+            results = pool.imap(
+                functools.partial(_fix_file_in_worker, options=options),
+                bad_files,
+                chunksize=max(1, len(bad_files) // (job_count * 2)),
+            )
+        for bad_file, result in zip(bad_files, results):
+            if result.error is not None:
+                failed_files.append((bad_file, result.error))
+                continue
+            if diff:
+                print(result.diff)
+            if check and result.diff:
+                print("Error: file would be changed:", str(bad_file))
+                failed_files.append((bad_file, "File would be changed."))
     if failed_files:
         raise Exception(
             "Failed to format files:\n"
             + "\n".join([f"{file}: {error}" for file, error in failed_files])
         )
+
+
+class _FixOptions(typing.NamedTuple):
+    app_import_names: str
+    make_changes: bool
+    aggressive: bool
+    diff: bool
+    check: bool
+
+
+class _FixResult(typing.NamedTuple):
+    diff: typing.Optional[str] = None
+    error: typing.Optional[str] = None
+
+
+def _fix_file(
+    bad_file: pathlib.Path, options: _FixOptions, session: typing.Optional[_lint.LintSession]
+) -> _FixResult:
+    """Fixes (or with --diff/--check, diffs) one file which has lint errors."""
+    try:
+        # read once and format in memory, only writing (once) if anything changed
+        source = _format.read_source(bad_file)
+        with _utils.trace.span("format", file=bad_file):
+            formatted = _format.format_source(
+                source.text, options.app_import_names, is_pyi=bad_file.suffix == ".pyi"
+            )
+        if not options.make_changes:
+            return _FixResult(
+                diff=_format.format_diff(
+                    source.text,
+                    formatted,
+                    _format.posix_relative_if_under(bad_file, pathlib.Path.cwd()),
+                )
+            )
+        if formatted != source.text:
+            _format.write_source(bad_file, formatted, source)
+        if options.aggressive and session.check_source(formatted, str(bad_file)):
+            _acknowledge_existing_errors.acknowledge_lint_errors(
+                exclude=None,  # only used to create a session
+                app_import_names=options.app_import_names,
+                extend_ignore=None,
+                aggressive=options.aggressive,
+                file_or_dir=[bad_file],
+                session=session,
+            )
+        return _FixResult()
+    except Exception as e:
+        return _FixResult(error=str(e))
+
+
+_worker_session: typing.Optional[_lint.LintSession] = None
+
+
+def _initialize_worker(session_args, aggressive: bool):
+    global _worker_session
+    if aggressive:  # only aggressive fixes lint in the workers
+        _worker_session = _lint.LintSession(*session_args)
+
+
+def _fix_file_in_worker(bad_file: pathlib.Path, options: _FixOptions) -> _FixResult:
+    return _fix_file(bad_file, options, _worker_session)
@@ -1,36 +1,441 @@
 """Linting methods."""
 
 import contextlib
-from io import StringIO
+import functools
+import importlib.metadata
+import io
+import multiprocessing
+import pathlib
+import re
+import sys
+import tokenize
+import typing
 
+import better_diff.unified_plus
 import black
+import isort
 
-from ni_python_styleguide import _config_constants
+from ni_python_styleguide import _black_config, _config_constants, _utils
 
 
-def format(file_or_dir, *additional_formatter_args):
-    """Formats the specified file or directory using the builtin config."""
+@functools.lru_cache(maxsize=None)
+def isort_config(app_import_names: str, lines_after_imports: int = -1) -> isort.Config:
+    """Returns the isort config for the builtin settings and the application import names.
+
+    `lines_after_imports` is the number of blank lines to leave after the imports (-1 for isort's
+    default).
+    """
+    return isort.Config(
+        settings_file=str(_config_constants.ISORT_CONFIG_FILE),
+        known_first_party=filter(None, app_import_names.split(",")),
+        lines_after_imports=lines_after_imports,
+    )
+
+
+# an acknowledgement of imports out of order (flake8-import-order) or combined (E401)
+_ACKNOWLEDGED_IMPORT_ORDER = re.compile(r"#\s*noqa:[^#]*\b(?:E401|I[12]\d\d)\b", re.IGNORECASE)
+# an import statement acknowledged (on its first line) by `acknowledge-existing-violations`
+_ACKNOWLEDGED_IMPORT_STATEMENT = re.compile(r"^\s*(?:from|import)\b.*\(auto-generated noqa\)$")
+
+
+# (1-based, inclusive) ranges of lines, e.g. [(1, 3), (10, 10)]
+LineRanges = typing.Sequence[typing.Tuple[int, int]]
+
+
+def _black(source: str, is_pyi: bool, lines: LineRanges = ()) -> str:
+    with _utils.trace.span("black"):
+        return _black_untraced(source, is_pyi, lines)
+
+
+def _black_untraced(source: str, is_pyi: bool, lines: LineRanges) -> str:
+    mode = _black_config.mode(is_pyi)
     try:
-        black.main(
-            [
-                str(file_or_dir),
-                f"--config={_config_constants.BLACK_CONFIG_FILE.resolve()}",
-                *additional_formatter_args,
-            ]
+        if not lines:
+            return black.format_file_contents(source, fast=False, mode=mode)
+        try:
+            return black.format_file_contents(source, fast=False, mode=mode, lines=lines)
+        except TypeError as e:
+            if "lines" not in str(e):
+                raise
+            raise Exception("Formatting only some lines needs black 23.11 or later") from e
+    except black.NothingChanged:
+        return source
+
+
+class BlackResult(typing.NamedTuple):
+    """The outcome of formatting a source with black."""
+
+    source: str
+    """The formatted source (or the original source, if unchanged or on error)."""
+    changed: bool
+    error: typing.Optional[str] = None
+    """Why the source couldn't be formatted (most likely, it isn't valid Python)."""
+
+
+def black_source(source: str, *, is_pyi: bool = False) -> BlackResult:
+    """Formats `source` with black using the builtin config."""
+    try:
+        formatted = _black(source, is_pyi)
+    except Exception as e:  # black.InvalidInput, or black failing its own safety checks
+        return BlackResult(source, changed=False, error=str(e) or type(e).__name__)
+    return BlackResult(formatted, changed=formatted != source)
+
+
+def black_file(file: pathlib.Path) -> BlackResult:
+    """Formats `file` with black using the builtin config, only writing it if changed."""
+    file = pathlib.Path(file)
+    source = read_source(file)
+    result = black_source(source.text, is_pyi=file.suffix == ".pyi")
+    if result.changed:
+        write_source(file, result.source, source)
+    return result
+
+
+# isort and black normally agree after one pass each, this is in case they keep disagreeing
+_MAX_FORMAT_PASSES = 5
+
+
+def format_source(
+    source: str,
+    app_import_names: str,
+    *,
+    is_pyi: bool = False,
+    lines: typing.Optional[LineRanges] = None,
+) -> str:
+    """Formats `source` in memory, the same as `fix` formats a file (then its imports).
+
+    black then isort are applied until the output stops changing.
+    `lines` limits formatting to those ranges of lines, see `_format_lines`.
+    """
+    if lines is not None:
+        return _format_lines(source, app_import_names, is_pyi, lines)
+    formatted = _black(source, is_pyi)
+    for _ in range(_MAX_FORMAT_PASSES):
+        sorted_imports = _isort(formatted, app_import_names, is_pyi)
+        if sorted_imports == formatted:
+            break  # isort left black's output alone, so neither would change it any further
+        formatted = _black(sorted_imports, is_pyi)
+    return formatted
+
+
+def _format_lines(source: str, app_import_names: str, is_pyi: bool, lines: LineRanges) -> str:
+    """Formats only the given ranges of lines in `source`.
+
+    Imports are sorted only if the ranges include some of the module's leading imports, as isort
+    rewrites the whole import block.
+    """
+    line_count = len(source.splitlines())
+    lines = [(start, min(end, line_count)) for start, end in lines if start <= line_count]
+    if not lines:
+        return source
+    formatted = _black(source, is_pyi, lines)
+    if not any(start <= _import_region_end(source) for start, _ in lines):
+        return formatted
+    sorted_imports = _isort(formatted, app_import_names, is_pyi)
+    if sorted_imports == formatted:
+        return formatted
+    # isort only rewrote the imports, so only they need black again
+    return _black(sorted_imports, is_pyi, [(1, _import_region_end(sorted_imports))])
+
+
+def _isort(source: str, app_import_names: str, is_pyi: bool) -> str:
+    """Sorts the imports in `source`, unless some leading imports are acknowledged as unsorted.
+
+    isort would move the imports (and split combined imports) away from their acknowledgements,
+    and would merge acknowledged statements from the same module, joining their comments.
+    The blank lines after the imports are kept, if black would keep them.
+    """
+    with _utils.trace.span("isort"):
+        imports = _utils.code_analysis.find_source_imports(source)
+        lines = source.splitlines()
+        if any(
+            _ACKNOWLEDGED_IMPORT_ORDER.search(line) or _ACKNOWLEDGED_IMPORT_STATEMENT.match(line)
+            for line in lines[max(imports.first_line - 1, 0) : imports.last_line]
+        ):
+            return source
+        lines_after_imports = -1
+        if imports.last_line and imports.code_line:
+            between = lines[imports.last_line : imports.code_line - 1]
+            if between and not any(line.strip() for line in between):
+                lines_after_imports = len(between)
+        return isort.code(
+            source,
+            extension="pyi" if is_pyi else "py",
+            config=isort_config(app_import_names, lines_after_imports),
         )
-    except SystemExit as e:
-        if e.code == 0:
-            pass  # why are they exiting when called via import ?! ‾\_(ツ)_/‾
-        else:
-            raise
 
 
-def format_check(file_or_dir):
-    """Formats and returns True if changes were made (False otherwise)."""
-    capture = StringIO()
-    with contextlib.redirect_stderr(capture):
-        format(file_or_dir)
-    output = capture.getvalue()
-    made_changes = any(["file reformatted" in output, "files reformatted" in output])
+def _import_region_end(source: str) -> int:
+    """Returns the (1-based) last line of the module's leading imports."""
+    _, end = _utils.code_analysis.find_source_import_region(source)
+    return end or len(source.splitlines())  # nothing follows the imports
+
+
+class Source(typing.NamedTuple):
+    """Python source, with the encoding and line endings it was read with."""
+
+    text: str
+    encoding: str
+    newline: str
+
+
+def _decode(data: bytes) -> Source:
+    """Decodes Python source like black does: its declared encoding, with universal newlines."""
+    encoding, _ = tokenize.detect_encoding(io.BytesIO(data).readline)
+    newline = "\r\n" if data.split(b"\n", 1)[0].endswith(b"\r") else "\n"
+    with io.TextIOWrapper(io.BytesIO(data), encoding=encoding) as reader:
+        return Source(reader.read(), encoding, newline)
+
+
+def _encode(text: str, source: Source) -> bytes:
+    """Encodes formatted `text` with the encoding and line endings `source` was read with."""
+    return text.replace("\n", source.newline).encode(source.encoding)
 
-    return made_changes
+
+def read_source(file: pathlib.Path) -> Source:
+    """Reads the Python source in `file`."""
+    return _decode(pathlib.Path(file).read_bytes())
+
+
+def write_source(file: pathlib.Path, text: str, source: Source) -> None:
+    """Atomically replaces `file` (which `source` was read from) with `text`.
+
+    `text` is written with the same encoding and line endings as `source`.
+    """
+    _utils.temp_file.atomic_write_bytes(file, _encode(text, source))
+
+
+def format_diff(original: str, formatted: str, name: str) -> str:
+    """Returns the diff from `original` to `formatted`, for showing to the user."""
+    return better_diff.unified_plus.format_diff(
+        original, formatted, fromfile=name, tofile=f"{name}_formatted"
+    )
+
+
+def posix_relative_if_under(file: pathlib.Path, base: pathlib.Path) -> str:
+    """Returns `file` as a POSIX path relative to `base` if it is under it, else absolute."""
+    file_resolved = file.resolve()
+    base_resolved = base.resolve()
+    if file_resolved.as_posix().startswith(base_resolved.as_posix()):
+        return file_resolved.relative_to(base_resolved).as_posix()
+    return file_resolved.as_posix()
+
+
+def format_stdin(
+    app_import_names: str,
+    *_,
+    display_name: str = "stdin",
+    diff=False,
+    check=False,
+    lines: typing.Optional[LineRanges] = None,
+) -> None:
+    """Formats the source read from stdin, as if it were the contents of `display_name`.
+
+    The formatted source is written to stdout (or with `diff`, the changes), keeping the source's
+    encoding and line endings. Nothing is written to disk.
+    `lines` limits formatting to those ranges of lines.
+    """
+    source = _decode(sys.stdin.buffer.read())
+    try:
+        formatted = format_source(
+            source.text, app_import_names, is_pyi=display_name.endswith(".pyi"), lines=lines
+        )
+    except Exception as e:
+        raise Exception(f"Failed to format files:\n{display_name}: {e}")
+    if diff:
+        if formatted != source.text:
+            print(format_diff(source.text, formatted, display_name))
+    elif not check:
+        sys.stdout.flush()
+        sys.stdout.buffer.write(_encode(formatted, source))
+        sys.stdout.buffer.flush()
+    if check and formatted != source.text:
+        print("Error: file would be changed:", display_name)
+        raise Exception(f"Failed to format files:\n{display_name}: File would be changed.")
+
+
+class _Result(typing.NamedTuple):
+    """The outcome of formatting one file."""
+
+    changed: bool
+    diff: typing.Optional[str] = None
+    error: typing.Optional[str] = None
+
+
+def _format_file(
+    file: pathlib.Path,
+    app_import_names: str,
+    *,
+    write: bool,
+    diff: bool,
+    data: typing.Optional[bytes] = None,
+    lines: typing.Optional[LineRanges] = None,
+) -> _Result:
+    """Formats `file` (whose contents are `data`, if already read)."""
+    try:
+        source = read_source(file) if data is None else _decode(data)
+        with _utils.trace.span("format", file=file):
+            formatted = format_source(
+                source.text, app_import_names, is_pyi=file.suffix == ".pyi", lines=lines
+            )
+    except Exception as e:
+        return _Result(changed=False, error=str(e))
+    if formatted == source.text:
+        return _Result(changed=False)
+    if write:
+        write_source(file, formatted, source)
+    if diff:
+        name = posix_relative_if_under(file, pathlib.Path.cwd())
+        return _Result(changed=True, diff=format_diff(source.text, formatted, name))
+    return _Result(changed=True)
+
+
+class _FileToFormat(typing.NamedTuple):
+    file: pathlib.Path
+    app_import_names: str
+    write: bool
+    diff: bool
+    data: typing.Optional[bytes]
+    cache_key: typing.Optional[str]
+    lines: typing.Optional[LineRanges]
+
+
+def _format_file_in_worker(
+    indexed_item: typing.Tuple[int, _FileToFormat],
+) -> typing.Tuple[int, _Result]:
+    index, item = indexed_item
+    result = _format_file(
+        item.file,
+        item.app_import_names,
+        write=item.write,
+        diff=item.diff,
+        data=item.data,
+        lines=item.lines,
+    )
+    return index, result
+
+
+@functools.lru_cache(maxsize=None)
+def _cache_fingerprint(app_import_names: str) -> str:
+    """Returns a digest of everything besides a file's contents which decides how it's formatted."""
+    return _utils.cache.fingerprint(
+        _config_constants.BLACK_CONFIG_FILE.read_bytes(),  # also has the isort config
+        app_import_names,
+        importlib.metadata.version("ni-python-styleguide"),
+        black.__version__,
+        isort.__version__,
+    )
+
+
+def _file_to_format(
+    file: pathlib.Path,
+    app_import_names: str,
+    *,
+    write: bool,
+    diff: bool,
+    cache: typing.Optional[_utils.cache.Cache],
+    lines: typing.Optional[LineRanges],
+) -> typing.Optional[_FileToFormat]:
+    """Returns what to format `file` with, or None if the cache knows it is formatted."""
+    if cache is None:
+        return _FileToFormat(file, app_import_names, write, diff, None, None, lines)
+    try:
+        data = file.read_bytes()
+    except OSError:  # let formatting report why it can't be read
+        return _FileToFormat(file, app_import_names, write, diff, None, None, lines)
+    cache_key = _utils.cache.fingerprint(_cache_fingerprint(app_import_names), file.suffix, data)
+    if cache.get(cache_key):
+        return None
+    if lines is not None:
+        cache_key = None  # formatting some lines doesn't show the whole file is formatted
+    return _FileToFormat(file, app_import_names, write, diff, data, cache_key, lines)
+
+
+def format_files(
+    exclude: str,
+    app_import_names: str,
+    file_or_dir,
+    *_,
+    diff=False,
+    check=False,
+    jobs: typing.Union[int, str] = "auto",
+    respect_gitignore: bool = False,
+    cache: typing.Optional[_utils.cache.Cache] = None,
+    stream: bool = False,
+    lines: typing.Optional[LineRanges] = None,
+    changed_since: typing.Optional[str] = None,
+) -> None:
+    """Formats the file(s)/directory(s) with black and isort, without linting them.
+
+    A file is changed if formatting it gives different output, which is only written if neither
+    `diff` (print the changes) nor `check` (fail if anything would change) is given.
+    `jobs` is the number of worker processes to format with (or "auto").
+    `respect_gitignore` finds files in git repos with `git ls-files`, skipping ignored files.
+    `cache` records the contents of files found to be formatted, which are skipped after that.
+    `stream` prints each file's diff (or check failure) as soon as it is ready, rather than in the
+    order the files were found.
+    `lines` limits formatting to those ranges of lines (in each file).
+    `changed_since` limits formatting to the lines of Python files changed since that git ref.
+    """
+    discovery = _utils.discovery.Discovery(
+        _utils.discovery.parse_patterns(exclude or _utils.discovery.FLAKE8_DEFAULT_EXCLUDE),
+        respect_gitignore=respect_gitignore,
+    )
+    with _utils.trace.span("discovery"):
+        if changed_since:
+            files = discovery.files(
+                _utils.git.changed_files(changed_since, file_or_dir), check_parents=True
+            )
+        else:
+            files = discovery.files(file_or_dir or ["."])
+        items = []
+        for file in files:
+            file = pathlib.Path(file)
+            if changed_since:
+                lines = _utils.git.changed_line_ranges(changed_since, file)
+            item = _file_to_format(
+                file,
+                app_import_names,
+                write=not (diff or check),
+                diff=diff,
+                cache=cache,
+                lines=None if lines is None else [tuple(line_range) for line_range in lines],
+            )
+            if item is not None:
+                items.append(item)
+
+    failed_files = []
+    with contextlib.ExitStack() as stack:
+        if cache is not None:
+            stack.callback(cache.evict)
+        job_count = _utils.jobs.job_count(jobs, len(items))
+        if job_count == 1:
+            results = map(_format_file_in_worker, enumerate(items))
+        elif stream:
+            pool = stack.enter_context(multiprocessing.Pool(job_count))
+            results = pool.imap_unordered(_format_file_in_worker, enumerate(items))
+        else:
+            pool = stack.enter_context(multiprocessing.Pool(job_count))
+            # results come back in the order the files were sent, so output matches a serial run
+            results = pool.imap(
+                _format_file_in_worker,
+                enumerate(items),
+                chunksize=max(1, len(items) // (job_count * 2)),
+            )
+        for index, result in results:
+            item = items[index]
+            if result.error is not None:
+                failed_files.append((index, item.file, result.error))
+                continue
+            if item.cache_key and not result.changed:
+                cache.set(item.cache_key, True)
+            if result.diff is not None:
+                print(result.diff, flush=stream)
+            if check and result.changed:
+                print("Error: file would be changed:", str(item.file), flush=stream)
+                failed_files.append((index, item.file, "File would be changed."))
+    if failed_files:
+        raise Exception(
+            "Failed to format files:\n"
+            + "\n".join([f"{file}: {error}" for _, file, error in sorted(failed_files)])
+        )
@@ -1,19 +1,36 @@
 """Linting methods."""
 
+import collections
 import contextlib
+import importlib.metadata
 import io
+import itertools
+import multiprocessing
+import os
+import pathlib
+import queue
+import sys
+import types
 import typing
 
+import black
+import flake8
+import flake8.checker
+import flake8.exceptions
+import flake8.formatting.base
 import flake8.main.application
+import flake8.processor
+import flake8.style_guide
+import flake8.violation
+import flake8_black
 
-from ni_python_styleguide import _config_constants, _Flake8Error
+from ni_python_styleguide import _black_config, _config_constants, _Flake8Error, _utils
+from ni_python_styleguide._utils.lint import LintError
 
 
-def lint(
+def _get_flake8_args(
     qs_or_vs, exclude, app_import_names, format, extend_ignore: typing.Optional[str], file_or_dir
 ):
-    """Run the linter."""
-    app = flake8.main.application.Application()
     args = [
         qs_or_vs,
         f"--config={_config_constants.FLAKE8_CONFIG_FILE.resolve()}",
@@ -27,22 +44,534 @@ def lint(
         f"--application-import-names={app_import_names}",
         *[str(p) for p in file_or_dir],
     ]
-    app.run(list(filter(bool, args)))
-    if app.exit_code() != 0:
-        raise _Flake8Error(app.exit_code())
+    return list(filter(bool, args))
 
 
-# Note: tried to use functools.wraps
-#  - but VSCode did not properly identify the wrapped method's signature :(
-def get_lint_output(
-    qs_or_vs, exclude, app_import_names, format, extend_ignore: typing.Optional[str], file_or_dir
-) -> str:
-    "Return the output from running the linter."
-    capture = io.TextIOWrapper(io.BytesIO())
-    with contextlib.redirect_stdout(capture):
+def lint(
+    qs_or_vs,
+    exclude,
+    app_import_names,
+    format,
+    extend_ignore: typing.Optional[str],
+    file_or_dir,
+    *_,
+    cache: typing.Optional[_utils.cache.Cache] = None,
+    changed_since: typing.Optional[str] = None,
+    staged: bool = False,
+    jobs: typing.Union[int, str] = "auto",
+    session: typing.Optional["LintSession"] = None,
+    sources: typing.Optional[typing.Mapping[str, str]] = None,
+    respect_gitignore: bool = False,
+    profile: typing.Optional[_utils.profile.Profile] = None,
+):
+    """Run the linter.
+
+    `cache` stores the violations of each file, reused while the file and config are unchanged.
+    `changed_since` limits linting to the Python files changed since that git ref.
+    `staged` limits linting to the Python files staged in git, and lints their staged contents.
+    `jobs` is the number of worker processes to lint with (or "auto").
+    `session` is an already set up session for these options (one is created if not given).
+    `sources` are in-memory contents to lint instead of `file_or_dir`, keyed by their filename.
+    `respect_gitignore` finds files in git repos with `git ls-files`, skipping ignored files.
+    `profile` records where the time goes, if creating a session.
+    """
+    try:
+        if session is None:
+            session = LintSession(
+                exclude,
+                app_import_names,
+                extend_ignore,
+                qs_or_vs=qs_or_vs,
+                format=format,
+                cache=cache,
+                jobs=jobs,
+                respect_gitignore=respect_gitignore,
+                profile=profile,
+            )
+        if sources is not None:
+            errors_by_file = session.iter_sources(sources)
+        elif staged:
+            # git lists the files in excluded directories too, which a full run never walks into
+            errors_by_file = session.iter_sources(
+                _utils.git.read_staged(_utils.git.staged_files(file_or_dir)), check_parents=True
+            )
+        elif changed_since:
+            changed_files = _utils.git.changed_files(changed_since, file_or_dir)
+            errors_by_file = (
+                session.iter_paths(changed_files, check_parents=True) if changed_files else iter(())
+            )
+        else:
+            errors_by_file = session.iter_paths(file_or_dir)
+        # each file's violations are reported as it is checked, rather than all at the end
+        with session._timing("stages", "checking and reporting"), _utils.trace.span("lint"):
+            error_count = session.report(itertools.chain.from_iterable(errors_by_file))
+    except flake8.exceptions.Flake8Exception as e:
+        print("There was a critical error during execution of Flake8:")
+        print(e)
+        raise _Flake8Error(1)
+    finally:
+        if cache is not None:
+            cache.evict()
+    if error_count:
+        raise _Flake8Error(1)
+
+
+class _LintErrorCollector(flake8.formatting.base.BaseFormatter):
+    """flake8 formatter which keeps each reported violation as a :class:`LintError`."""
+
+    def after_init(self):
+        self.errors: typing.List[LintError] = []
+
+    def handle(self, error):
+        self.errors.append(
+            LintError(
+                file=error.filename,
+                line=error.line_number,
+                column=error.column_number,
+                code=error.code,
+                explanation=error.text,
+            )
+        )
+
+    def format(self, error):
+        return None  # nothing is rendered, see handle()
+
+
+# flake8-black reads the file from disk (or stdin), so we check in-memory sources ourselves
+_BLACK_PLUGIN_ENTRY_NAME = "BLK"
+
+
+def _check_black(source: str, mode) -> typing.Iterator[typing.Tuple[int, int, str, None]]:
+    """Generate the flake8-black violation for `source`, if any."""
+    # black reads files with universal newlines, so match that
+    source = source.replace("\r\n", "\n").replace("\r", "\n")
+    if not source:
+        return
+    try:
+        formatted = black.format_file_contents(source, fast=False, mode=mode)
+    except black.NothingChanged:
+        return
+    except black.InvalidInput:
+        yield 0, 0, "BLK901 Invalid input.", None
+        return
+    line, column = flake8_black.find_diff_start(source, formatted)
+    yield line + 1, column, "BLK100 Black would make changes.", None
+
+
+class _SourceFileChecker(flake8.checker.FileChecker):
+    """flake8 file checker which checks `source` rather than reading `filename` from disk."""
+
+    def __init__(self, *, source: str, **kwargs):
+        self._source = source
+        self._black_mode = _black_config.mode(kwargs["filename"].endswith(".pyi"))
+        super().__init__(**kwargs)
+
+    def _make_processor(self):
+        lines = io.StringIO(self._source).readlines()
+        return flake8.processor.FileProcessor(self.filename, self.options, lines=lines)
+
+    def run_check(self, plugin, **arguments):
+        if plugin.entry_name == _BLACK_PLUGIN_ENTRY_NAME:
+            return _check_black(self._source, self._black_mode)
+        return super().run_check(plugin, **arguments)
+
+
+class _ProfiledChecks:
+    """Mixin for flake8 file checkers, adding the time each plugin takes to `profile`.
+
+    Plugins may do their work as their results are iterated, so that is timed too.
+    """
+
+    def __init__(self, *, profile: _utils.profile.Profile, **kwargs):
+        self._profile = profile
+        super().__init__(**kwargs)
+
+    def run_check(self, plugin, **arguments):
+        package = plugin.plugin.package
+        with self._profile.time(self._profile.plugins, package):
+            result = super().run_check(plugin, **arguments)
+        if hasattr(result, "run"):  # a class plugin, which flake8 calls run() on
+            return _ProfiledRun(result, self._profile, package)
+        if isinstance(result, types.GeneratorType):
+            return _profiled_results(result, self._profile, package)
+        return result
+
+
+class _ProfiledRun:
+    def __init__(self, checker, profile: _utils.profile.Profile, package: str):
+        self._checker = checker
+        self._profile = profile
+        self._package = package
+
+    def run(self):
+        with self._profile.time(self._profile.plugins, self._package, calls=0):
+            results = self._checker.run()
+        return _profiled_results(results, self._profile, self._package)
+
+
+def _profiled_results(results, profile: _utils.profile.Profile, package: str):
+    results = iter(results)
+    while True:
+        with profile.time(profile.plugins, package, calls=0):
+            try:
+                result = next(results)
+            except StopIteration:
+                return
+        yield result
+
+
+class _ProfiledFileChecker(_ProfiledChecks, flake8.checker.FileChecker):
+    pass
+
+
+class _ProfiledSourceFileChecker(_ProfiledChecks, _SourceFileChecker):
+    pass
+
+
+_worker_session: typing.Optional["LintSession"] = None
+
+
+def _initialize_worker(session_args, profile: bool = False):
+    global _worker_session
+    _worker_session = LintSession(*session_args)
+    _worker_session._profile = _utils.profile.Profile() if profile else None
+
+
+def _check_in_worker(item: typing.Tuple[str, typing.Optional[str]]) -> typing.List[LintError]:
+    return _worker_session._check_file(*item)
+
+
+def _check_and_profile_in_worker(
+    item: typing.Tuple[str, typing.Optional[str]],
+) -> typing.Tuple[typing.List[LintError], _utils.profile.Profile]:
+    _worker_session._profile = _utils.profile.Profile()  # only this item's times
+    return _worker_session._check_file(*item), _worker_session._profile
+
+
+class _SerialChecks(contextlib.nullcontext):
+    """Checks each submitted item in this process, once its errors are asked for."""
+
+    lookahead = 0  # nothing is gained by reading ahead
+
+    def __init__(self, session: "LintSession"):
+        super().__init__(self)
+        self._session = session
+        self._items = collections.deque()
+
+    def submit(self, item: typing.Tuple[str, typing.Optional[str]]):
+        self._items.append(item)
+
+    def next(self) -> typing.List[LintError]:
+        return self._session._check_file(*self._items.popleft())
+
+
+class _PooledChecks:
+    """Checks the submitted items in worker processes, as they're submitted."""
+
+    _LOOKAHEAD_PER_JOB = 4
+
+    def __init__(self, session: "LintSession", jobs: int):
+        self._session = session
+        self._jobs = jobs
+        self.lookahead = jobs * self._LOOKAHEAD_PER_JOB
+        self._items = queue.Queue()
+        self._pool = None
+        self._results = None
+
+    def __enter__(self):
+        profile = self._session._profile is not None
+        self._pool = multiprocessing.Pool(
+            self._jobs,
+            initializer=_initialize_worker,
+            initargs=(self._session.session_args, profile),
+        ).__enter__()
+        # workers send back the errors (rather than printing), in the order they were sent
+        self._results = self._pool.imap(
+            _check_and_profile_in_worker if profile else _check_in_worker,
+            iter(self._items.get, None),
+        )
+        return self
+
+    def __exit__(self, *exc_info):
+        self._items.put(None)  # the pool waits for its task feeder to finish before stopping
+        return self._pool.__exit__(*exc_info)
+
+    def submit(self, item: typing.Tuple[str, typing.Optional[str]]):
+        self._items.put(item)
+
+    def next(self) -> typing.List[LintError]:
+        if self._session._profile is None:
+            return next(self._results)
+        errors_in_file, worker_profile = next(self._results)
+        self._session._profile.merge(worker_profile)
+        return errors_in_file
+
+
+class LintSession:
+    """Linter whose configuration, plugins and options are resolved once and reused for each check.
+
+    Creating a flake8 application re-reads the config and re-discovers the plugins, so reuse one
+    session for all of the checks made during a command.
+    """
+
+    def __init__(
+        self,
+        exclude,
+        app_import_names,
+        extend_ignore: typing.Optional[str],
+        *_,
+        qs_or_vs=None,
+        format=None,
+        cache: typing.Optional[_utils.cache.Cache] = None,
+        jobs: typing.Union[int, str] = 1,
+        respect_gitignore: bool = False,
+        profile: typing.Optional[_utils.profile.Profile] = None,
+    ):
+        """Resolves the flake8 configuration, plugins and options.
+
+        `qs_or_vs` and `format` only affect :meth:`report`.
+        `cache` is used to skip checking files which were already checked.
+        `jobs` is the number of worker processes to check files with (or "auto").
+        `respect_gitignore` finds files in git repos with `git ls-files`, skipping ignored files.
+        `profile` records the time spent loading plugins, finding files, and in each plugin/file.
+        """
+        self._session_args = (exclude, app_import_names, extend_ignore)
+        self._profile = profile
+        with self._timing("stages", "plugin loading"), _utils.trace.span("plugin loading"):
+            self._app = flake8.main.application.Application()
+            self._app.initialize(
+                _get_flake8_args(qs_or_vs, exclude, app_import_names, format, extend_ignore, [])
+            )
+        self._discovery = _utils.discovery.Discovery(
+            (*self._app.options.exclude, *self._app.options.extend_exclude),
+            filename_patterns=self._app.options.filename,
+            respect_gitignore=respect_gitignore,
+        )
+        self._collector = _LintErrorCollector(self._app.options)
+        self._guide = flake8.style_guide.StyleGuideManager(self._app.options, self._collector)
+        self._jobs = jobs
+        self._cache = cache
+        self._config_fingerprint = None
+        if cache is not None:
+            self._config_fingerprint = _utils.cache.fingerprint(
+                _config_constants.FLAKE8_CONFIG_FILE.read_bytes(),
+                _config_constants.BLACK_CONFIG_FILE.read_bytes(),
+                exclude or "",
+                app_import_names or "",
+                extend_ignore or "",
+                importlib.metadata.version("ni-python-styleguide"),
+                flake8.__version__,
+                self._app.plugins.versions_str(),
+                black.__version__,
+                sys.version,
+            )
+
+    @property
+    def session_args(self) -> typing.Tuple:
+        """The (exclude, app_import_names, extend_ignore) to create a session like this one with."""
+        return self._session_args
+
+    def check_paths(self, file_or_dir) -> typing.List[LintError]:
+        """Returns the errors found in the given file(s)/directory(s)."""
+        return self._flatten(self.iter_paths(file_or_dir))
+
+    def iter_paths(
+        self, file_or_dir, *_, check_parents: bool = False
+    ) -> typing.Iterator[typing.List[LintError]]:
+        """Yields the errors found in each file of the given file(s)/directory(s), as it's checked.
+
+        Files are yielded in the order they were found, even when checked in worker processes.
+        `check_parents` skips the given paths which are in excluded directories (e.g. for paths
+        listed by git).
+        """
+        with self._timing("stages", "discovery"), _utils.trace.span("discovery"):
+            filenames = list(self.files(file_or_dir, check_parents=check_parents))
+        return self._check_files([(filename, None) for filename in filenames])
+
+    def files(self, file_or_dir, *_, check_parents: bool = False) -> typing.Iterator[str]:
+        """Yields the files which would be checked for the given file(s)/directory(s)."""
+        return self._discovery.files(file_or_dir or ["."], check_parents=check_parents)
+
+    def check_source(self, text: str, filename: str) -> typing.List[LintError]:
+        """Returns the errors found in `text`, as if it were the contents of `filename`."""
+        return self._flatten(self._check_files([(str(filename), text)]))
+
+    def check_sources(self, sources: typing.Mapping[typing.Any, str]) -> typing.List[LintError]:
+        """Returns the errors found in each of `sources`, keyed by the filename to check them as.
+
+        Like :meth:`check_paths`, sources whose filename is excluded are not checked.
+        """
+        return self._flatten(self.iter_sources(sources))
+
+    def iter_sources(
+        self, sources: typing.Mapping[typing.Any, str], *_, check_parents: bool = False
+    ) -> typing.Iterator[typing.List[LintError]]:
+        """Yields the errors found in each of `sources` (see :meth:`check_sources`), in order.
+
+        `check_parents` skips the sources whose filename is in an excluded directory.
+        """
+        return self._check_files(self._source_items(sources, check_parents))
+
+    def _source_items(
+        self, sources: typing.Mapping[typing.Any, str], check_parents: bool = False
+    ) -> typing.List[typing.Tuple[str, str]]:
+        items = ((str(filename), text) for filename, text in sources.items())
+        return [
+            (name, text)
+            for name, text in items
+            if not self._discovery.is_excluded(name, check_parents=check_parents)
+        ]
+
+    @staticmethod
+    def _flatten(errors_by_file: typing.Iterable[typing.List[LintError]]) -> typing.List[LintError]:
+        return [error for errors_in_file in errors_by_file for error in errors_in_file]
+
+    def report(self, lint_errors: typing.Iterable[LintError]) -> int:
+        """Writes `lint_errors` to stdout using the chosen formatter, returning how many there were.
+
+        `lint_errors` may be a generator, each file's errors are written (and flushed) as soon as
+        the next file's errors (or the end) arrive.
+        """
+        error_count = 0
+        formatter = self._app.formatter
+        formatter.start()
+        for filename, errors_in_file in itertools.groupby(lint_errors, key=lambda o: o.file):
+            formatter.beginning(filename)
+            for error in errors_in_file:
+                formatter.handle(
+                    flake8.violation.Violation(
+                        error.code, error.file, error.line, error.column, error.explanation, None
+                    )
+                )
+                error_count += 1
+            formatter.finished(filename)
+            sys.stdout.flush()  # show progress on long runs, e.g. in CI logs
+        formatter.stop()
+        return error_count
+
+    def get_errors_to_process(self, file_or_dir, excluded_errors) -> _utils.lint.LintErrors:
+        """Get lint errors to process."""
+        return self._errors_to_process(
+            [(filename, None) for filename in self.files(file_or_dir)], excluded_errors
+        )
+
+    def get_source_errors_to_process(
+        self, sources: typing.Mapping[typing.Any, str], excluded_errors
+    ) -> _utils.lint.LintErrors:
+        """Get lint errors to process in `sources`, keyed by filename (see check_sources)."""
+        return self._errors_to_process(self._source_items(sources), excluded_errors)
+
+    def _errors_to_process(self, items, excluded_errors) -> _utils.lint.LintErrors:
+        # each file's errors are stored compactly as they are checked, not kept as a list
+        with _utils.trace.span("lint", files=len(items)):
+            lint_errors = _utils.lint.LintErrors(
+                error
+                for errors_in_file in self._check_files(items)
+                for error in errors_in_file
+                if error.code not in excluded_errors
+            )
+        return lint_errors.sorted(key=_default_report_order)
+
+    def _check_files(
+        self, items: typing.List[typing.Tuple[str, typing.Optional[str]]]
+    ) -> typing.Iterator[typing.List[LintError]]:
+        """Yields the errors in each (filename, source or None to read the file) item, in order.
+
+        Cached results are used where possible. Each item is looked up in the cache as its turn
+        comes and the misses are checked as they're found, so the first file's errors arrive
+        without reading the rest, and only the files in flight are held in memory.
+        """
+        with contextlib.ExitStack() as stack:
+            checks = None
+            pending = collections.deque()  # (filename, cache key, cached errors or None), in order
+            for index, (filename, source) in enumerate(items):
+                cache_key = self._cache_key(filename, source)
+                hit = self._cache.get(cache_key) if cache_key else None
+                if hit is None:
+                    if checks is None:
+                        checks = stack.enter_context(self._start_checks(len(items) - index))
+                    checks.submit((filename, source))
+                pending.append((filename, cache_key, hit))
+                while pending and (pending[0][2] is not None or len(pending) > checks.lookahead):
+                    yield self._finish_check(checks, *pending.popleft())
+            while pending:
+                yield self._finish_check(checks, *pending.popleft())
+
+    def _finish_check(self, checks, filename, cache_key, hit) -> typing.List[LintError]:
+        if hit is not None:
+            return [LintError(filename, *error) for error in hit]
+        errors_in_file = checks.next()
+        if cache_key:
+            self._cache.set(cache_key, [error[1:] for error in errors_in_file])
+        return errors_in_file
+
+    def _cache_key(self, filename: str, source: typing.Optional[str]) -> typing.Optional[str]:
+        if self._cache is None:
+            return None
         try:
-            lint(qs_or_vs, exclude, app_import_names, format, extend_ignore, file_or_dir)
-        except _Flake8Error:
-            pass
-    capture.seek(0)
-    return capture.read()
+            contents = (
+                pathlib.Path(filename).read_bytes()
+                if source is None
+                else source.encode(_utils.DEFAULT_ENCODING)
+            )
+        except OSError:
+            return None  # let the checker report why it can't be read
+        return _utils.cache.fingerprint(
+            self._config_fingerprint, os.path.abspath(filename), contents
+        )
+
+    def _start_checks(self, count: int) -> typing.ContextManager:
+        """Returns a checker for (up to) `count` items, using worker processes if useful."""
+        jobs = _utils.jobs.job_count(self._jobs, count)
+        if jobs == 1:
+            return _SerialChecks(self)
+        return _PooledChecks(self, jobs)
+
+    def _timing(self, table: str, key: str) -> typing.ContextManager:
+        """Times the `with` block into `table` of the profile, if profiling."""
+        if self._profile is None:
+            return contextlib.nullcontext()
+        return self._profile.time(getattr(self._profile, table), key)
+
+    def _check_file(self, filename: str, source: typing.Optional[str] = None):
+        with self._timing("files", filename), _utils.trace.span("check", file=filename):
+            return self._check_file_untimed(filename, source)
+
+    def _check_file_untimed(self, filename: str, source: typing.Optional[str]):
+        kwargs = dict(
+            filename=filename, plugins=self._app.plugins.checkers, options=self._app.options
+        )
+        profiled = self._profile is not None
+        if profiled:
+            kwargs["profile"] = self._profile
+        if source is None:
+            checker_class = _ProfiledFileChecker if profiled else flake8.checker.FileChecker
+            checker = checker_class(**kwargs)
+        else:
+            checker_class = _ProfiledSourceFileChecker if profiled else _SourceFileChecker
+            checker = checker_class(source=source, **kwargs)
+
+        self._collector.errors = []
+        if checker.should_process:
+            checker.run_checks()
+        filename = checker.display_name
+        with self._guide.processing_file(filename):
+            for code, line, column, text, physical_line in sorted(
+                checker.results, key=lambda o: (o[1], o[2])
+            ):
+                self._guide.handle_error(code, filename, line, column, text, physical_line)
+        return self._collector.errors
+
+
+def _default_report_order(error: LintError) -> str:
+    # keep the order of sorting the default report's lines, as it decides the order of codes
+    #  in generated acknowledgements
+    return f"{error.file}:{error.line}:{error.column}: {error.code} {error.explanation}"
+
+
+def get_errors_to_process(
+    exclude, app_import_names, extend_ignore: typing.Optional[str], file_or_dir, excluded_errors
+) -> _utils.lint.LintErrors:
+    """Get lint errors to process."""
+    session = LintSession(exclude, app_import_names, extend_ignore)
+    return session.get_errors_to_process(file_or_dir, excluded_errors)
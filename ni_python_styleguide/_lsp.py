@@ -0,0 +1,370 @@
+"""Language Server Protocol server, for editor integration.
+
+Open documents are linted in memory (including unsaved changes), and formatted with the same black
+and isort settings as the format command.
+"""
+
+import contextlib
+import importlib.metadata
+import json
+import os
+import pathlib
+import queue
+import sys
+import threading
+import time
+import traceback
+import typing
+import urllib.parse
+import urllib.request
+
+from ni_python_styleguide import _format, _lint
+from ni_python_styleguide._utils.lint import LintError
+
+_PARSE_ERROR = -32700
+_INVALID_REQUEST = -32600
+_METHOD_NOT_FOUND = -32601
+_INTERNAL_ERROR = -32603
+_SERVER_NOT_INITIALIZED = -32002
+_REQUEST_CANCELLED = -32800
+_REQUEST_FAILED = -32803
+
+_TEXT_DOCUMENT_SYNC_FULL = 1
+_SEVERITY_ERROR = 1
+_SEVERITY_WARNING = 2
+_MESSAGE_TYPE_ERROR = 1
+
+_SOURCE = "ni-python-styleguide"
+
+# put on the message queue in place of a message which isn't valid JSON
+_INVALID_MESSAGE = object()
+
+
+def serve(
+    reader: typing.BinaryIO,
+    writer: typing.BinaryIO,
+    *,
+    exclude: str,
+    app_import_names: str,
+    extend_ignore: typing.Optional[str] = None,
+    debounce: float = 0.3,
+) -> int:
+    """Serves LSP messages from `reader` until the client exits, and returns the exit code.
+
+    Edits are linted once no further edit arrives for `debounce` seconds.
+    """
+    return _Server(
+        reader,
+        writer,
+        exclude=exclude,
+        app_import_names=app_import_names,
+        extend_ignore=extend_ignore,
+        debounce=debounce,
+    ).serve()
+
+
+class _RequestFailed(Exception):
+    pass
+
+
+class _Document(typing.NamedTuple):
+    version: int
+    text: str
+
+
+def _read_message(reader: typing.BinaryIO):
+    """Returns the next message from `reader`, or None at the end of the stream.
+
+    A message whose length isn't a number is returned as `_INVALID_MESSAGE`, without its body.
+    """
+    content_length = None
+    while True:
+        header = reader.readline()
+        if not header:
+            return None
+        header = header.strip()
+        if not header:
+            if content_length is not None:
+                break
+            continue  # blank line between messages, or a message without a length
+        name, _, value = header.decode("ascii", errors="replace").partition(":")
+        if name.strip().lower() == "content-length":
+            value = value.strip()
+            content_length = int(value) if value.isdigit() else -1
+    if content_length < 0:
+        return _INVALID_MESSAGE  # the body can't be told apart from the next message's headers
+    body = reader.read(content_length)
+    try:
+        return json.loads(body.decode("utf-8"))
+    except ValueError:
+        return _INVALID_MESSAGE
+
+
+def _split_lines(text: str) -> typing.List[str]:
+    return [line.rstrip("\r") for line in text.split("\n")]
+
+
+def _diagnostic(error: LintError, lines: typing.List[str]) -> typing.Dict[str, typing.Any]:
+    line = max(error.line - 1, 0)
+    character = max(error.column - 1, 0)
+    end = len(lines[line]) if line < len(lines) else character
+    return {
+        "range": {
+            "start": {"line": line, "character": character},
+            "end": {"line": line, "character": max(end, character)},
+        },
+        # E9 means the file couldn't be read or parsed, so nothing else was checked
+        "severity": _SEVERITY_ERROR if error.code.startswith("E9") else _SEVERITY_WARNING,
+        "code": error.code,
+        "source": _SOURCE,
+        "message": error.explanation,
+    }
+
+
+def _filename(uri: str) -> str:
+    """Returns the filename to lint the document as, relative to the working directory."""
+    parsed = urllib.parse.urlparse(uri)
+    if parsed.scheme != "file":
+        return pathlib.PurePosixPath(parsed.path).name or "untitled.py"
+    path = urllib.request.url2pathname(parsed.path)
+    try:
+        return os.path.relpath(path)
+    except ValueError:  # on another drive
+        return path
+
+
+def _cancelled_id(message: typing.Dict[str, typing.Any]) -> typing.Union[int, str, None]:
+    """Returns the id of the request a `$/cancelRequest` cancels (None if it's malformed)."""
+    params = message.get("params")
+    request_id = params.get("id") if isinstance(params, dict) else None
+    return request_id if isinstance(request_id, (int, str)) else None
+
+
+class _Server:
+    def __init__(self, reader, writer, *, exclude, app_import_names, extend_ignore, debounce):
+        self._reader = reader
+        self._writer = writer
+        self._app_import_names = app_import_names
+        self._debounce = debounce
+        self._session = _lint.LintSession(exclude, app_import_names, extend_ignore, jobs=1)
+        self._messages: queue.Queue = queue.Queue()
+        self._documents: typing.Dict[str, _Document] = {}
+        # when each document with unlinted changes is due to be linted (by time.monotonic)
+        self._lint_due: typing.Dict[str, float] = {}
+        # the latest results for each document, with the version they are for
+        self._diagnostics: typing.Dict[str, typing.Tuple[int, typing.List]] = {}
+        self._edits: typing.Dict[str, typing.Tuple[int, typing.List]] = {}
+        self._cancelled: typing.Set[typing.Union[int, str]] = set()
+        self._initialized = False
+        self._shutdown = False
+        self._requests = {
+            "initialize": self._initialize,
+            "shutdown": self._shutdown_request,
+            "textDocument/formatting": self._formatting,
+        }
+        self._notifications = {
+            "textDocument/didOpen": self._did_open,
+            "textDocument/didChange": self._did_change,
+            "textDocument/didSave": self._did_save,
+            "textDocument/didClose": self._did_close,
+        }
+
+    def serve(self) -> int:
+        threading.Thread(target=self._read_messages, daemon=True).start()
+        while True:
+            try:
+                message = self._messages.get(timeout=self._time_until_lint_due())
+            except queue.Empty:
+                self._lint_due_documents()
+                continue
+            # Handle everything that has already arrived together, so that a cancellation (or a
+            # newer edit) behind a request is seen before the request is worked on.
+            batch = [message]
+            with contextlib.suppress(queue.Empty):
+                while True:
+                    batch.append(self._messages.get_nowait())
+            self._cancelled = {
+                _cancelled_id(message)
+                for message in batch
+                if isinstance(message, dict) and message.get("method") == "$/cancelRequest"
+            } - {None}
+            for message in batch:
+                if message is None or (
+                    isinstance(message, dict) and message.get("method") == "exit"
+                ):
+                    return 0 if self._shutdown else 1
+                self._dispatch(message)
+            self._lint_due_documents()
+
+    def _read_messages(self) -> None:
+        try:
+            while True:
+                message = _read_message(self._reader)
+                self._messages.put(message)
+                if message is None:
+                    return
+        except Exception:
+            traceback.print_exc(file=sys.stderr)
+            self._messages.put(None)  # as if the stream ended, so serve() doesn't wait forever
+
+    def _dispatch(self, message) -> None:
+        if message is _INVALID_MESSAGE or not isinstance(message, dict):
+            self._send({"id": None, "error": {"code": _PARSE_ERROR, "message": "Invalid JSON"}})
+            return
+        method = message.get("method")
+        params = message.get("params") or {}
+        if "id" not in message:
+            handler = self._notifications.get(method)
+            if handler is not None and self._initialized:
+                try:
+                    handler(params)
+                except Exception as e:  # there is no response to report it in, so log it
+                    traceback.print_exc(file=sys.stderr)
+                    self._notify(
+                        "window/logMessage",
+                        {"type": _MESSAGE_TYPE_ERROR, "message": f"Could not handle {method}: {e}"},
+                    )
+            return
+        if method is None:
+            return  # a response to a request we never send
+        request_id = message["id"]
+        handler = self._requests.get(method)
+        if request_id in self._cancelled:
+            self._send_error(request_id, _REQUEST_CANCELLED, "Request cancelled")
+        elif not self._initialized and method != "initialize":
+            self._send_error(request_id, _SERVER_NOT_INITIALIZED, "Server not initialized")
+        elif self._shutdown:
+            self._send_error(request_id, _INVALID_REQUEST, "Server is shutting down")
+        elif handler is None:
+            self._send_error(request_id, _METHOD_NOT_FOUND, f"Unsupported method {method!r}")
+        else:
+            try:
+                result = handler(params)
+            except _RequestFailed as e:
+                self._send_error(request_id, _REQUEST_FAILED, str(e))
+            except Exception as e:
+                traceback.print_exc(file=sys.stderr)
+                self._send_error(request_id, _INTERNAL_ERROR, str(e))
+            else:
+                self._send({"id": request_id, "result": result})
+
+    def _send(self, message: typing.Dict[str, typing.Any]) -> None:
+        body = json.dumps({"jsonrpc": "2.0", **message}).encode("utf-8")
+        self._writer.write(f"Content-Length: {len(body)}\r\n\r\n".encode("ascii") + body)
+        self._writer.flush()
+
+    def _send_error(self, request_id, code: int, message: str) -> None:
+        self._send({"id": request_id, "error": {"code": code, "message": message}})
+
+    def _notify(self, method: str, params: typing.Dict[str, typing.Any]) -> None:
+        self._send({"method": method, "params": params})
+
+    def _initialize(self, params):
+        self._initialized = True
+        return {
+            "capabilities": {
+                "textDocumentSync": {
+                    "openClose": True,
+                    "change": _TEXT_DOCUMENT_SYNC_FULL,
+                    "save": True,
+                },
+                "documentFormattingProvider": True,
+            },
+            "serverInfo": {
+                "name": _SOURCE,
+                "version": importlib.metadata.version("ni-python-styleguide"),
+            },
+        }
+
+    def _shutdown_request(self, params):
+        self._shutdown = True
+        return None
+
+    def _did_open(self, params) -> None:
+        document = params["textDocument"]
+        self._documents[document["uri"]] = _Document(document["version"], document["text"])
+        self._lint_due[document["uri"]] = 0  # lint straight away
+
+    def _did_change(self, params) -> None:
+        uri = params["textDocument"]["uri"]
+        # we only offer full document sync, so the last change holds the whole text
+        self._documents[uri] = _Document(
+            params["textDocument"]["version"], params["contentChanges"][-1]["text"]
+        )
+        self._lint_due[uri] = time.monotonic() + self._debounce
+
+    def _did_save(self, params) -> None:
+        uri = params["textDocument"]["uri"]
+        if uri in self._documents:
+            self._lint_due[uri] = 0
+
+    def _did_close(self, params) -> None:
+        uri = params["textDocument"]["uri"]
+        self._documents.pop(uri, None)
+        self._lint_due.pop(uri, None)
+        self._diagnostics.pop(uri, None)
+        self._edits.pop(uri, None)
+        self._notify("textDocument/publishDiagnostics", {"uri": uri, "diagnostics": []})
+
+    def _formatting(self, params):
+        uri = params["textDocument"]["uri"]
+        document = self._documents.get(uri)
+        if document is None:
+            raise _RequestFailed(f"{uri} is not open")
+        cached = self._edits.get(uri)
+        if cached is not None and cached[0] == document.version:
+            return cached[1]
+        try:
+            formatted = _format.format_source(
+                document.text, self._app_import_names, is_pyi=uri.endswith(".pyi")
+            )
+        except Exception as e:  # most likely the (unsaved) text isn't valid Python
+            raise _RequestFailed(f"Could not format {uri}: {e}")
+        edits = []
+        if formatted != document.text:
+            lines = _split_lines(document.text)
+            edits.append(
+                {
+                    "range": {
+                        "start": {"line": 0, "character": 0},
+                        "end": {"line": len(lines) - 1, "character": len(lines[-1])},
+                    },
+                    "newText": formatted,
+                }
+            )
+        self._edits[uri] = (document.version, edits)
+        return edits
+
+    def _time_until_lint_due(self) -> typing.Optional[float]:
+        if not self._lint_due:
+            return None
+        return max(0, min(self._lint_due.values()) - time.monotonic())
+
+    def _lint_due_documents(self) -> None:
+        now = time.monotonic()
+        for uri, due in list(self._lint_due.items()):
+            if due <= now:
+                del self._lint_due[uri]
+                self._lint(uri)
+
+    def _lint(self, uri: str) -> None:
+        document = self._documents[uri]
+        cached = self._diagnostics.get(uri)
+        if cached is not None and cached[0] == document.version:
+            return  # already published
+        try:
+            errors = self._session.check_sources({_filename(uri): document.text})
+        except Exception as e:
+            traceback.print_exc(file=sys.stderr)
+            self._notify(
+                "window/logMessage",
+                {"type": _MESSAGE_TYPE_ERROR, "message": f"Could not lint {uri}: {e}"},
+            )
+            return
+        lines = _split_lines(document.text)
+        diagnostics = [_diagnostic(error, lines) for error in errors]
+        self._diagnostics[uri] = (document.version, diagnostics)
+        self._notify(
+            "textDocument/publishDiagnostics",
+            {"uri": uri, "version": document.version, "diagnostics": diagnostics},
+        )
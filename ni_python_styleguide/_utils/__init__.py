@@ -1,6 +1,12 @@
+from ni_python_styleguide._utils import cache  # noqa: F401
 from ni_python_styleguide._utils import code_analysis  # noqa: F401
+from ni_python_styleguide._utils import discovery  # noqa: F401
+from ni_python_styleguide._utils import git  # noqa: F401
+from ni_python_styleguide._utils import jobs  # noqa: F401
 from ni_python_styleguide._utils import lint  # noqa: F401
+from ni_python_styleguide._utils import profile  # noqa: F401
 from ni_python_styleguide._utils import string_helpers  # noqa: F401
 from ni_python_styleguide._utils import temp_file  # noqa: F401
+from ni_python_styleguide._utils import trace  # noqa: F401
 
 DEFAULT_ENCODING = "UTF-8"
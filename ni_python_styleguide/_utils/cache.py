@@ -0,0 +1,124 @@
+import contextlib
+import hashlib
+import json
+import os
+import pathlib
+import sys
+import tempfile
+import typing
+
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024  # bytes
+
+_ENTRY_SUFFIX = ".json"
+
+
+def default_cache_dir() -> pathlib.Path:
+    """Returns the per-user directory to cache results in."""
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or pathlib.Path.home() / "AppData" / "Local"
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or pathlib.Path.home() / ".cache"
+    return pathlib.Path(base) / "ni-python-styleguide"
+
+
+def fingerprint(*parts: typing.Union[str, bytes]) -> str:
+    """Returns a digest which changes when any of `parts` change."""
+    digest = hashlib.sha256()
+    for part in parts:
+        data = part if isinstance(part, bytes) else part.encode("utf-8")
+        digest.update(len(data).to_bytes(8, "little"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class CacheStats(typing.NamedTuple):
+    """Summary of the contents of a :class:`Cache`."""
+
+    directory: pathlib.Path
+    entries: int
+    size: int
+
+
+class Cache:
+    """On-disk store of JSON values, keyed by digest (see :func:`fingerprint`).
+
+    Reading an entry marks it as used, and :meth:`evict` removes the least recently used entries
+    until the cache fits in `max_size` bytes.
+    """
+
+    def __init__(self, directory: pathlib.Path, max_size: int = DEFAULT_MAX_SIZE):
+        """Uses (and will create if needed) `directory` to store entries."""
+        self.directory = pathlib.Path(directory)
+        self.max_size = max_size
+        self._added = False
+
+    def get(self, key: str) -> typing.Any:
+        """Returns the value stored for `key`, or None if there is none."""
+        path = self._path_for(key)
+        try:
+            value = json.loads(path.read_bytes())
+            os.utime(path)  # mark as recently used
+        except (OSError, ValueError):
+            return None
+        return value
+
+    def set(self, key: str, value: typing.Any) -> None:
+        """Stores `value` for `key`."""
+        path = self._path_for(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # write then rename, so concurrent runs never see a partial entry
+            fd, temp_name = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            with os.fdopen(fd, "wb") as temp_file:
+                temp_file.write(json.dumps(value, separators=(",", ":")).encode("utf-8"))
+            os.replace(temp_name, path)
+        except OSError:
+            return  # the cache is only an optimization
+        self._added = True
+
+    def evict(self) -> None:
+        """Removes the least recently used entries until the cache is within its size limit."""
+        if not self._added:
+            return
+        entries = []
+        for path in self._entry_paths():
+            with contextlib.suppress(OSError):
+                stat = path.stat()
+                entries.append((stat.st_mtime, stat.st_size, path))
+        size = sum(entry_size for _, entry_size, _ in entries)
+        for _, entry_size, path in sorted(entries):
+            if size <= self.max_size:
+                break
+            with contextlib.suppress(OSError):
+                path.unlink()
+                size -= entry_size
+        self._added = False
+
+    def stats(self) -> CacheStats:
+        """Returns the number of entries in, and size of, the cache."""
+        entries = size = 0
+        for path in self._entry_paths():
+            with contextlib.suppress(OSError):
+                size += path.stat().st_size
+                entries += 1
+        return CacheStats(directory=self.directory, entries=entries, size=size)
+
+    def clear(self) -> None:
+        """Removes all entries from the cache."""
+        for path in self._entry_paths():
+            with contextlib.suppress(OSError):
+                path.unlink()
+        for root, _, _ in sorted(os.walk(self.directory), reverse=True):
+            with contextlib.suppress(OSError):
+                os.rmdir(root)
+
+    def _path_for(self, key: str) -> pathlib.Path:
+        return self.directory / key[:2] / (key + _ENTRY_SUFFIX)
+
+    def _entry_paths(self) -> typing.Iterator[pathlib.Path]:
+        if not self.directory.is_dir():
+            return
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(_ENTRY_SUFFIX):
+                    yield pathlib.Path(root, name)
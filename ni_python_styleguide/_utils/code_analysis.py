@@ -1,6 +1,15 @@
 import ast
 import pathlib
-from typing import Tuple
+from typing import NamedTuple, Tuple
+
+
+def _is_string_statement(node: ast.stmt) -> bool:
+    """Whether `node` is a bare string, e.g. a docstring (ast.Str was removed in Python 3.14)."""
+    return (
+        isinstance(node, ast.Expr)
+        and isinstance(node.value, ast.Constant)
+        and isinstance(node.value.value, str)
+    )
 
 
 def find_import_region(file: pathlib.Path) -> Tuple[int, int]:
@@ -14,13 +23,45 @@ def find_import_region(file: pathlib.Path) -> Tuple[int, int]:
     file_contents = file.read_text(
         encoding="utf-8"
     )  # can't use DEFAULT_ENCODING here due to possible circular imports
-    tree = ast.parse(file_contents)
+    return find_source_import_region(file_contents)
+
+
+def find_source_import_region(source: str) -> Tuple[int, int]:
+    """Returns the region of module level imports in `source`, see `find_import_region`."""
+    tree = ast.parse(source)
     end = start = 0
     for node in tree.body:  # only walk top level items
-        if isinstance(node, ast.Expr) and isinstance(node.value, ast.Str):
+        if _is_string_statement(node):
             continue
         if isinstance(node, ast.Import) or isinstance(node, ast.ImportFrom):
             continue
         end = node.lineno - 1
         break
     return start, end
+
+
+class ModuleImports(NamedTuple):
+    """Where the module level imports which precede any other code are (1-based lines)."""
+
+    first_line: int
+    """The first line of the first import, or 0 if there are none."""
+    last_line: int
+    """The last line of the last import, or 0 if there are none."""
+    code_line: int
+    """The first line of the code which follows them, or 0 if nothing does."""
+
+
+def find_source_imports(source: str) -> ModuleImports:
+    """Returns where the module level imports (before any other code) in `source` are."""
+    first_line = last_line = code_line = 0
+    for node in ast.parse(source).body:  # only walk top level items
+        if _is_string_statement(node):
+            continue
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            first_line = first_line or node.lineno
+            last_line = node.end_lineno
+            continue
+        # a decorated definition starts at its first decorator
+        code_line = min([node.lineno, *(o.lineno for o in getattr(node, "decorator_list", []))])
+        break
+    return ModuleImports(first_line, last_line, code_line)
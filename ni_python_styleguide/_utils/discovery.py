@@ -0,0 +1,181 @@
+"""Finding the files to check, following flake8's exclude rules."""
+
+import fnmatch
+import os
+import re
+import typing
+
+from ni_python_styleguide._utils import git
+
+DEFAULT_FILENAME_PATTERNS = ("*.py",)
+
+# flake8's default --exclude, for finding files without setting up flake8
+FLAKE8_DEFAULT_EXCLUDE = ".svn,CVS,.bzr,.hg,.git,__pycache__,.tox,.nox,.eggs,*.egg"
+
+
+def parse_patterns(value: str) -> typing.List[str]:
+    """Splits a comma-separated list of exclude patterns, normalizing them like flake8.
+
+    Patterns containing a path separator are made absolute, relative to the working directory.
+    """
+    parent = os.path.abspath(os.curdir)
+    patterns = []
+    for pattern in re.split(r"[,\s]", value):
+        pattern = pattern.strip()
+        if not pattern:
+            continue
+        separators = os.path.sep + (os.path.altsep or "")
+        if pattern == "." or any(separator in pattern for separator in separators):
+            pattern = os.path.abspath(os.path.join(parent, pattern))
+        patterns.append(pattern.rstrip(separators))
+    return patterns
+
+
+def _compile(patterns: typing.Iterable[str]) -> typing.Optional[typing.Pattern[str]]:
+    """Compiles glob patterns into one regular expression, or None if there are no patterns."""
+    translated = [f"(?:{fnmatch.translate(os.path.normcase(pattern))})" for pattern in patterns]
+    return re.compile("|".join(translated)) if translated else None
+
+
+def _sort_key(entry: os.DirEntry) -> str:
+    # Listing each directory in this order yields the paths in the same order as sorting them
+    # (a directory "a" sorts as "a/", so "a/b.py" comes after "a.py", as it does as a string).
+    return entry.name + os.sep if _is_dir(entry) else entry.name
+
+
+def _is_dir(entry: os.DirEntry) -> bool:
+    try:
+        return entry.is_dir()
+    except OSError:
+        return False
+
+
+class Discovery:
+    """Finds the files to check under some files and directories.
+
+    The exclude patterns are compiled once, and excluded directories are skipped without listing
+    their contents. A path is excluded if a pattern matches its name or its absolute path, the same
+    as flake8's `--exclude`.
+    """
+
+    def __init__(
+        self,
+        exclude: typing.Iterable[str],
+        *_,
+        filename_patterns: typing.Iterable[str] = DEFAULT_FILENAME_PATTERNS,
+        respect_gitignore: bool = False,
+    ):
+        """Compiles the (already normalized, see `parse_patterns`) exclude patterns.
+
+        `filename_patterns` select which files in directories are checked.
+        `respect_gitignore` lists directories inside git repos with `git ls-files`, which skips the
+        files git ignores without visiting them.
+        """
+        self._exclude = _compile(exclude)
+        self._filename = _compile(filename_patterns)
+        self._respect_gitignore = respect_gitignore
+
+    def is_excluded(self, path: str, *_, check_parents: bool = False) -> bool:
+        """Returns True if `path` matches an exclude pattern.
+
+        With `check_parents`, `path` is also excluded if one of its parent directories (within the
+        working directory) is, e.g. for paths listed by git rather than found in a directory.
+        """
+        if self._matches(path):
+            return True
+        return check_parents and self._is_in_excluded_cwd_dir(path, {})
+
+    def files(
+        self, file_or_dir: typing.Iterable, *_, check_parents: bool = False
+    ) -> typing.Iterator[str]:
+        """Yields the files to check for each of the given file(s)/directory(s).
+
+        Files given directly are yielded (unless excluded) even if they don't match the filename
+        patterns. The files in each directory are yielded in sorted order.
+        `check_parents` also excludes the given paths in excluded directories (see `is_excluded`).
+        """
+        excluded_dirs: typing.Dict[str, bool] = {}
+        for path in file_or_dir:
+            path = str(path)
+            if self._matches(path) or (
+                check_parents and self._is_in_excluded_cwd_dir(path, excluded_dirs)
+            ):
+                continue
+            if not os.path.isdir(path):
+                yield path
+                continue
+            files = self._git_files(path) if self._respect_gitignore else None
+            yield from self._walk(path) if files is None else files
+
+    def _matches(self, path: str) -> bool:
+        if self._exclude is None:
+            return False
+        name = os.path.basename(path)
+        if name not in {".", ".."} and self._exclude.match(os.path.normcase(name)):
+            return True
+        return bool(self._exclude.match(os.path.normcase(os.path.abspath(path))))
+
+    def _is_in_excluded_cwd_dir(self, path: str, excluded_dirs: typing.Dict[str, bool]) -> bool:
+        """Returns True if a parent directory of `path` (in the working directory) is excluded."""
+        if os.path.isabs(path):
+            try:
+                path = os.path.relpath(path)
+            except ValueError:
+                return False  # on another drive
+            if path == os.pardir or path.startswith(os.pardir + os.sep):
+                return False
+        return self._is_in_excluded_dir(path, excluded_dirs)
+
+    def _is_in_excluded_dir(
+        self, path: str, excluded_dirs: typing.Dict[str, bool], top: str = ""
+    ) -> bool:
+        """Returns True if a parent directory of (relative) `path`, below `top`, is excluded.
+
+        `excluded_dirs` caches the directories already checked.
+        """
+        parent = os.path.dirname(path)
+        if parent in (top, path, "", os.curdir) or os.path.basename(parent) == os.pardir:
+            return False
+        if parent not in excluded_dirs:
+            excluded_dirs[parent] = self._matches(parent) or self._is_in_excluded_dir(
+                parent, excluded_dirs, top
+            )
+        return excluded_dirs[parent]
+
+    def _is_checked_file(self, path: str) -> bool:
+        return self._filename is None or bool(self._filename.match(os.path.normcase(path)))
+
+    def _walk(self, directory: str) -> typing.Iterator[str]:
+        try:
+            with os.scandir(directory) as entries:
+                entries = sorted(entries, key=_sort_key)
+        except OSError:
+            return  # like os.walk, skip directories which can't be listed
+        for entry in entries:
+            path = os.path.join(directory, entry.name)
+            if self.is_excluded(path):
+                continue
+            if _is_dir(entry):
+                if not entry.is_symlink():  # like os.walk, don't follow links to directories
+                    yield from self._walk(path)
+            elif self._is_checked_file(path):
+                yield path
+
+    def _git_files(self, directory: str) -> typing.Optional[typing.List[str]]:
+        """Returns the files in `directory` which git doesn't ignore, or None if git can't tell."""
+        try:
+            names = git.listed_files(directory)
+        except git.GitError:
+            return None  # not in a git repo (or git is missing)
+        excluded_dirs: typing.Dict[str, bool] = {}
+        files = []
+        for name in set(names):  # unmerged files are listed once per stage
+            path = os.path.join(directory, os.path.normpath(name))
+            if (
+                self._is_checked_file(path)
+                and not self._matches(path)
+                and not self._is_in_excluded_dir(path, excluded_dirs, top=directory)
+                and os.path.isfile(path)  # tracked files may have been deleted
+            ):
+                files.append(path)
+        return sorted(files)
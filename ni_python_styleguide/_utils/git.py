@@ -0,0 +1,104 @@
+import io
+import pathlib
+import re
+import subprocess
+import typing
+
+from ni_python_styleguide._utils import string_helpers
+
+
+class GitError(Exception):
+    """Raised when git fails (or is missing)."""
+
+
+def _run(*args: str, input: typing.Optional[bytes] = None) -> bytes:
+    try:
+        process = subprocess.run(["git", *args], input=input, capture_output=True, check=True)
+    except FileNotFoundError as e:
+        raise GitError("git was not found, it is required to select files by git status") from e
+    except subprocess.CalledProcessError as e:
+        raise GitError(e.stderr.decode(errors="replace").strip()) from e
+    return process.stdout
+
+
+def _split_names(output: bytes) -> typing.List[str]:
+    return [name for name in output.decode("utf-8").split("\0") if name]
+
+
+def _python_files(names: typing.Iterable[str]) -> typing.List[pathlib.Path]:
+    return sorted({pathlib.Path(name) for name in names if name.endswith(".py")})
+
+
+def changed_files(ref: str, file_or_dir=()) -> typing.List[pathlib.Path]:
+    """Returns the Python files under the current directory which changed since `ref`.
+
+    This includes untracked (but not ignored) files, as those are changes too.
+    Deleted files are not included.
+    """
+    pathspec = [str(p) for p in file_or_dir]
+    changed = _run(
+        "diff", "--name-only", "--diff-filter=ACMR", "--relative", "-z", ref, "--", *pathspec
+    )
+    untracked = _run("ls-files", "--others", "--exclude-standard", "-z", "--", *pathspec)
+    return _python_files(_split_names(changed) + _split_names(untracked))
+
+
+_HUNK_HEADER = re.compile(rb"^@@ -\S+ \+(?P<start>\d+)(?:,(?P<count>\d+))? @@", re.MULTILINE)
+
+
+def changed_line_ranges(
+    ref: str, file: pathlib.Path
+) -> typing.Optional[typing.List[typing.Tuple[int, int]]]:
+    """Returns the (1-based, inclusive) ranges of lines in `file` which changed since `ref`.
+
+    Returns None if git doesn't know `file` (it is untracked), so all of it is new.
+    Where lines were only removed, the line before the removal is included.
+    """
+    output = _run("diff", "-U0", "--no-color", "--no-ext-diff", ref, "--", str(file))
+    if not output:
+        return None
+    ranges = []
+    for match in _HUNK_HEADER.finditer(output):
+        start = int(match.group("start"))
+        count = 1 if match.group("count") is None else int(match.group("count"))
+        if count == 0:
+            ranges.append((max(start, 1), max(start, 1)))
+        else:
+            ranges.append((start, start + count - 1))
+    return ranges
+
+
+def staged_files(file_or_dir=()) -> typing.List[pathlib.Path]:
+    """Returns the Python files under the current directory which are staged for commit."""
+    pathspec = [str(p) for p in file_or_dir]
+    staged = _run(
+        "diff", "--cached", "--name-only", "--diff-filter=ACMR", "--relative", "-z", "--", *pathspec
+    )
+    return _python_files(_split_names(staged))
+
+
+def listed_files(directory) -> typing.List[str]:
+    """Returns the files under `directory` which git tracks or doesn't ignore, relative to it."""
+    output = _run(
+        "-C", str(directory), "ls-files", "--cached", "--others", "--exclude-standard", "-z"
+    )
+    return _split_names(output)
+
+
+def read_staged(files: typing.Sequence[pathlib.Path]) -> typing.Dict[pathlib.Path, str]:
+    """Returns the contents of each of `files` (relative to the current directory) in the index."""
+    if not files:
+        return {}
+    prefix = _run("rev-parse", "--show-prefix").decode("utf-8").strip()
+    object_names = "".join(f":{prefix}{file.as_posix()}\n" for file in files)
+    output = io.BytesIO(_run("cat-file", "--batch", input=object_names.encode("utf-8")))
+
+    contents = {}
+    for file in files:
+        header = output.readline().split()
+        if len(header) != 3:  # "<object name> missing"
+            raise GitError(f"{file} is not in the index")
+        data = output.read(int(header[2]))
+        output.readline()  # each object is followed by a newline
+        contents[file] = string_helpers.decode_source(data)
+    return contents
@@ -0,0 +1,15 @@
+import os
+import typing
+
+# below this many items per worker, starting the workers costs more than they save
+MIN_ITEMS_PER_JOB = 20
+
+
+def job_count(jobs: typing.Union[int, str], item_count: int) -> int:
+    """Returns the number of worker processes to process `item_count` items (e.g. files) with.
+
+    `jobs` is either a number of jobs, or "auto" to choose from the CPU and item counts.
+    """
+    if jobs == "auto":
+        jobs = min(os.cpu_count() or 1, item_count // MIN_ITEMS_PER_JOB)
+    return max(1, min(int(jobs), item_count))
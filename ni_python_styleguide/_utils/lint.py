@@ -1,28 +1,12 @@
+import array
+import collections.abc
+import functools
+import json
 import logging
 import re
 import typing
 
-from ni_python_styleguide import _lint
-
-
-def get_errors_to_process(
-    exclude, app_import_names, extend_ignore: typing.Optional[str], file_or_dir, excluded_errors
-):
-    """Get lint errors to process."""
-    lint_errors = sorted(
-        _lint.get_lint_output(
-            format=None,
-            qs_or_vs=None,
-            exclude=exclude,
-            app_import_names=app_import_names,
-            extend_ignore=extend_ignore,
-            file_or_dir=file_or_dir,
-        ).splitlines()
-    )
-    parsed_errors = map(parse, lint_errors)
-    parsed_errors = list(filter(None, parsed_errors))
-    lint_errors_to_process = [error for error in parsed_errors if error.code not in excluded_errors]
-    return lint_errors_to_process
+_module_logger = logging.getLogger(__name__)
 
 
 class LintError(typing.NamedTuple):
@@ -35,6 +19,142 @@ class LintError(typing.NamedTuple):
     explanation: str
 
 
+class _Table:
+    """Strings stored once each, numbered in the order they were added."""
+
+    def __init__(self):
+        self.values: typing.List[str] = []
+        self._indices: typing.Dict[str, int] = {}
+
+    def index(self, value: str) -> int:
+        """Returns the number of `value`, adding it if it is new."""
+        index = self._indices.get(value)
+        if index is None:
+            index = self._indices[value] = len(self.values)
+            self.values.append(value)
+        return index
+
+    def get(self, value: str) -> typing.Optional[int]:
+        """Returns the number of `value`, or None if it was never added."""
+        return self._indices.get(value)
+
+
+class LintErrors(collections.abc.Sequence):
+    """Compact, ordered collection of :class:`LintError`, for runs with very many violations.
+
+    The lines and columns are kept in arrays, and each file, code and explanation is stored once
+    (violations refer to them by number). Iterating yields :class:`LintError` as it goes, and the
+    violations in each file (or with each code) can be looked up without scanning them all.
+    """
+
+    def __init__(self, errors: typing.Iterable[LintError] = ()):
+        """Stores `errors`, in order."""
+        self._files = _Table()
+        self._codes = _Table()
+        self._explanations = _Table()
+        self._file_ids = array.array("I")
+        self._lines = array.array("I")
+        self._columns = array.array("i")  # reports may have negative columns
+        self._code_ids = array.array("I")
+        self._explanation_ids = array.array("I")
+        self._rows_by_file: typing.List[array.array] = []
+        self._rows_by_code: typing.List[array.array] = []
+        self.extend(errors)
+
+    def append(self, error: LintError) -> None:
+        """Adds `error` after the errors already stored."""
+        row = len(self._lines)
+        file_id = self._files.index(error.file)
+        code_id = self._codes.index(error.code)
+        if file_id == len(self._rows_by_file):
+            self._rows_by_file.append(array.array("I"))
+        if code_id == len(self._rows_by_code):
+            self._rows_by_code.append(array.array("I"))
+        self._file_ids.append(file_id)
+        self._lines.append(error.line)
+        self._columns.append(error.column)
+        self._code_ids.append(code_id)
+        self._explanation_ids.append(self._explanations.index(error.explanation))
+        self._rows_by_file[file_id].append(row)
+        self._rows_by_code[code_id].append(row)
+
+    def extend(self, errors: typing.Iterable[LintError]) -> None:
+        """Adds each of `errors`, in order."""
+        for error in errors:
+            self.append(error)
+
+    def __len__(self) -> int:
+        """Returns the number of errors stored."""
+        return len(self._lines)
+
+    def __getitem__(self, index):
+        """Returns the error at `index` (or a list of them, for a slice)."""
+        if isinstance(index, slice):
+            return [self._error(row) for row in range(len(self))[index]]
+        return self._error(range(len(self))[index])
+
+    def __iter__(self) -> typing.Iterator[LintError]:
+        """Yields each error, in order."""
+        return map(self._error, range(len(self)))
+
+    @property
+    def files(self) -> typing.List[str]:
+        """The files with errors, in the order their first error was added."""
+        return list(self._files.values)
+
+    @property
+    def codes(self) -> typing.List[str]:
+        """The codes of the errors, in the order their first error was added."""
+        return list(self._codes.values)
+
+    def in_file(self, file: str) -> typing.Sequence[LintError]:
+        """Returns the errors in `file`, in order."""
+        file_id = self._files.get(file)
+        return _Rows(self, array.array("I") if file_id is None else self._rows_by_file[file_id])
+
+    def with_code(self, code: str) -> typing.Sequence[LintError]:
+        """Returns the errors with `code`, in order."""
+        code_id = self._codes.get(code)
+        return _Rows(self, array.array("I") if code_id is None else self._rows_by_code[code_id])
+
+    def by_file(self) -> typing.Iterator[typing.Tuple[str, typing.Sequence[LintError]]]:
+        """Yields each file with errors, and its errors."""
+        for file, rows in zip(self._files.values, self._rows_by_file):
+            yield file, _Rows(self, rows)
+
+    def sorted(self, key: typing.Callable[[LintError], typing.Any]) -> "LintErrors":
+        """Returns the errors in a new collection, sorted by `key`."""
+        return LintErrors(self[row] for row in sorted(range(len(self)), key=lambda o: key(self[o])))
+
+    def _error(self, row: int) -> LintError:
+        return LintError(
+            self._files.values[self._file_ids[row]],
+            self._lines[row],
+            self._columns[row],
+            self._codes.values[self._code_ids[row]],
+            self._explanations.values[self._explanation_ids[row]],
+        )
+
+
+class _Rows(collections.abc.Sequence):
+    """Some of the errors in a :class:`LintErrors`, by their (ascending) row numbers."""
+
+    def __init__(self, errors: LintErrors, rows: array.array):
+        self._errors = errors
+        self._rows = rows
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._errors[row] for row in self._rows[index]]
+        return self._errors[self._rows[index]]
+
+    def __iter__(self) -> typing.Iterator[LintError]:
+        return map(self._errors.__getitem__, self._rows)
+
+
 def parse(line):
     r"""
     Parses line into :class:`LintError`.
@@ -51,8 +171,7 @@ def parse(line):
     >>> parse(r"./tests/test_cli/acknowledge_existing_errors_test_cases__snapshots/doc_line_tests/expected_output.py:1:1: D100 Missing docstring in public module")
     LintError(file='./tests/test_cli/acknowledge_existing_errors_test_cases__snapshots/doc_line_tests/expected_output.py', line=1, column=1, code='D100', explanation='Missing docstring in public module')
     """  # NOQA W505: doc line too long (115 > 100 characters)
-    p = Parser()
-    return p.parse(line)
+    return _PARSER.parse(line)
 
 
 class Parser:
@@ -70,7 +189,7 @@ class Parser:
             column=int(column),
             code=code,
             explanation=explanation,
-            **kwargs
+            **kwargs,
         )
 
     def parse(self, line):
@@ -81,8 +200,122 @@ class Parser:
         :rtype: LintError
         """
         data = Parser.__MATCHER.search(line)
-        logging.debug("parsing line: %s, yielded %s", line, data)
+        if _module_logger.isEnabledFor(logging.DEBUG):
+            _module_logger.debug("parsing line: %s, yielded %s", line, data)
         if not data:
             return None
         result = Parser._to_lint_error(**data.groupdict())
         return result
+
+
+_PARSER = Parser()
+
+# flake8's built-in report formats
+REPORT_FORMATS = {
+    "default": "%(path)s:%(row)d:%(col)d: %(code)s %(text)s",
+    "pylint": "%(path)s:%(row)d: [%(code)s] %(text)s",
+}
+
+# how each of flake8's format fields is matched (fields not listed here are matched, not kept)
+_FIELD_PATTERNS = {
+    "path": r"(?P<file>.+?)",
+    "row": r"(?P<line>\d+)",
+    "col": r"(?P<column>-?\d+)",
+    "code": r"(?P<code>\w+)",
+    "text": r"(?P<explanation>.*?)",
+}
+
+_FORMAT_FIELD = re.compile(r"%(?:\((?P<name>\w+)\))?[-#0 +]*\d*(?:\.\d+)?(?P<type>[sdr%])")
+
+# reports are read (and matched) this many characters at a time
+_REPORT_BLOCK_SIZE = 1 << 20
+
+
+@functools.lru_cache(maxsize=None)
+def _report_matcher(format: str) -> typing.Pattern[str]:
+    """Compiles a regular expression matching each line a flake8 `--format` string produces."""
+    pattern = []
+    end = 0
+    for field in _FORMAT_FIELD.finditer(format):
+        pattern.append(re.escape(format[end : field.start()]))
+        if field.group("type") == "%":
+            pattern.append("%")
+        else:
+            pattern.append(_FIELD_PATTERNS.get(field.group("name"), r".*?"))
+        end = field.end()
+    pattern.append(re.escape(format[end:]))
+    matcher = re.compile("^" + "".join(pattern) + r"[ \t]*\r?$", re.MULTILINE)
+    missing = {"file", "line", "code"} - set(matcher.groupindex)
+    if missing:
+        raise ValueError(
+            f"Can't parse a report with format {format!r}, it has no {sorted(missing)}"
+        )
+    return matcher
+
+
+def parse_report(
+    report: typing.Union[str, typing.TextIO], *_, format: typing.Optional[str] = None
+) -> LintErrors:
+    r"""Parses a whole flake8 report, returning its violations in (file, line, column) order.
+
+    `report` is the report's text, or a file to read it from (a block at a time).
+    `format` is the `--format` flake8 wrote it with: a built-in format ("default" or "pylint"),
+    "json" (as written by flake8-json), or a `%(path)s:%(row)d:...` format string. Lines which
+    don't match the format are skipped, and violations without a column have column 0.
+
+    >>> list(parse_report("b.py:10:1: D100 Missing docstring\nb.py:9:5: E501 line too long\n"))
+    [LintError(file='b.py', line=9, column=5, code='E501', explanation='line too long'), LintError(file='b.py', line=10, column=1, code='D100', explanation='Missing docstring')]
+    """  # noqa: W505 - the doctest's output is one line
+    format = format or "default"
+    if format in {"json", "json-pretty"}:
+        lint_errors = _parse_json_report(report)
+    else:
+        matcher = _report_matcher(REPORT_FORMATS.get(format, format))
+        lint_errors = LintErrors(
+            _match_to_lint_error(match)
+            for block in _report_blocks(report)
+            for match in matcher.finditer(block)
+        )
+    return lint_errors.sorted(key=lambda error: (error.file, error.line, error.column))
+
+
+def _match_to_lint_error(match: typing.Match[str]) -> LintError:
+    fields = match.groupdict()
+    return LintError(
+        fields["file"],
+        int(fields["line"]),
+        int(fields.get("column") or 0),
+        fields["code"],
+        fields.get("explanation") or "",
+    )
+
+
+def _report_blocks(report: typing.Union[str, typing.TextIO]) -> typing.Iterator[str]:
+    """Yields `report` in blocks of whole lines."""
+    if isinstance(report, str):
+        yield report
+        return
+    pending = ""
+    for chunk in iter(lambda: report.read(_REPORT_BLOCK_SIZE), ""):
+        pending += chunk
+        end = pending.rfind("\n") + 1
+        if end:
+            yield pending[:end]
+            pending = pending[end:]
+    yield pending
+
+
+def _parse_json_report(report: typing.Union[str, typing.TextIO]) -> LintErrors:
+    """Parses a report from flake8-json, which maps each file to a list of its violations."""
+    data = json.loads(report) if isinstance(report, str) else json.load(report)
+    return LintErrors(
+        LintError(
+            violation.get("filename", filename),
+            violation["line_number"],
+            violation.get("column_number") or 0,
+            violation["code"],
+            violation.get("text", ""),
+        )
+        for filename, violations in data.items()
+        for violation in violations
+    )
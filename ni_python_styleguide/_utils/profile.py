@@ -0,0 +1,92 @@
+"""Timing where a run spends its time, for `lint --profile`."""
+
+import contextlib
+import json
+import time
+import typing
+
+# (wall seconds, CPU seconds, calls)
+_Times = typing.List[typing.Union[float, int]]
+
+
+class Profile:
+    """Wall and CPU time spent in each stage, plugin and file of a run."""
+
+    def __init__(self):
+        """Starts with nothing timed."""
+        self.stages: typing.Dict[str, _Times] = {}
+        self.plugins: typing.Dict[str, _Times] = {}
+        self.files: typing.Dict[str, _Times] = {}
+
+    @contextlib.contextmanager
+    def time(
+        self, table: typing.Dict[str, _Times], key: str, *_, calls: int = 1
+    ) -> typing.Iterator[None]:
+        """Adds the time spent in the `with` block to `key` in `table` (e.g. `self.stages`).
+
+        `calls` is the number of calls to count, e.g. 0 when timing more of a call already counted.
+        """
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            add(table, key, time.perf_counter() - wall, time.process_time() - cpu, calls)
+
+    def merge(self, other: "Profile") -> None:
+        """Adds the times in `other` (e.g. from a worker process) to this profile."""
+        for table, other_table in [
+            (self.stages, other.stages),
+            (self.plugins, other.plugins),
+            (self.files, other.files),
+        ]:
+            for key, (wall, cpu, calls) in other_table.items():
+                add(table, key, wall, cpu, calls)
+
+    def to_dict(self, slowest_files: int) -> typing.Dict[str, typing.Any]:
+        """Returns the profile as JSON-compatible data, with only the slowest files."""
+        files = sorted(self.files.items(), key=lambda item: item[1][0], reverse=True)
+        return {
+            "stages": {key: _times_dict(times) for key, times in self.stages.items()},
+            "plugins": {
+                key: _times_dict(times)
+                for key, times in sorted(self.plugins.items(), key=lambda o: o[1][0], reverse=True)
+            },
+            "slowest_files": [
+                dict(file=file, **_times_dict(times)) for file, times in files[:slowest_files]
+            ],
+        }
+
+    def to_json(self, slowest_files: int) -> str:
+        """Returns the profile as JSON (see :meth:`to_dict`)."""
+        return json.dumps(self.to_dict(slowest_files), indent=2)
+
+    def to_table(self, slowest_files: int) -> str:
+        """Returns the profile as text tables, slowest first within each table."""
+        data = self.to_dict(slowest_files)
+        rows = [("Stage", data["stages"].items()), ("Plugin", data["plugins"].items())]
+        rows.append(("File", [(times.pop("file"), times) for times in data["slowest_files"]]))
+        lines = []
+        for heading, items in rows:
+            items = list(items)
+            width = max([len(heading), *(len(key) for key, _ in items)])
+            lines.append(f"{heading:<{width}}  {'Wall (s)':>9}  {'CPU (s)':>9}  {'Calls':>9}")
+            for key, times in items:
+                lines.append(
+                    f"{key:<{width}}  {times['wall']:>9.3f}  {times['cpu']:>9.3f}"
+                    f"  {times['calls']:>9}"
+                )
+            lines.append("")
+        return "\n".join(lines)
+
+
+def add(table: typing.Dict[str, _Times], key: str, wall: float, cpu: float, calls: int = 1):
+    """Adds `calls` calls taking `wall` and `cpu` seconds to `key` in `table`."""
+    times = table.setdefault(key, [0.0, 0.0, 0])
+    times[0] += wall
+    times[1] += cpu
+    times[2] += calls
+
+
+def _times_dict(times: _Times) -> typing.Dict[str, typing.Union[float, int]]:
+    wall, cpu, calls = times
+    return {"wall": round(wall, 6), "cpu": round(cpu, 6), "calls": calls}
@@ -1,9 +1,17 @@
+import io
 import pathlib
+import tokenize
 from typing import List, Optional
 
 import ni_python_styleguide._utils
 
 
+def decode_source(data: bytes) -> str:
+    """Decodes Python source using its declared encoding (or UTF-8), like Python would."""
+    encoding, _ = tokenize.detect_encoding(io.BytesIO(data).readline)
+    return data.decode(encoding)
+
+
 class InMultiLineStringChecker:
     """Provide utility methods to decide if line is within a multiline string."""
 
@@ -1,19 +1,25 @@
+import os
 import pathlib
+import shutil
 import tempfile
-from contextlib import contextmanager
+from contextlib import suppress
 
 
-@contextmanager
-def multi_access_tempfile(suffix=".txt", delete=True):
-    """Tempfile that has been created and closed and will be deleted after this context.
+def atomic_write_bytes(file, data: bytes) -> None:
+    """Replaces the contents of `file` with `data`, so it is never seen partly written.
 
-    Used to allow writing to a temp file multiple times.
+    `data` is written to a temp file in the same directory (with the same permissions as `file`),
+    which is then renamed over `file`.
     """
-    temp = tempfile.NamedTemporaryFile(suffix=suffix, delete=False)
-    temp.close()
-    temp_path = pathlib.Path(temp.name)
+    file = pathlib.Path(os.path.realpath(file))  # replace a symlink's target, not the link
+    fd, temp_name = tempfile.mkstemp(prefix=f".{file.name}.", suffix=".tmp", dir=file.parent)
     try:
-        yield temp_path
-    finally:
-        if delete:
-            temp_path.unlink()
+        with os.fdopen(fd, "wb") as temp:
+            temp.write(data)
+        with suppress(OSError):
+            shutil.copymode(file, temp_name)
+        os.replace(temp_name, file)
+    except BaseException:
+        with suppress(OSError):
+            os.unlink(temp_name)
+        raise
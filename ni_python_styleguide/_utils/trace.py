@@ -0,0 +1,130 @@
+"""Recording nested spans in Chrome's Trace Event format, for `--trace-file`.
+
+Each process (including worker processes) appends its spans to its own file as they end, so
+spans from workers which are stopped without exiting cleanly are kept. When the run finishes,
+the main process merges them into the trace file, which can be loaded into chrome://tracing,
+Perfetto or speedscope.
+"""
+
+import contextlib
+import json
+import os
+import pathlib
+import shutil
+import tempfile
+import threading
+import time
+import typing
+
+# where the processes of a traced run write their spans, inherited by worker processes
+_TRACE_DIR_ENV_VAR = "NI_PYTHON_STYLEGUIDE_TRACE_DIR"
+
+_NO_SPAN = contextlib.nullcontext()
+
+
+class _Tracer:
+    """Writes the spans of one process to its own file in `directory`."""
+
+    def __init__(self, directory: str, process_name: str):
+        self.pid = os.getpid()
+        self._file = open(
+            os.path.join(directory, f"{self.pid}.jsonl"), "a", encoding="utf-8", buffering=1
+        )
+        self._write({"name": "process_name", "ph": "M", "args": {"name": process_name}})
+
+    @contextlib.contextmanager
+    def span(self, name: str, args: typing.Dict[str, typing.Any]) -> typing.Iterator[None]:
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.add_span(name, start, time.perf_counter_ns(), args)
+
+    def add_span(self, name: str, start: int, end: int, args=None) -> None:
+        event = {"name": name, "ph": "X", "ts": start / 1000, "dur": (end - start) / 1000}
+        if args:
+            event["args"] = {key: str(value) for key, value in args.items()}
+        self._write(event)
+
+    def close(self) -> None:
+        self._file.close()
+
+    def _write(self, event: typing.Dict[str, typing.Any]) -> None:
+        event.update(pid=self.pid, tid=threading.get_native_id())
+        self._file.write(json.dumps(event) + "\n")  # line buffered, so each span is flushed
+
+
+_tracer: typing.Optional[_Tracer] = None
+
+
+def _current() -> typing.Optional[_Tracer]:
+    """Returns this process' tracer, starting one in worker processes of a traced run."""
+    global _tracer
+    if _tracer is not None and _tracer.pid == os.getpid():
+        return _tracer
+    directory = os.environ.get(_TRACE_DIR_ENV_VAR)
+    if not directory:
+        return None
+    try:
+        _tracer = _Tracer(directory, "worker")  # also replaces a tracer inherited by a fork
+    except OSError:
+        # the traced run already finished (and removed the directory), so don't trace
+        os.environ.pop(_TRACE_DIR_ENV_VAR, None)
+        _tracer = None
+    return _tracer
+
+
+def untraced_environment() -> typing.Dict[str, str]:
+    """Returns the environment for starting processes which aren't part of this run's trace."""
+    return {name: value for name, value in os.environ.items() if name != _TRACE_DIR_ENV_VAR}
+
+
+def is_enabled() -> bool:
+    """Returns True if this run is being traced."""
+    return _current() is not None
+
+
+def span(name: str, **args) -> typing.ContextManager:
+    """Records the `with` block as a span named `name`, with `args` shown in its details."""
+    tracer = _current()
+    if tracer is None:
+        return _NO_SPAN
+    return tracer.span(name, args)
+
+
+def add_span(name: str, start: int, end: int, **args) -> None:
+    """Records a span which already happened, between two `time.perf_counter_ns()` times."""
+    tracer = _current()
+    if tracer is not None:
+        tracer.add_span(name, start, end, args)
+
+
+class Trace:
+    """Traces the rest of a run (in this and its worker processes) into a trace file."""
+
+    def __init__(self, trace_file: pathlib.Path, name: str):
+        """Starts tracing, recording the whole run as a span named `name`."""
+        global _tracer
+        self._trace_file = pathlib.Path(trace_file)
+        self._name = name
+        self._directory = tempfile.mkdtemp(prefix=".nps-trace-", dir=self._trace_file.parent)
+        os.environ[_TRACE_DIR_ENV_VAR] = self._directory
+        _tracer = _Tracer(self._directory, "nps")
+        self._start = time.perf_counter_ns()
+
+    def finish(self) -> None:
+        """Stops tracing, and writes the spans of every process to the trace file."""
+        global _tracer
+        add_span(self._name, self._start, time.perf_counter_ns())
+        _tracer.close()
+        _tracer = None
+        del os.environ[_TRACE_DIR_ENV_VAR]
+        try:
+            events = []
+            for part in sorted(pathlib.Path(self._directory).glob("*.jsonl")):
+                with part.open(encoding="utf-8") as lines:
+                    events.extend(json.loads(line) for line in lines if line.endswith("\n"))
+            with self._trace_file.open("w", encoding="utf-8") as trace:
+                json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, trace)
+        finally:
+            shutil.rmtree(self._directory, ignore_errors=True)
@@ -2,6 +2,8 @@
 
 import os
 import pathlib
+import shutil
+import subprocess
 
 import click.testing
 import pytest
@@ -26,14 +28,16 @@ def styleguide(monkeypatch, cli_runner):
     representing success or failure.
 
     E.g. `styleguide("lint", ".")`
+
+    `input` is passed to the styleguide's stdin.
     """
     # Add a __bool__ method so clients can assert the result
     monkeypatch.setattr(
         click.testing.Result, "__bool__", lambda s: s.exception is None, raising=False
     )
 
-    def runner(*args):
-        return cli_runner.invoke(styleguide_main, list(map(str, args)))
+    def runner(*args, input=None):
+        return cli_runner.invoke(styleguide_main, list(map(str, args)), input=input)
 
     return runner
 
@@ -46,14 +50,22 @@ def styleguide_command(styleguide, chdir, tmp_path):
     and passed on the cmd line in the following order: `<cmd> <base_args> <command> <command_args>.
     """
 
-    def runner(*, base_args=[], command="", command_args=[]):
-        return styleguide(*base_args, command, *command_args)
+    def runner(*, base_args=[], command="", command_args=[], input=None):
+        return styleguide(*base_args, command, *command_args, input=input)
 
     chdir(str(tmp_path))
 
     yield runner
 
 
+@pytest.fixture(autouse=True)
+def cache_dir(monkeypatch, tmp_path_factory):
+    """Keeps each test's cached results out of the user's cache directory (and other tests)."""
+    directory = tmp_path_factory.mktemp("cache")
+    monkeypatch.setenv("NI_PYTHON_STYLEGUIDE_CACHE_DIR", str(directory))
+    return directory
+
+
 @pytest.fixture
 def chdir():
     """Changes the current working directory when executed."""
@@ -83,3 +95,21 @@ def force_ascii_encoding(monkeypatch):
     monkeypatch.setattr(pathlib.Path, "write_text", ascii_write_text)
 
     yield None
+
+
+@pytest.fixture
+def git(tmp_path):
+    """Initializes a git repo in tmp_path and provides a function to run git commands in it."""
+    if shutil.which("git") is None:
+        pytest.skip("git is not installed")
+
+    def run(*args):
+        subprocess.run(
+            ["git", "-c", "user.name=nps", "-c", "user.email=nps@example.com", *args],
+            cwd=tmp_path,
+            check=True,
+            capture_output=True,
+        )
+
+    run("init", "-q", ".")
+    return run
@@ -1,10 +1,14 @@
 """Tests for the "acknowledge-existing-errors" subcommand of ni-python-styleguide."""
 
+import json
+import os
 import pathlib
 import shutil
 
 import pytest
 
+from ni_python_styleguide import _lint, _utils
+
 MODULE_DIR = pathlib.Path(__file__).parent.absolute()
 TEST_CASE_DIR = MODULE_DIR / "acknowledge_existing_errors_test_cases__snapshots"
 
@@ -100,3 +104,124 @@ def test_given_folder_with_multiple_files_acknowledged__does_not_error(
     output = styleguide_command(command="lint", command_args=[])
 
     assert output.exit_code in (True, 0), f"Error in running:\n{output.output}\n\n"
+
+
+def test_given_bad_input__aggressive__writes_each_file_once(
+    tmp_path, styleguide_command, monkeypatch
+):
+    """Tests acknowledging converges in memory, writing each file only once."""
+    shutil.copyfile(TEST_CASE_DIR / "doc_line_tests" / "input.py", tmp_path / "input.py")
+    written = []
+    atomic_write_bytes = _utils.temp_file.atomic_write_bytes
+    monkeypatch.setattr(
+        _utils.temp_file,
+        "atomic_write_bytes",
+        lambda file, data: written.append(file) or atomic_write_bytes(file, data),
+    )
+
+    output = styleguide_command(
+        base_args=["-v"],
+        command="acknowledge-existing-violations",
+        command_args=["--aggressive"],
+    )
+
+    assert output.exit_code in (True, 0), f"Error in running:\n{output}"
+    assert written == [pathlib.Path("input.py")]
+    assert "input.py: acknowledged in " in output.output
+
+
+@pytest.mark.parametrize("cmd_args", [[], ["--aggressive"]], ids=["normal", "aggressive"])
+def test_given_folder_with_multiple_files__lints_files_together(
+    cmd_args, tmp_path, styleguide_command, chdir, monkeypatch
+):
+    """Tests each re-lint checks all of the files which need it at once, not each file alone."""
+    in_dir = MODULE_DIR / "acknowledge_existing_errors_multiple_files" / "input"
+    shutil.copytree(in_dir, tmp_path / "input")
+    chdir(tmp_path)
+    lint_calls = []
+    check_files = _lint.LintSession._check_files
+    monkeypatch.setattr(
+        _lint.LintSession,
+        "_check_files",
+        lambda self, items: lint_calls.append(len(items)) or check_files(self, items),
+    )
+
+    output = styleguide_command(command="acknowledge-existing-violations", command_args=cmd_args)
+
+    assert output.exit_code in (True, 0), f"Error in running:\n{output}"
+    # the first lint finds the errors, then each pass re-lints the files still being handled
+    assert lint_calls[:2] == [3, 3]
+    assert lint_calls == sorted(lint_calls, reverse=True)
+    assert len(lint_calls) % 2 == 0
+
+
+@pytest.mark.parametrize("cmd_args", [[], ["--aggressive"]], ids=["normal", "aggressive"])
+def test_given_folder_with_multiple_files__acknowledge_with_jobs__matches_serial_run(
+    cmd_args, tmp_path, styleguide_command, chdir
+):
+    """Tests acknowledging files in worker processes gives the same files as a serial run."""
+    in_dir = MODULE_DIR / "acknowledge_existing_errors_multiple_files" / "input"
+    chdir(tmp_path)
+    results = {}
+    for jobs in ["1", "2"]:
+        shutil.rmtree(tmp_path / "input", ignore_errors=True)
+        shutil.copytree(in_dir, tmp_path / "input")
+
+        output = styleguide_command(
+            command="acknowledge-existing-violations", command_args=[*cmd_args, "--jobs", jobs]
+        )
+
+        assert output.exit_code in (True, 0), f"Error in running:\n{output}"
+        results[jobs] = {
+            file.name: file.read_text(encoding="utf-8") for file in (tmp_path / "input").iterdir()
+        }
+
+    assert results["2"] == results["1"]
+    assert results["1"] != {
+        file.name: file.read_text(encoding="utf-8") for file in in_dir.iterdir()
+    }
+
+
+def test_given_folder_with_multiple_files__aggressive_with_trace_file__records_each_pass(
+    tmp_path, styleguide_command, chdir
+):
+    """Tests that --trace-file records each aggressive pass, including in worker processes."""
+    in_dir = MODULE_DIR / "acknowledge_existing_errors_multiple_files" / "input"
+    shutil.copytree(in_dir, tmp_path / "input")
+    chdir(tmp_path)
+    trace_file = tmp_path / "trace.json"
+
+    output = styleguide_command(
+        base_args=["--trace-file", trace_file],
+        command="acknowledge-existing-violations",
+        command_args=["--aggressive", "--jobs", "2"],
+    )
+
+    assert output.exit_code in (True, 0), f"Error in running:\n{output}"
+    events = json.loads(trace_file.read_text())["traceEvents"]
+    spans = [event for event in events if event["ph"] == "X"]
+    names = {span["name"] for span in spans}
+    assert {"acknowledge", "suppress errors", "handle emergent violations", "black"} <= names
+    passes = [span for span in spans if span["name"] == "aggressive pass"]
+    assert passes
+    assert all(span["pid"] != os.getpid() for span in passes)  # in the worker processes
+
+
+def test_given_file_which_cannot_be_formatted__acknowledge_with_jobs__reports_failure(
+    tmp_path, styleguide_command, chdir
+):
+    """Tests files which fail in worker processes are reported together, in file order."""
+    chdir(tmp_path)
+    for index in range(4):
+        (tmp_path / f"module_{index}.py").write_text("import os\n", encoding="utf-8")
+    for index in (1, 3):
+        (tmp_path / f"module_{index}.py").write_text("print 'spam'\n", encoding="utf-8")
+
+    output = styleguide_command(
+        command="acknowledge-existing-violations", command_args=["--aggressive", "--jobs", "2"]
+    )
+
+    assert isinstance(output.exception, RuntimeError)
+    message = str(output.exception)
+    assert "Could not format file module_1.py" in message
+    assert message.index("module_1.py") < message.index("module_3.py")
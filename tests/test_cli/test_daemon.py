@@ -0,0 +1,146 @@
+"""Tests for the "daemon" subcommand of ni-python-styleguide."""
+
+import threading
+
+import pytest
+
+from ni_python_styleguide import _daemon
+
+TOO_LONG_LINE = "a_really_long_order = [" + ", ".join(['"spam"'] * 10) + "]\n"
+
+pytestmark = pytest.mark.skipif(not _daemon.is_supported(), reason="needs Unix domain sockets")
+
+
+@pytest.fixture
+def daemon(cache_dir):
+    """Serves requests from a daemon thread for the duration of the test."""
+    path = _daemon.socket_path(cache_dir)
+    thread = threading.Thread(target=_daemon.serve, args=(path,), daemon=True)
+    thread.start()
+    while thread.is_alive() and _daemon.status(path) is None:
+        thread.join(0.01)
+    yield path
+    _daemon.stop(path)
+    thread.join()
+
+
+def test_daemon__lint__matches_in_process_output(styleguide_command, tmp_path, daemon):
+    """Tests that linting through the daemon reports the same as linting in-process."""
+    (tmp_path / "spam.py").write_text(TOO_LONG_LINE)
+    expected = styleguide_command(command="lint", command_args=["--no-daemon"])
+
+    result = styleguide_command(command="lint")
+
+    assert result.exit_code == expected.exit_code != 0
+    assert result.output == expected.output
+    assert _daemon.status(daemon)["requests"] == 1
+
+
+def test_daemon__lint__reuses_session(styleguide_command, tmp_path, daemon):
+    """Tests that repeated lints with the same options share one session in the daemon."""
+    (tmp_path / "spam.py").write_text('"""Spam."""\n')
+
+    for _ in range(3):
+        result = styleguide_command(command="lint")
+        assert result, result.output
+
+    assert _daemon.status(daemon)["sessions"] == 1
+
+
+def test_daemon__format__formats_file(styleguide_command, tmp_path, daemon):
+    """Tests that formatting through the daemon rewrites the file."""
+    (tmp_path / "spam.py").write_text('"""Spam."""\n\nx = {"a":1}\n')
+
+    result = styleguide_command(command="format")
+
+    assert result, result.output
+    assert (tmp_path / "spam.py").read_text() == '"""Spam."""\n\nx = {"a": 1}\n'
+    assert _daemon.status(daemon)["requests"] == 1
+
+
+def test_daemon__environment_changed__stops_and_runs_in_process(
+    styleguide_command, tmp_path, daemon, monkeypatch
+):
+    """Tests that a daemon stops instead of answering once its config or plugins change."""
+    (tmp_path / "spam.py").write_text(TOO_LONG_LINE)
+    monkeypatch.setattr(_daemon, "_environment_fingerprint", lambda: "changed")
+
+    result = styleguide_command(command="lint")
+
+    assert not result
+    assert "spam.py" in result.output
+    assert _daemon.status(daemon) is None
+
+
+@pytest.fixture
+def cwd_on_sys_path(tmp_path, monkeypatch):
+    """Puts the working directory on sys.path, as `python -m` does for the daemon process."""
+    monkeypatch.syspath_prepend(str(tmp_path))
+
+
+def test_daemon__file_created_in_working_directory__keeps_serving(
+    cwd_on_sys_path, styleguide_command, tmp_path, daemon
+):
+    """Tests that creating files where the daemon started doesn't make it stop as stale."""
+    (tmp_path / "spam.py").write_text('"""Spam."""\n')
+    assert styleguide_command(command="lint")
+
+    (tmp_path / "new_file.txt").write_text("")
+    result = styleguide_command(command="lint")
+
+    assert result, result.output
+    assert _daemon.status(daemon)["requests"] == 2
+
+
+def test_daemon__stale_socket__runs_in_process(styleguide_command, tmp_path, cache_dir):
+    """Tests that a socket left behind by a dead daemon is ignored."""
+    _daemon.socket_path(cache_dir).write_text("")
+    (tmp_path / "spam.py").write_text(TOO_LONG_LINE)
+
+    result = styleguide_command(command="lint")
+
+    assert not result
+    assert "spam.py" in result.output
+
+
+def test_daemon__status_and_stop(styleguide, daemon):
+    """Tests the status and stop commands report on and stop a running daemon."""
+    status_result = styleguide("daemon", "status")
+    stop_result = styleguide("daemon", "stop")
+    stopped_status_result = styleguide("daemon", "status")
+
+    assert f"Socket: {daemon}" in status_result.output, status_result.output
+    assert stop_result.output == "Daemon stopped\n"
+    assert stopped_status_result.output == "Daemon not running\n"
+
+
+def test_daemon__lint_stdin__matches_in_process_output(styleguide_command, daemon):
+    """Tests that linting stdin through the daemon lints the text sent from the client."""
+    args = ["--stdin-display-name", "spam.py", "-"]
+    expected = styleguide_command(command="lint", command_args=["--no-daemon", *args], input="x=1")
+
+    result = styleguide_command(command="lint", command_args=args, input="x=1")
+
+    assert result.output == expected.output
+    assert "spam.py:1:1: D100" in result.output
+    assert _daemon.status(daemon)["requests"] == 1
+
+
+def test_daemon__start__does_not_inherit_trace_directory(cache_dir, tmp_path, monkeypatch):
+    """Tests that a daemon started by a traced run isn't traced into the run's trace directory."""
+    monkeypatch.setenv("NI_PYTHON_STYLEGUIDE_TRACE_DIR", str(tmp_path))
+    started = {}
+
+    class _ExitedProcess:
+        def __init__(self, args, **kwargs):
+            started.update(kwargs)
+
+        def poll(self):
+            return 1
+
+    monkeypatch.setattr(_daemon.subprocess, "Popen", _ExitedProcess)
+
+    with pytest.raises(_daemon.DaemonError):
+        _daemon.start(_daemon.socket_path(cache_dir), idle_timeout=0)
+
+    assert "NI_PYTHON_STYLEGUIDE_TRACE_DIR" not in started["env"]
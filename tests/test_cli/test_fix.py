@@ -1,10 +1,14 @@
 """Tests for the "fix" subcommand of ni-python-styleguide."""
 
+import os
 import pathlib
 import shutil
+import tempfile
 
 import pytest
 
+from ni_python_styleguide import _fix
+
 TEST_CASE_DIR = pathlib.Path(__file__).parent.absolute() / "fix_test_cases__snapshots"
 
 TEST_CASES = [x for x in TEST_CASE_DIR.iterdir() if x.is_dir() and (x / "input.py").is_file()]
@@ -62,3 +66,84 @@ def test_given_bad_input__fix__produces_expected_output_aggressive(
     result = test_file.read_text(encoding="UTF-8")
     snapshot.snapshot_dir = test_dir
     snapshot.assert_match(result, "output__aggressive.py")
+
+
+def test_given_formatted_file_with_lint_errors__fix__does_not_write_file(
+    tmp_path, styleguide_command
+):
+    """Tests that fix leaves files it doesn't change untouched, keeping their mtime."""
+    test_file = tmp_path / "spam.py"
+    test_file.write_text("def spam():\n    pass\n", encoding="utf-8")  # missing docstrings
+    os.utime(test_file, ns=(1_000_000_000, 1_000_000_000))
+
+    output = styleguide_command(command="fix")
+
+    assert output.exit_code in (True, 0), f"Error in running:\n{output}"
+    assert test_file.stat().st_mtime_ns == 1_000_000_000
+
+
+def test_given_bad_input__fix__is_idempotent(tmp_path, styleguide_command):
+    """Tests that fixing a fixed file changes nothing, as isort and black run until stable."""
+    test_file = tmp_path / "input.py"
+    shutil.copyfile(TEST_CASE_DIR / "basic_example" / "input.py", test_file)
+    styleguide_command(command="fix")
+    fixed = test_file.read_text(encoding="utf-8")
+
+    styleguide_command(command="fix")
+
+    assert test_file.read_text(encoding="utf-8") == fixed
+
+
+@pytest.mark.parametrize("command_args", [[], ["--aggressive"]], ids=["default", "aggressive"])
+def test_given_many_bad_files__fix_with_jobs__matches_serial_run(
+    tmp_path, styleguide_command, command_args
+):
+    """Tests fixing files in worker processes gives the same output and files as a serial run."""
+    inputs = {f"module_{index}.py": f"import os\nx = {{'a':{index}}}\n" for index in range(6)}
+    results = {}
+    for jobs in ["1", "3"]:
+        for name, text in inputs.items():
+            (tmp_path / name).write_text(text, encoding="utf-8")
+
+        output = styleguide_command(command="fix", command_args=[*command_args, "--jobs", jobs])
+
+        assert output.exit_code in (True, 0), f"Error in running:\n{output}"
+        files = {name: (tmp_path / name).read_text(encoding="utf-8") for name in inputs}
+        results[jobs] = (output.stdout, files)
+
+    assert results["3"] == results["1"]
+
+
+def test_given_many_bad_files__fix_diff_with_jobs__prints_diffs_in_serial_order(
+    tmp_path, chdir, capsys
+):
+    """Tests that diffs made in worker processes are printed in the same order as a serial run."""
+    chdir(tmp_path)
+    for index in range(6):
+        (tmp_path / f"module_{index}.py").write_text(f"x = {{'a':{index}}}\n", encoding="utf-8")
+    outputs = []
+    for jobs in [1, 3]:
+        _fix.fix("__pycache__", "", None, ["."], diff=True, jobs=jobs)
+        outputs.append(capsys.readouterr().out)
+
+    assert outputs[1] == outputs[0]
+    assert outputs[0].index("module_0.py") < outputs[0].index("module_5.py")
+
+
+def test_given_bad_file__fix_check__works_in_memory(tmp_path, chdir, capsys, monkeypatch):
+    """Tests that checking files neither writes them nor makes temp copies of them."""
+    chdir(tmp_path)
+    test_file = tmp_path / "spam.py"
+    test_file.write_text("x = {'a':1}\n", encoding="utf-8")
+
+    def fail(*args, **kwargs):
+        raise AssertionError("made a temp file")
+
+    monkeypatch.setattr(tempfile, "NamedTemporaryFile", fail)
+    monkeypatch.setattr(tempfile, "mkstemp", fail)
+
+    with pytest.raises(Exception, match="File would be changed"):
+        _fix.fix("__pycache__", "", None, ["."], diff=True, check=True, jobs=1)
+
+    assert "-x = {'a':1}" in capsys.readouterr().out
+    assert test_file.read_text(encoding="utf-8") == "x = {'a':1}\n"
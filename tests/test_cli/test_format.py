@@ -1,12 +1,16 @@
 """Tests for the "acknowledge-existing-errors" subcommand of ni-python-styleguide."""
 
+import dataclasses
 import pathlib
 import shutil
 import typing
 
+import flake8_black
 import pytest
 from pytest_snapshot.plugin import Snapshot
 
+from ni_python_styleguide import _black_config, _config_constants, _format
+
 TEST_CASE_DIR = pathlib.Path(__file__).parent.absolute() / "format_test_cases__snapshots"
 
 
@@ -67,3 +71,243 @@ def test_given_bad_input_file__check_mode__fails(
     output = styleguide_command(command="format", command_args=command_args)
 
     assert output.exception is not None, f"Should error running:\n{output}"
+
+
+@pytest.mark.parametrize(
+    "test_dir", [x for x in TEST_CASE_DIR.iterdir() if x.is_dir()], ids=lambda o: o.name
+)
+def test_given_input_on_stdin__writes_expected_output_to_stdout(
+    test_dir, snapshot: Snapshot, tmp_path: pathlib.Path, styleguide_command: callable
+):
+    """Tests formatting stdin gives the same output as formatting the file, without writing."""
+    output = styleguide_command(
+        command="format", command_args=["-"], input=(test_dir / "input.py").read_bytes()
+    )
+
+    assert output.exception is None, output.output
+    assert not any(tmp_path.iterdir())
+    snapshot.snapshot_dir = test_dir
+    snapshot.assert_match(output.stdout_bytes.decode("utf-8"), "output.py")
+
+
+def test_given_crlf_input_on_stdin__keeps_line_endings(styleguide_command: callable):
+    """Tests formatting stdin writes the same line endings it read."""
+    output = styleguide_command(
+        command="format", command_args=["-"], input=b'import sys\r\nimport os\r\nx = {"a":1}\r\n'
+    )
+
+    assert output.stdout_bytes == b'import os\r\nimport sys\r\n\r\nx = {"a": 1}\r\n'
+
+
+def test_given_bad_input_on_stdin__check_mode__fails(styleguide_command: callable):
+    """Tests check mode fails on unformatted stdin, reporting the display name."""
+    output = styleguide_command(
+        command="format",
+        command_args=["--check", "--stdin-display-name", "spam.py", "-"],
+        input=b"x = {'a':1}\n",
+    )
+
+    assert output.exception is not None, f"Should error running:\n{output}"
+    assert "spam.py" in output.stdout
+
+
+def test_given_many_files__jobs__diff_matches_serial_run(
+    tmp_path: pathlib.Path, styleguide_command: callable
+):
+    """Tests formatting in worker processes prints the same diffs, in the same order."""
+    for index in range(6):
+        (tmp_path / f"module_{index}.py").write_text(f'x = {{"a":{index}}}\n', encoding="utf-8")
+    serial = styleguide_command(command="format", command_args=["--diff", "--jobs", "1"])
+
+    output = styleguide_command(command="format", command_args=["--diff", "--jobs", "3"])
+
+    assert output.exception is None, output.output
+    assert output.stdout == serial.stdout
+    assert output.stdout.index("module_0.py") < output.stdout.index("module_5.py")
+
+
+def test_given_excluded_dir__skips_its_files(tmp_path: pathlib.Path, styleguide_command: callable):
+    """Tests formatting doesn't touch files in excluded directories."""
+    (tmp_path / "build").mkdir()
+    (tmp_path / "build" / "generated.py").write_text('x = {"a":1}\n', encoding="utf-8")
+
+    output = styleguide_command(base_args=["--extend-exclude", "build"], command="format")
+
+    assert output.exception is None, output.output
+    assert (tmp_path / "build" / "generated.py").read_text(encoding="utf-8") == 'x = {"a":1}\n'
+
+
+@pytest.mark.parametrize("is_pyi", [False, True])
+def test_black_mode__matches_flake8_black(is_pyi):
+    """Tests formatting uses the same black settings flake8-black checks with."""
+    expected = flake8_black.load_black_mode(_config_constants.BLACK_CONFIG_FILE)
+
+    assert _black_config.mode(is_pyi) == dataclasses.replace(expected, is_pyi=is_pyi)
+    assert _black_config.mode(is_pyi).line_length == 100
+
+
+@pytest.mark.parametrize(
+    "source,expected",
+    [
+        ('x = {"a": 1}\n', _format.BlackResult('x = {"a": 1}\n', changed=False)),
+        ("x = {'a':1}\n", _format.BlackResult('x = {"a": 1}\n', changed=True)),
+    ],
+    ids=["unchanged", "changed"],
+)
+def test_black_source__returns_result(source, expected):
+    """Tests black_source reports whether black changed the source."""
+    assert _format.black_source(source) == expected
+
+
+def test_black_source__invalid_source__returns_error():
+    """Tests black_source reports sources black can't parse, instead of raising."""
+    result = _format.black_source("def spam(:\n")
+
+    assert result.error
+    assert not result.changed
+    assert result.source == "def spam(:\n"
+
+
+@pytest.mark.parametrize(
+    "source",
+    [
+        '"""Spam."""\n\nimport sys\nimport os  # noqa: I100 - wrong order\n\nprint(os, sys)\n',
+        '"""Spam."""\n\nimport sys, os  # noqa: E401 - multiple imports\n\nprint(os, sys)\n',
+        '"""Spam."""\n\nimport os\n\n\nif __name__ == "__main__":\n    print(os)\n',
+        '"""Spam."""\n\nimport os\n\nprint(os)\n',
+    ],
+    ids=["acknowledged order", "acknowledged combined", "two blank lines", "one blank line"],
+)
+def test_format_source__formatted_source__unchanged(source):
+    """Tests isort leaves acknowledged imports, and the blank lines black keeps, as they are."""
+    assert _format.format_source(source, "") == source
+
+
+def _fail_to_format(*args, **kwargs):
+    raise AssertionError("formatted a file known to be formatted")
+
+
+def test_given_formatted_file__check_again__skips_formatting(
+    tmp_path: pathlib.Path, styleguide_command: callable, monkeypatch
+):
+    """Tests a file verified as formatted isn't formatted again while its contents are the same."""
+    (tmp_path / "spam.py").write_text('x = {"a": 1}\n', encoding="utf-8")
+    first = styleguide_command(command="format", command_args=["--check"])
+    monkeypatch.setattr(_format, "format_source", _fail_to_format)
+
+    output = styleguide_command(command="format", command_args=["--check"])
+
+    assert first.exception is None, first.output
+    assert output.exception is None, output.output
+
+
+def test_given_formatted_file_changed__check_again__fails(
+    tmp_path: pathlib.Path, styleguide_command: callable
+):
+    """Tests the cache of formatted files is keyed by the file's contents."""
+    test_file = tmp_path / "spam.py"
+    test_file.write_text('x = {"a": 1}\n', encoding="utf-8")
+    styleguide_command(command="format", command_args=["--check"])
+    test_file.write_text("x = {'a':1}\n", encoding="utf-8")
+
+    output = styleguide_command(command="format", command_args=["--check"])
+
+    assert output.exception is not None, f"Should error running:\n{output}"
+    assert "spam.py" in output.stdout
+
+
+def test_given_formatted_file__no_cache__formats_again(
+    tmp_path: pathlib.Path, styleguide_command: callable, monkeypatch
+):
+    """Tests --no-cache neither reads nor records formatted files."""
+    (tmp_path / "spam.py").write_text('x = {"a": 1}\n', encoding="utf-8")
+    styleguide_command(command="format", command_args=["--check", "--no-cache"])
+    monkeypatch.setattr(_format, "format_source", _fail_to_format)
+
+    output = styleguide_command(command="format", command_args=["--check", "--no-cache"])
+
+    assert output.exception is not None
+
+
+def test_given_many_files__stream__reports_every_file(
+    tmp_path: pathlib.Path, styleguide_command: callable
+):
+    """Tests streaming reports the same diffs and failures, in whatever order they're ready."""
+    for index in range(6):
+        (tmp_path / f"module_{index}.py").write_text(f'x = {{"a":{index}}}\n', encoding="utf-8")
+    ordered = styleguide_command(command="format", command_args=["--diff", "--check"])
+
+    output = styleguide_command(
+        command="format", command_args=["--diff", "--check", "--stream", "--jobs", "3"]
+    )
+
+    assert output.exception is not None
+    assert sorted(output.stdout.splitlines()) == sorted(ordered.stdout.splitlines())
+    assert str(output.exception) == str(ordered.exception)
+
+
+UNFORMATTED_LINES = "x = {'a':1}\ny = {'b':2}\nz = {'c':3}\n"
+
+
+def test_given_lines__format__only_formats_those_lines(
+    tmp_path: pathlib.Path, styleguide_command: callable
+):
+    """Tests --lines leaves the lines outside its ranges as they were."""
+    test_file = tmp_path / "spam.py"
+    test_file.write_text(UNFORMATTED_LINES, encoding="utf-8")
+
+    output = styleguide_command(command="format", command_args=["--lines", "2-2", "spam.py"])
+
+    assert output.exception is None, output.output
+    assert test_file.read_text() == "x = {'a':1}\ny = {\"b\": 2}\nz = {'c':3}\n"
+
+
+def test_given_lines_and_directory__format__fails(
+    tmp_path: pathlib.Path, styleguide_command: callable
+):
+    """Tests --lines needs exactly one file, as line numbers differ between files."""
+    output = styleguide_command(command="format", command_args=["--lines", "1-2"])
+
+    assert output.exit_code == 2
+    assert "--lines needs a single file" in output.output
+
+
+def test_given_changed_since__format__only_formats_changed_lines(
+    tmp_path: pathlib.Path, styleguide_command: callable, git
+):
+    """Tests --changed-since formats the changed lines of committed files, and untracked files."""
+    committed = tmp_path / "committed.py"
+    committed.write_text(UNFORMATTED_LINES, encoding="utf-8")
+    unchanged = tmp_path / "unchanged.py"
+    unchanged.write_text(UNFORMATTED_LINES, encoding="utf-8")
+    git("add", ".")
+    git("commit", "-q", "-m", "initial")
+    committed.write_text(UNFORMATTED_LINES.replace("3}", "4}"), encoding="utf-8")
+    untracked = tmp_path / "untracked.py"
+    untracked.write_text(UNFORMATTED_LINES, encoding="utf-8")
+
+    output = styleguide_command(command="format", command_args=["--changed-since", "HEAD"])
+
+    assert output.exception is None, output.output
+    assert committed.read_text() == "x = {'a':1}\ny = {'b':2}\nz = {\"c\": 4}\n"
+    assert unchanged.read_text() == UNFORMATTED_LINES
+    assert untracked.read_text() == 'x = {"a": 1}\ny = {"b": 2}\nz = {"c": 3}\n'
+
+
+def test_given_changed_since__format__skips_excluded_directories(
+    tmp_path: pathlib.Path, styleguide_command: callable, git
+):
+    """Tests --changed-since doesn't format changed files in excluded directories."""
+    git("commit", "-q", "--allow-empty", "-m", "initial")
+    (tmp_path / "build").mkdir()
+    generated = tmp_path / "build" / "generated.py"
+    generated.write_text(UNFORMATTED_LINES, encoding="utf-8")
+
+    output = styleguide_command(
+        base_args=["--extend-exclude", "build"],
+        command="format",
+        command_args=["--check", "--changed-since", "HEAD"],
+    )
+
+    assert output.exception is None, output.output
+    assert "generated.py" not in output.output
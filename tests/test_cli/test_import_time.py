@@ -0,0 +1,100 @@
+"""Tests that each subcommand of ni-python-styleguide starts quickly.
+
+Every `nps` run pays for the modules it imports, so commands only import the engines they use.
+"""
+
+import re
+import subprocess
+import sys
+import typing
+
+import pytest
+
+# Top-level packages which are slow to import, and only needed by some commands.
+HEAVY_PACKAGES = {"better_diff", "black", "flake8", "isort", "pycodestyle"}
+
+# Total import time budget (in milliseconds) for commands which don't lint or format.
+LIGHT_COMMAND_BUDGET_MS = 250
+
+_IMPORT_TIME_LINE = re.compile(r"^import time:\s+\d+ \|\s+(?P<cumulative>\d+) \|(?P<name> +\S+)$")
+
+
+class _ImportTimes(typing.NamedTuple):
+    total_ms: float
+    packages: typing.Set[str]
+
+
+def _import_times(cwd, *args) -> _ImportTimes:
+    """Runs the styleguide under `python -X importtime`, and returns what it imported."""
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "ni_python_styleguide", *args],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+    )
+    total_us = 0
+    packages = set()
+    for line in process.stderr.splitlines():
+        match = _IMPORT_TIME_LINE.match(line)
+        if not match:
+            continue
+        name = match.group("name")
+        packages.add(name.strip().split(".")[0])
+        if not name.startswith("  "):  # top-level imports include the time of their imports
+            total_us += int(match.group("cumulative"))
+    return _ImportTimes(total_us / 1000, packages)
+
+
+LIGHT_COMMANDS = [
+    ["--version"],
+    ["--help"],
+    ["lint", "--help"],
+    ["format", "--help"],
+    ["fix", "--help"],
+    ["acknowledge-existing-violations", "--help"],
+    ["lsp", "--help"],
+    ["cache", "stats"],
+    ["daemon", "status"],
+]
+
+
+@pytest.mark.parametrize("args", LIGHT_COMMANDS, ids=" ".join)
+def test_import_time__light_command__imports_no_engines(args, tmp_path):
+    """Tests that commands which don't lint or format don't import flake8, black or isort."""
+    result = _import_times(tmp_path, *args)
+
+    assert not result.packages & HEAVY_PACKAGES
+
+
+@pytest.mark.parametrize("args", LIGHT_COMMANDS, ids=" ".join)
+def test_import_time__light_command__within_budget(args, tmp_path):
+    """Tests that commands which don't lint or format start within the import time budget."""
+    _import_times(tmp_path, *args)  # make sure the bytecode is cached, to measure a cold start
+
+    total_ms = min(_import_times(tmp_path, *args).total_ms for _ in range(3))
+
+    assert total_ms < LIGHT_COMMAND_BUDGET_MS
+
+
+# The flake8 plugins which only linting needs.
+LINT_PLUGINS = {"pycodestyle", "pydocstyle", "pyflakes"}
+
+
+@pytest.mark.parametrize(
+    "args, needed, unneeded",
+    [
+        (["lint"], "flake8", {"better_diff", "isort"}),
+        (["lint", "-"], "flake8", {"better_diff", "isort"}),
+        (["format"], "black", LINT_PLUGINS),
+        (["format", "--check"], "black", LINT_PLUGINS),
+    ],
+    ids=["lint", "lint -", "format", "format --check"],
+)
+def test_import_time__command__imports_only_what_it_needs(args, needed, unneeded, tmp_path):
+    """Tests that commands don't import engines which they don't run."""
+    (tmp_path / "spam.py").write_text('"""Spam."""\n')
+
+    result = _import_times(tmp_path, *args)
+
+    assert needed in result.packages
+    assert not result.packages & unneeded
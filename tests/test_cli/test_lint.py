@@ -1,11 +1,15 @@
 """Tests for the "lint" subcommand of ni-python-styleguide."""
 
 import itertools
+import json
+import os
 import textwrap
 
+import flake8.checker
 import pytest
 import toml
 
+from ni_python_styleguide import _Flake8Error, _lint, _utils
 
 TOO_LONG_LINE = "a_really_long_order = [" + ", ".join(itertools.repeat('"spam"', 10)) + "]\n"
 NO_DOC_STRING = textwrap.dedent(
@@ -26,8 +30,10 @@ def styleguide_lint(styleguide_command):
     The base fixture also ensures we run the linter from within the tmp_path directory.
     """
 
-    def runner(base_args=[], lint_args=[]):
-        return styleguide_command(base_args=base_args, command="lint", command_args=lint_args)
+    def runner(base_args=[], lint_args=[], input=None):
+        return styleguide_command(
+            base_args=base_args, command="lint", command_args=lint_args, input=input
+        )
 
     return runner
 
@@ -260,3 +266,354 @@ def test_lint__verbosity_args_allowed(styleguide_lint, verbosity_args):
     result = styleguide_lint(base_args=[verbosity_args])
 
     assert result, result.output
+
+
+def test_lint__stdin__reports_display_name(styleguide_lint, tmp_path):
+    """Tests linting stdin reports the same violations as the file, under the display name."""
+    (tmp_path / "spam.py").write_text(TOO_LONG_LINE)
+    expected = styleguide_lint(lint_args=["spam.py"])
+
+    result = styleguide_lint(
+        lint_args=["--stdin-display-name", "spam.py", "-"], input=TOO_LONG_LINE
+    )
+
+    assert not result
+    assert result.output == expected.output
+
+
+def test_lint__stdin__applies_per_file_ignores_to_display_name(styleguide_lint):
+    """Tests the display name decides the per-file-ignores, e.g. tests don't need docstrings."""
+    result = styleguide_lint(
+        lint_args=["--stdin-display-name", "tests/test_spam.py", "-"], input=NO_DOC_STRING
+    )
+
+    assert result, result.output
+
+
+def test_lint__stdin_with_files__errors(styleguide_lint):
+    """Tests stdin can't be mixed with other files."""
+    result = styleguide_lint(lint_args=["-", "spam.py"], input="")
+
+    assert result.exit_code == 2, result.output
+
+
+@pytest.fixture
+def lint_session():
+    """Provides a lint session with the default options."""
+    return _lint.LintSession(
+        exclude="__pycache__,.git,.venv", app_import_names="tests", extend_ignore=None
+    )
+
+
+def test_lint_session__check_paths__matches_parsed_report(styleguide_lint, tmp_path, lint_session):
+    """Tests the structured violations match the violations in the text report."""
+    (tmp_path / "spam.py").write_text(TOO_LONG_LINE + NO_DOC_STRING)
+    (tmp_path / "subdir").mkdir()
+    (tmp_path / "subdir" / "eggs.py").write_text("import os\n")
+    report = styleguide_lint().output
+
+    result = lint_session.check_paths([])
+
+    assert set(result) == set(filter(None, map(_utils.lint.parse, report.splitlines())))
+
+
+def test_lint_session__check_source__matches_check_paths(tmp_path, chdir, lint_session):
+    """Tests checking in-memory source finds the same violations as checking the file."""
+    source = "import os\n" + TOO_LONG_LINE + NO_DOC_STRING + "x = {'a':1}\n"
+    (tmp_path / "spam.py").write_text(source)
+    chdir(tmp_path)
+
+    result = lint_session.check_source(source, "spam.py")
+
+    assert result == lint_session.check_paths(["spam.py"])
+    assert "BLK100" in {error.code for error in result}
+
+
+def test_lint__cache__unchanged_files_are_not_rechecked(styleguide_lint, tmp_path, monkeypatch):
+    """Tests that linting again reports the cached violations without running flake8's checks."""
+    (tmp_path / "spam.py").write_text(TOO_LONG_LINE)
+    first_result = styleguide_lint()
+    monkeypatch.setattr(
+        flake8.checker.FileChecker, "run_checks", lambda self: pytest.fail("file was rechecked")
+    )
+
+    result = styleguide_lint()
+
+    assert not result, result.output
+    assert result.output == first_result.output
+
+
+def test_lint__cache__changed_files_are_rechecked(styleguide_lint, tmp_path):
+    """Tests that changing a file invalidates its cached violations."""
+    (tmp_path / "spam.py").write_text(TOO_LONG_LINE)
+    styleguide_lint()
+    (tmp_path / "spam.py").write_text('"""Spam."""\n')
+
+    result = styleguide_lint()
+
+    assert result, result.output
+
+
+def test_lint__no_cache__does_not_write_cache(styleguide_lint, tmp_path, cache_dir):
+    """Tests that --no-cache leaves the cache untouched."""
+    (tmp_path / "spam.py").write_text(TOO_LONG_LINE)
+
+    styleguide_lint(lint_args=["--no-cache"])
+
+    assert not any(cache_dir.iterdir())
+
+
+def test_cache__stats_and_clear(styleguide, styleguide_lint, tmp_path):
+    """Tests that the cache commands report on and empty the cache."""
+    (tmp_path / "spam.py").write_text(TOO_LONG_LINE)
+    styleguide_lint()
+
+    stats_before = styleguide("cache", "stats")
+    clear_result = styleguide("cache", "clear")
+    stats_after = styleguide("cache", "stats")
+
+    assert clear_result, clear_result.output
+    assert "Entries: 1" in stats_before.output, stats_before.output
+    assert "Entries: 0" in stats_after.output, stats_after.output
+
+
+def test_lint__changed_since__only_lints_changed_files(styleguide_lint, tmp_path, git):
+    """Tests that --changed-since skips files which haven't changed since the ref."""
+    (tmp_path / "committed.py").write_text(TOO_LONG_LINE)
+    git("add", ".")
+    git("commit", "-q", "-m", "initial")
+    (tmp_path / "untracked.py").write_text(TOO_LONG_LINE)
+
+    result = styleguide_lint(lint_args=["--changed-since", "HEAD"])
+
+    assert not result, result.output
+    assert "untracked.py" in result.output
+    assert "committed.py" not in result.output
+
+
+def test_lint__changed_since__applies_exclude(styleguide_lint, tmp_path, git):
+    """Tests that --changed-since still excludes files matching --exclude."""
+    git("commit", "-q", "--allow-empty", "-m", "initial")
+    (tmp_path / "spam.py").write_text(TOO_LONG_LINE)
+
+    result = styleguide_lint(
+        base_args=["--exclude", "spam.py"], lint_args=["--changed-since", "HEAD"]
+    )
+
+    assert result, result.output
+
+
+@pytest.mark.parametrize("lint_args", [["--changed-since", "HEAD"], ["--staged"]], ids=" ".join)
+def test_lint__git_files__applies_directory_exclude(styleguide_lint, tmp_path, git, lint_args):
+    """Tests that files git lists in an excluded directory are excluded."""
+    git("commit", "-q", "--allow-empty", "-m", "initial")
+    (tmp_path / "build" / "generated").mkdir(parents=True)
+    (tmp_path / "build" / "generated" / "spam.py").write_text(TOO_LONG_LINE)
+    (tmp_path / "eggs.py").write_text(TOO_LONG_LINE)
+    git("add", ".")
+
+    result = styleguide_lint(base_args=["--extend-exclude", "build"], lint_args=lint_args)
+
+    assert "eggs.py" in result.output
+    assert "spam.py" not in result.output
+
+
+def test_lint__staged__lints_staged_contents(styleguide_lint, tmp_path, git):
+    """Tests that --staged checks the contents in the index, not the working tree."""
+    (tmp_path / "good.py").write_text('"""Good."""\n')
+    git("add", "good.py")
+    (tmp_path / "good.py").write_text(TOO_LONG_LINE)
+    (tmp_path / "bad.py").write_text(TOO_LONG_LINE)
+    git("add", "bad.py")
+
+    result = styleguide_lint(lint_args=["--staged"])
+
+    assert not result, result.output
+    assert "bad.py" in result.output
+    assert "good.py" not in result.output
+
+
+def test_lint__respect_gitignore__skips_ignored_files(styleguide_lint, tmp_path, git):
+    """Tests that --respect-gitignore doesn't lint files git ignores."""
+    (tmp_path / ".gitignore").write_text("build/\n")
+    (tmp_path / "build").mkdir()
+    (tmp_path / "build" / "ignored.py").write_text(TOO_LONG_LINE)
+    (tmp_path / "untracked.py").write_text(TOO_LONG_LINE)
+
+    result = styleguide_lint(base_args=["--respect-gitignore"])
+
+    assert not result, result.output
+    assert "untracked.py" in result.output
+    assert "ignored.py" not in result.output
+
+
+def test_lint__changed_since__outside_git_repo__errors(styleguide_lint):
+    """Tests that --changed-since reports when the files can't be found from git."""
+    result = styleguide_lint(lint_args=["--changed-since", "HEAD"])
+
+    assert not result
+    assert result.exit_code != 0
+
+
+def test_lint__jobs__matches_serial_output(styleguide_lint, tmp_path):
+    """Tests that linting in worker processes reports the same violations, in the same order."""
+    for name in ("spam.py", "eggs.py", "ham.py"):
+        (tmp_path / name).write_text(TOO_LONG_LINE + NO_DOC_STRING)
+    serial_result = styleguide_lint(lint_args=["--no-cache", "--jobs", "1"])
+
+    result = styleguide_lint(lint_args=["--no-cache", "--jobs", "3"])
+
+    assert not result, result.output
+    assert result.output == serial_result.output
+
+
+@pytest.mark.parametrize("jobs", ["0", "-1", "many"])
+def test_lint__jobs__rejects_invalid_values(styleguide_lint, jobs):
+    """Tests that --jobs only accepts a positive number or "auto"."""
+    result = styleguide_lint(lint_args=["--jobs", jobs])
+
+    assert result.exit_code == 2, result.output
+
+
+@pytest.mark.parametrize(
+    "jobs,file_count,expected", [("auto", 1, 1), ("auto", 19, 1), (8, 3, 3), (2, 100, 2)]
+)
+def test_job_count__small_runs_stay_serial(jobs, file_count, expected):
+    """Tests the number of worker processes never exceeds the number of files."""
+    assert _utils.jobs.job_count(jobs, file_count) == expected
+
+
+def test_lint__reports_each_file_as_it_is_checked(tmp_path, chdir, capsys, monkeypatch):
+    """Tests that each file's violations are written before the next file is checked."""
+    chdir(tmp_path)
+    for name in ["a.py", "b.py", "c.py"]:
+        (tmp_path / name).write_text(TOO_LONG_LINE)
+    output_before_check = []
+    check_file = _lint.LintSession._check_file
+
+    def record_output_and_check(self, filename, source=None):
+        output_before_check.append(capsys.readouterr().out)
+        return check_file(self, filename, source)
+
+    monkeypatch.setattr(_lint.LintSession, "_check_file", record_output_and_check)
+
+    with pytest.raises(_Flake8Error):
+        _lint.lint(None, None, "", None, None, ["."], jobs=1)
+
+    assert output_before_check[0] == ""
+    assert "a.py:1:1: D100" in output_before_check[1]
+    assert "b.py:1:1: D100" in output_before_check[2]
+    assert "c.py:1:1: D100" in capsys.readouterr().out
+
+
+def test_lint__cache__reports_each_file_before_reading_the_next(
+    tmp_path, chdir, capsys, monkeypatch, cache_dir
+):
+    """Tests that cached violations are written as each file is looked up, not after all are."""
+    chdir(tmp_path)
+    for name in ["a.py", "b.py", "c.py"]:
+        (tmp_path / name).write_text(TOO_LONG_LINE)
+    cache = _utils.cache.Cache(cache_dir)
+    with pytest.raises(_Flake8Error):
+        _lint.lint(None, None, "", None, None, ["."], cache=cache, jobs=1)
+    capsys.readouterr()
+    output_before_lookup = []
+    cache_key = _lint.LintSession._cache_key
+
+    def record_output_and_look_up(self, filename, source):
+        output_before_lookup.append(capsys.readouterr().out)
+        return cache_key(self, filename, source)
+
+    monkeypatch.setattr(_lint.LintSession, "_cache_key", record_output_and_look_up)
+
+    with pytest.raises(_Flake8Error):
+        _lint.lint(None, None, "", None, None, ["."], cache=cache, jobs=1)
+
+    assert output_before_lookup[0] == ""
+    assert "a.py:1:1: D100" in output_before_lookup[1]
+    assert "b.py:1:1: D100" in output_before_lookup[2]
+
+
+def test_lint__jobs__partly_cached__matches_serial_output(styleguide_lint, tmp_path):
+    """Tests that worker processes check the uncached files between the cached ones, in order."""
+    for name in ("a.py", "c.py"):
+        (tmp_path / name).write_text(TOO_LONG_LINE + NO_DOC_STRING)
+    styleguide_lint()
+    for name in ("b.py", "d.py", "e.py"):
+        (tmp_path / name).write_text("import os\n" + NO_DOC_STRING)
+    serial_result = styleguide_lint(lint_args=["--no-cache", "--jobs", "1"])
+
+    result = styleguide_lint(lint_args=["--jobs", "2"])
+
+    assert result.output == serial_result.output
+
+
+@pytest.mark.parametrize("jobs", ["1", "2"])
+def test_lint__profile__reports_stages_plugins_and_files(styleguide_lint, tmp_path, jobs):
+    """Tests that --profile reports where the time went, including in worker processes."""
+    (tmp_path / "spam.py").write_text(TOO_LONG_LINE)
+    (tmp_path / "eggs.py").write_text('"""Eggs."""\n')
+
+    result = styleguide_lint(
+        lint_args=["--profile", "--profile-format", "json", "--no-cache", "--jobs", jobs]
+    )
+
+    assert "spam.py:1:1: D100" in result.stdout
+    profile = json.loads(result.stderr)
+    assert {"config loading", "plugin loading", "discovery"} <= set(profile["stages"])
+    assert {"pyflakes", "pycodestyle", "flake8-docstrings", "flake8-black"} <= set(
+        profile["plugins"]
+    )
+    assert profile["plugins"]["pyflakes"]["calls"] == 2
+    assert sorted(file["file"] for file in profile["slowest_files"]) == [
+        os.path.join(".", "eggs.py"),
+        os.path.join(".", "spam.py"),
+    ]
+
+
+def test_lint__profile_table__lists_slowest_files(styleguide_lint, tmp_path):
+    """Tests that --profile reports the times as tables by default."""
+    (tmp_path / "spam.py").write_text('"""Spam."""\n')
+
+    result = styleguide_lint(lint_args=["--profile"])
+
+    assert result, result.output
+    assert result.stderr.splitlines()[0].split() == ["Stage", "Wall", "(s)", "CPU", "(s)", "Calls"]
+    assert "flake8-black" in result.stderr
+    assert "spam.py" in result.stderr
+
+
+def test_lint__trace_file__records_spans_of_every_process(styleguide_lint, tmp_path):
+    """Tests that --trace-file records the spans of the run and its workers in one trace."""
+    (tmp_path / "spam.py").write_text(TOO_LONG_LINE)
+    (tmp_path / "eggs.py").write_text('"""Eggs."""\n')
+    trace_file = tmp_path / "trace.json"
+
+    result = styleguide_lint(
+        base_args=["--trace-file", trace_file], lint_args=["--no-cache", "--jobs", "2"]
+    )
+
+    assert "spam.py:1:1: D100" in result.stdout
+    events = json.loads(trace_file.read_text())["traceEvents"]
+    spans = [event for event in events if event["ph"] == "X"]
+    assert {"nps lint", "config loading", "plugin loading", "discovery", "lint"} <= {
+        span["name"] for span in spans
+    }
+    checks = [span for span in spans if span["name"] == "check"]
+    assert sorted(span["args"]["file"] for span in checks) == [
+        os.path.join(".", "eggs.py"),
+        os.path.join(".", "spam.py"),
+    ]
+    assert all(span["pid"] != os.getpid() for span in checks)
+    assert not list(tmp_path.glob(".nps-trace-*"))
+
+
+def test_lint__trace_file_in_missing_directory__fails(styleguide_lint, tmp_path):
+    """Tests that a trace file which can't be written is reported without a traceback."""
+    (tmp_path / "spam.py").write_text('"""Spam."""\n')
+    trace_file = tmp_path / "missing" / "trace.json"
+
+    result = styleguide_lint(base_args=["--trace-file", trace_file])
+
+    assert result.exit_code == 1
+    assert f"Could not write trace file {trace_file}" in result.output
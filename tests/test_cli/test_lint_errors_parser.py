@@ -32,3 +32,65 @@ def test_lint_errors_parser_handles_example_line_without_error(input_line):
     assert ni_python_styleguide._utils.lint.parse(
         input_line
     ), "should parse without error and return object"
+
+
+def _natural_order(lint_errors):
+    return sorted(lint_errors, key=lambda error: (error.file, error.line, error.column))
+
+
+def test_parse_report__parses_every_line_in_natural_order():
+    """Tests a whole report is parsed like each line, sorted by line number (not as text)."""
+    report = "\n".join(EXAMPLE_LINT_ERROR_LINES) + "\n"
+    expected = _natural_order(map(ni_python_styleguide._utils.lint.parse, EXAMPLE_LINT_ERROR_LINES))
+
+    result = ni_python_styleguide._utils.lint.parse_report(report)
+
+    assert list(result) == expected
+    assert [error.line for error in result.in_file(r".\source\lorem.py")][:3] == [6, 8, 11]
+
+
+def test_parse_report__streamed_file__matches_text(monkeypatch, tmp_path):
+    """Tests a report read a block at a time parses the same as the whole text."""
+    report = "\n".join(EXAMPLE_LINT_ERROR_LINES)
+    (tmp_path / "report.txt").write_text(report)
+    monkeypatch.setattr(ni_python_styleguide._utils.lint, "_REPORT_BLOCK_SIZE", 7)
+
+    with open(tmp_path / "report.txt") as file:
+        result = ni_python_styleguide._utils.lint.parse_report(file)
+
+    assert list(result) == list(ni_python_styleguide._utils.lint.parse_report(report))
+
+
+@pytest.mark.parametrize(
+    "format, report",
+    [
+        ("pylint", "a b.py:3: [E501] line too long\nnot a violation\n"),
+        ("%(code)s|%(path)s|%(row)d|%(text)s", "E501|a b.py|3|line too long\n"),
+        (
+            "json",
+            '{"a b.py": [{"code": "E501", "filename": "a b.py", "line_number": 3, '
+            '"column_number": null, "text": "line too long", "physical_line": "x"}]}',
+        ),
+    ],
+    ids=["pylint", "custom", "json"],
+)
+def test_parse_report__other_formats(format, report):
+    """Tests reports written with other flake8 --format values are parsed."""
+    result = ni_python_styleguide._utils.lint.parse_report(report, format=format)
+
+    assert list(result) == [
+        ni_python_styleguide._utils.lint.LintError("a b.py", 3, 0, "E501", "line too long")
+    ]
+
+
+def test_parse_report__negative_column__keeps_column():
+    """Tests a violation reported before the start of its line is parsed as it was reported."""
+    result = ni_python_styleguide._utils.lint.parse_report("a.py:1:-1: E1 spam\n")
+
+    assert list(result) == [ni_python_styleguide._utils.lint.LintError("a.py", 1, -1, "E1", "spam")]
+
+
+def test_parse_report__format_without_location__fails():
+    """Tests a format which doesn't say where violations are can't be parsed."""
+    with pytest.raises(ValueError, match="no \\['line'\\]"):
+        ni_python_styleguide._utils.lint.parse_report("", format="%(path)s: %(code)s")
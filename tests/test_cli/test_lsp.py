@@ -0,0 +1,281 @@
+"""Tests for the "lsp" subcommand of ni-python-styleguide."""
+
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from ni_python_styleguide import _lsp
+
+GOOD_SOURCE = '"""Spam."""\n'
+BAD_SOURCE = 'import os\n\n"""Spam."""\nx = {"a":1}\n'
+
+
+class _Client:
+    """Talks to an LSP server running in a thread, over pipes."""
+
+    def __init__(self, debounce):
+        server_in, to_server = os.pipe()
+        from_server, server_out = os.pipe()
+        self._to_server = open(to_server, "wb")
+        self._from_server = open(from_server, "rb")
+        self._server_pipes = [open(server_in, "rb"), open(server_out, "wb")]
+        self.server = _lsp._Server(
+            *self._server_pipes,
+            exclude="__pycache__,.git,.venv",
+            app_import_names="tests",
+            extend_ignore=None,
+            debounce=debounce,
+        )
+        self.exit_code = None
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        self._next_id = 0
+
+    def _serve(self):
+        self.exit_code = self.server.serve()
+
+    def send(self, method, params=None, *, request=False):
+        """Sends a notification (or a request, returning its id)."""
+        message = {"jsonrpc": "2.0", "method": method, "params": params or {}}
+        if request:
+            self._next_id += 1
+            message["id"] = self._next_id
+        body = json.dumps(message).encode("utf-8")
+        self._to_server.write(f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+        self._to_server.flush()
+        return message.get("id")
+
+    def receive(self):
+        """Returns the next message from the server."""
+        return _lsp._read_message(self._from_server)
+
+    def request(self, method, params=None):
+        """Sends a request and returns the response to it."""
+        request_id = self.send(method, params, request=True)
+        message = self.receive()
+        assert message["id"] == request_id, message
+        return message
+
+    def open(self, uri, text):
+        """Opens a document and returns the diagnostics published for it."""
+        self.send(
+            "textDocument/didOpen",
+            {"textDocument": {"uri": uri, "languageId": "python", "version": 1, "text": text}},
+        )
+        return self.receive()["params"]
+
+    def close(self):
+        """Shuts down and exits the server, and returns its exit code."""
+        self.request("shutdown")
+        return self.exit()
+
+    def exit(self):
+        """Exits the server, and returns its exit code."""
+        self.send("exit")
+        self._thread.join()
+        for pipe in [self._to_server, self._from_server, *self._server_pipes]:
+            pipe.close()
+        return self.exit_code
+
+
+@pytest.fixture
+def lsp_client(tmp_path, chdir):
+    """Provides an initialized client talking to an LSP server."""
+    chdir(tmp_path)
+    client = _Client(debounce=0.05)
+    client.request("initialize", {"processId": None, "rootUri": tmp_path.as_uri()})
+    client.send("initialized")
+    yield client
+    if client.exit_code is None:
+        client.close()
+
+
+def test_lsp__initialize__advertises_capabilities(tmp_path, chdir):
+    """Tests that the server offers full document sync and formatting."""
+    chdir(tmp_path)
+    client = _Client(debounce=0)
+
+    response = client.request("initialize", {"processId": None, "rootUri": None})
+
+    capabilities = response["result"]["capabilities"]
+    assert capabilities["textDocumentSync"]["change"] == 1
+    assert capabilities["documentFormattingProvider"]
+    assert client.close() == 0
+
+
+def test_lsp__did_open__publishes_diagnostics_for_unsaved_text(lsp_client, tmp_path):
+    """Tests that opening a document lints the text sent, not the file on disk."""
+    (tmp_path / "spam.py").write_text(GOOD_SOURCE)
+
+    result = lsp_client.open((tmp_path / "spam.py").as_uri(), BAD_SOURCE)
+
+    codes = {diagnostic["code"] for diagnostic in result["diagnostics"]}
+    assert {"F401", "BLK100"} <= codes
+    assert result["version"] == 1
+    f401 = next(d for d in result["diagnostics"] if d["code"] == "F401")
+    assert f401["range"] == {
+        "start": {"line": 0, "character": 0},
+        "end": {"line": 0, "character": len("import os")},
+    }
+
+
+def test_lsp__did_open__applies_per_file_ignores(lsp_client, tmp_path):
+    """Tests that documents are linted as their path, e.g. tests don't need docstrings."""
+    uri = (tmp_path / "tests" / "test_spam.py").as_uri()
+
+    result = lsp_client.open(uri, "def test_spam():\n    assert True\n")
+
+    assert result["diagnostics"] == []
+
+
+def test_lsp__did_change__debounces_to_latest_version(lsp_client, tmp_path):
+    """Tests that quick edits are linted once, at the latest version."""
+    uri = (tmp_path / "spam.py").as_uri()
+    lsp_client.open(uri, GOOD_SOURCE)
+
+    for version, text in enumerate([BAD_SOURCE, "import os\n", GOOD_SOURCE], start=2):
+        lsp_client.send(
+            "textDocument/didChange",
+            {"textDocument": {"uri": uri, "version": version}, "contentChanges": [{"text": text}]},
+        )
+    result = lsp_client.receive()["params"]
+
+    assert result["version"] == 4
+    assert result["diagnostics"] == []
+
+
+def test_lsp__did_save__reuses_results_for_same_version(lsp_client, tmp_path, monkeypatch):
+    """Tests that saving doesn't relint a version which has already been linted."""
+    uri = (tmp_path / "spam.py").as_uri()
+    lsp_client.open(uri, BAD_SOURCE)
+    linted = []
+    monkeypatch.setattr(lsp_client.server._session, "check_sources", linted.append)
+
+    lsp_client.send("textDocument/didSave", {"textDocument": {"uri": uri}})
+    lsp_client.request("shutdown")
+
+    assert linted == []
+
+
+def test_lsp__formatting__formats_like_format_command(lsp_client, tmp_path):
+    """Tests that formatting sorts imports and applies black, in one whole-document edit."""
+    uri = (tmp_path / "spam.py").as_uri()
+    lsp_client.open(uri, 'import sys\nimport os\n\nx = {"a":1}\n')
+
+    response = lsp_client.request("textDocument/formatting", {"textDocument": {"uri": uri}})
+
+    assert response["result"] == [
+        {
+            "range": {"start": {"line": 0, "character": 0}, "end": {"line": 4, "character": 0}},
+            "newText": 'import os\nimport sys\n\nx = {"a": 1}\n',
+        }
+    ]
+
+
+def test_lsp__formatting__invalid_source__fails_request(lsp_client, tmp_path):
+    """Tests that formatting text black can't parse reports an error instead of edits."""
+    uri = (tmp_path / "spam.py").as_uri()
+    lsp_client.open(uri, "def spam(:\n")
+
+    response = lsp_client.request("textDocument/formatting", {"textDocument": {"uri": uri}})
+
+    assert response["error"]["code"] == _lsp._REQUEST_FAILED
+
+
+def test_lsp__cancel_request__cancels_queued_request(lsp_client, tmp_path, monkeypatch):
+    """Tests that a request cancelled before the server gets to it is answered as cancelled."""
+    uri = (tmp_path / "spam.py").as_uri()
+    lsp_client.open(uri, GOOD_SOURCE)
+    linting = threading.Event()
+    release = threading.Event()
+    check_sources = lsp_client.server._session.check_sources
+
+    def slow_check_sources(sources):
+        linting.set()
+        release.wait()
+        return check_sources(sources)
+
+    monkeypatch.setattr(lsp_client.server._session, "check_sources", slow_check_sources)
+    lsp_client.send(
+        "textDocument/didChange",
+        {"textDocument": {"uri": uri, "version": 2}, "contentChanges": [{"text": BAD_SOURCE}]},
+    )
+    linting.wait()
+    request_id = lsp_client.send(
+        "textDocument/formatting", {"textDocument": {"uri": uri}}, request=True
+    )
+    lsp_client.send("$/cancelRequest", {"id": request_id})
+    while lsp_client.server._messages.qsize() < 2:
+        time.sleep(0.01)
+    release.set()
+
+    assert lsp_client.receive()["method"] == "textDocument/publishDiagnostics"
+    assert lsp_client.receive()["error"]["code"] == _lsp._REQUEST_CANCELLED
+
+
+def test_lsp__malformed_cancel_request__keeps_serving(lsp_client):
+    """Tests that a cancellation without the id to cancel is ignored."""
+    lsp_client.send("$/cancelRequest", {})
+
+    assert lsp_client.request("shutdown")["result"] is None
+
+
+def test_lsp__malformed_notification__logs_and_keeps_serving(lsp_client, tmp_path):
+    """Tests that a notification the server can't handle is logged, and the server keeps going."""
+    uri = (tmp_path / "spam.py").as_uri()
+
+    lsp_client.send("textDocument/didChange", {"textDocument": {"uri": uri}})
+
+    message = lsp_client.receive()
+    assert message["method"] == "window/logMessage"
+    assert message["params"]["type"] == _lsp._MESSAGE_TYPE_ERROR
+    assert "textDocument/didChange" in message["params"]["message"]
+    assert lsp_client.open(uri, BAD_SOURCE)["diagnostics"]
+
+
+def test_lsp__invalid_content_length__keeps_serving(lsp_client):
+    """Tests that a message whose length isn't a number is answered with a parse error."""
+    lsp_client._to_server.write(b"Content-Length: abc\r\n\r\n")
+    lsp_client._to_server.flush()
+
+    assert lsp_client.receive()["error"]["code"] == _lsp._PARSE_ERROR
+    assert lsp_client.request("shutdown")["result"] is None
+
+
+def test_lsp__reader_fails__exits(tmp_path, chdir, monkeypatch):
+    """Tests that the server exits (rather than waiting forever) if reading messages fails."""
+    chdir(tmp_path)
+
+    def fail_to_read(reader):
+        raise OSError("spam")
+
+    monkeypatch.setattr(_lsp, "_read_message", fail_to_read)
+    client = _Client(debounce=0)
+    client._thread.join(10)
+    exit_code = client.exit_code
+    client.exit()  # closes the pipes
+
+    assert exit_code == 1
+
+
+def test_lsp__did_close__clears_diagnostics(lsp_client, tmp_path):
+    """Tests that closing a document clears its diagnostics."""
+    uri = (tmp_path / "spam.py").as_uri()
+    lsp_client.open(uri, BAD_SOURCE)
+
+    lsp_client.send("textDocument/didClose", {"textDocument": {"uri": uri}})
+
+    assert lsp_client.receive()["params"] == {"uri": uri, "diagnostics": []}
+
+
+def test_lsp__exit_without_shutdown__fails(tmp_path, chdir):
+    """Tests that the server exits with an error if told to exit before shutting down."""
+    chdir(tmp_path)
+    client = _Client(debounce=0)
+
+    exit_code = client.exit()
+
+    assert exit_code == 1
@@ -1,5 +1,11 @@
 """Test the _utils submodule."""
 
+import inspect
+import os
+import shutil
+import subprocess
+
+import flake8.discover_files
 import pytest
 
 from ni_python_styleguide import _utils
@@ -48,3 +54,216 @@ def test_can_acurately_detect_if_in_multiline_string(lineno, expected_in_multili
     )
 
     assert result == expected_in_multiline
+
+
+def test_cache__evict__removes_least_recently_used_entries(tmp_path):
+    """Assert eviction keeps the most recently used entries within the size limit."""
+    cache = _utils.cache.Cache(tmp_path, max_size=100)
+    for key in ("aa1", "bb2", "cc3"):
+        cache.set(key, "x" * 40)
+    os.utime(cache._path_for("aa1"), (0, 0))
+    os.utime(cache._path_for("bb2"), (1, 1))
+    os.utime(cache._path_for("cc3"), (2, 2))
+    cache.get("aa1")  # marks it as most recently used
+
+    cache.evict()
+
+    assert [cache.get(key) is not None for key in ("aa1", "bb2", "cc3")] == [True, False, True]
+
+
+@pytest.fixture
+def source_tree(tmp_path, chdir):
+    """Creates a tree of files to discover, and makes it the working directory."""
+    for name in [
+        "spam.py",
+        "spam.txt",
+        "a.py",
+        "a/b.py",
+        "a-b.py",
+        "sub/eggs.py",
+        "sub/skip/ham.py",
+        "sub/generated_spam.py",
+        ".venv/lib/site.py",
+        "__pycache__/spam.py",
+    ]:
+        (tmp_path / name).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / name).write_text("")
+    chdir(tmp_path)
+    return tmp_path
+
+
+def _flake8_expand_paths(paths, exclude):
+    kwargs = dict(
+        paths=paths, stdin_display_name="stdin", filename_patterns=["*.py"], exclude=exclude
+    )
+    if "is_running_from_diff" in inspect.signature(flake8.discover_files.expand_paths).parameters:
+        kwargs["is_running_from_diff"] = False
+    return list(flake8.discover_files.expand_paths(**kwargs))
+
+
+@pytest.mark.parametrize(
+    "paths, exclude",
+    [
+        (["."], "__pycache__,.git,.venv"),
+        (["."], ""),
+        (["sub", "spam.txt"], "skip"),
+        (["."], "sub/skip,generated_*,.venv,__pycache__"),
+        (["sub/"], "./sub/skip"),
+        (["spam.py"], "spam.py"),
+    ],
+)
+def test_discovery__files__matches_flake8(source_tree, paths, exclude):
+    """Assert discovery finds the same files as flake8, sorted within each path."""
+    patterns = _utils.discovery.parse_patterns(exclude)
+
+    result = list(_utils.discovery.Discovery(patterns).files(paths))
+
+    assert result == [
+        filename for path in paths for filename in sorted(_flake8_expand_paths([path], patterns))
+    ]
+
+
+def test_discovery__files__does_not_list_excluded_dirs(source_tree, monkeypatch):
+    """Assert excluded directories are skipped without listing their contents."""
+    listed = []
+    scandir = os.scandir
+    monkeypatch.setattr(os, "scandir", lambda path: listed.append(path) or scandir(path))
+    patterns = _utils.discovery.parse_patterns("__pycache__,.venv,sub")
+
+    list(_utils.discovery.Discovery(patterns).files(["."]))
+
+    assert sorted(listed) == [".", os.path.join(".", "a")]
+
+
+def test_discovery__check_parents__excludes_files_in_excluded_dirs(source_tree):
+    """Assert listed files (e.g. from git) in excluded directories are excluded."""
+    patterns = _utils.discovery.parse_patterns("skip")
+    paths = ["spam.py", "sub/skip/ham.py", str(source_tree / "sub" / "skip" / "ham.py")]
+
+    result = list(_utils.discovery.Discovery(patterns).files(paths, check_parents=True))
+
+    assert result == ["spam.py"]
+
+
+def test_discovery__respect_gitignore__skips_ignored_files(source_tree):
+    """Assert listing files with git skips ignored files, and still applies the exclude."""
+    if shutil.which("git") is None:
+        pytest.skip("git is not installed")
+    subprocess.run(["git", "init", "-q", "."], check=True)
+    (source_tree / ".gitignore").write_text("sub/skip/\n")
+    patterns = _utils.discovery.parse_patterns("__pycache__,.venv,generated_*")
+
+    result = list(_utils.discovery.Discovery(patterns, respect_gitignore=True).files(["."]))
+
+    assert result == sorted(
+        os.path.join(".", *name.split("/"))
+        for name in ["a-b.py", "a.py", "a/b.py", "spam.py", "sub/eggs.py"]
+    )
+
+
+def test_discovery__respect_gitignore__outside_git__walks(source_tree, monkeypatch):
+    """Assert discovery falls back to walking the directories outside git repos."""
+    monkeypatch.setenv("GIT_CEILING_DIRECTORIES", str(source_tree.parent))
+    patterns = _utils.discovery.parse_patterns("__pycache__,.venv")
+
+    result = list(_utils.discovery.Discovery(patterns, respect_gitignore=True).files(["."]))
+
+    assert os.path.join(".", "sub", "skip", "ham.py") in result
+
+
+def test_git__changed_line_ranges__returns_changed_lines(tmp_path, chdir, git):
+    """Assert the changed lines are found, with removals marked by the line before them."""
+    chdir(tmp_path)
+    spam = tmp_path / "spam.py"
+    spam.write_text("".join(f"line_{index} = {index}\n" for index in range(1, 11)))
+    git("add", ".")
+    git("commit", "-q", "-m", "spam")
+    lines = spam.read_text().splitlines(keepends=True)
+    lines[1] = "changed = 2\n"
+    lines[4:6] = ["added = 5\n", "added = 6\n", "added = 6.5\n"]
+    del lines[9]  # line_9
+    spam.write_text("".join(lines))
+    (tmp_path / "eggs.py").write_text("x = 1\n")
+
+    result = _utils.git.changed_line_ranges("HEAD", spam)
+
+    assert result == [(2, 2), (5, 7), (9, 9)]
+    assert _utils.git.changed_line_ranges("HEAD", tmp_path / "eggs.py") is None
+
+
+@pytest.mark.parametrize(
+    "source,expected",
+    [
+        ('"""Docstring."""\nimport os\nimport sys\n\nx = 1\n', (2, 3, 5)),
+        ('"""Docstring."""\n\n\n@decorator\ndef spam():\n    pass\n', (0, 0, 4)),
+        ("import os\n...\nimport sys\n", (1, 1, 2)),
+    ],
+)
+def test_code_analysis__find_source_imports__skips_only_string_statements(source, expected):
+    """Assert docstrings before the imports are skipped, but other bare expressions are code."""
+    assert _utils.code_analysis.find_source_imports(source) == expected
+
+
+LINT_ERRORS = [
+    _utils.lint.LintError("b.py", 10, 1, "D100", "Missing docstring in public module"),
+    _utils.lint.LintError("a.py", 9, 5, "E501", "line too long (101 > 100 characters)"),
+    _utils.lint.LintError("b.py", 2, 1, "E501", "line too long (101 > 100 characters)"),
+    _utils.lint.LintError("a.py", 10, 1, "D100", "Missing docstring in public module"),
+]
+
+
+def test_lint_errors__iterates_errors_in_order():
+    """Assert the compact collection gives back the same errors, in the order they were added."""
+    errors = _utils.lint.LintErrors(LINT_ERRORS)
+
+    assert list(errors) == LINT_ERRORS
+    assert len(errors) == 4
+    assert errors[-1] == LINT_ERRORS[-1]
+    assert errors[1:3] == LINT_ERRORS[1:3]
+
+
+def test_lint_errors__groups_by_file_and_code():
+    """Assert the errors in each file (and with each code) are found in order."""
+    errors = _utils.lint.LintErrors(LINT_ERRORS)
+
+    assert errors.files == ["b.py", "a.py"]
+    assert errors.codes == ["D100", "E501"]
+    assert list(errors.in_file("a.py")) == [LINT_ERRORS[1], LINT_ERRORS[3]]
+    assert list(errors.with_code("E501")) == [LINT_ERRORS[1], LINT_ERRORS[2]]
+    assert list(errors.in_file("c.py")) == []
+    assert [(file, list(errors_in_file)) for file, errors_in_file in errors.by_file()] == [
+        ("b.py", [LINT_ERRORS[0], LINT_ERRORS[2]]),
+        ("a.py", [LINT_ERRORS[1], LINT_ERRORS[3]]),
+    ]
+
+
+def test_lint_errors__sorted__sorts_stably():
+    """Assert sorting gives a new collection in key order, keeping ties in their added order."""
+    errors = _utils.lint.LintErrors(LINT_ERRORS)
+
+    result = errors.sorted(key=lambda error: error.file)
+
+    assert list(result) == [LINT_ERRORS[1], LINT_ERRORS[3], LINT_ERRORS[0], LINT_ERRORS[2]]
+    assert list(errors) == LINT_ERRORS
+
+
+def test_trace__directory_removed__does_not_trace(tmp_path, monkeypatch):
+    """Assert a process started by a traced run which already finished doesn't trace."""
+    monkeypatch.setattr(_utils.trace, "_tracer", None)
+    monkeypatch.setenv(_utils.trace._TRACE_DIR_ENV_VAR, str(tmp_path / "removed"))
+
+    with _utils.trace.span("spam"):
+        pass
+
+    assert not _utils.trace.is_enabled()
+    assert _utils.trace._TRACE_DIR_ENV_VAR not in os.environ
+
+
+def test_trace__untraced_environment__omits_trace_directory(tmp_path, monkeypatch):
+    """Assert processes which outlive the run (e.g. the daemon) aren't given its trace directory."""
+    monkeypatch.setenv(_utils.trace._TRACE_DIR_ENV_VAR, str(tmp_path))
+
+    environment = _utils.trace.untraced_environment()
+
+    assert _utils.trace._TRACE_DIR_ENV_VAR not in environment
+    assert environment["PATH"] == os.environ["PATH"]